@@ -7,36 +7,123 @@ import pytz
 from datetime import datetime, timedelta
 import logging
 import json
+import argparse
 import asyncio
+import bisect
+import concurrent.futures
+import csv
+import functools
+import gc
+import gzip
+import hashlib
+import html
+import io
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import deque
 from requests.exceptions import Timeout, RequestException
+import clock
+import logstore
+import profiler
+import queries
 
 with open('config.json', 'r') as f:
     config = json.load(f)
 
 TOKEN = config['token']
 
+# Process split. "all" runs everything in one process. Alternatively one process runs with --role interactive and
+# handles the gateway and slash commands, and another runs with --role scheduler and runs the announcement, clearing
+# and backup tasks, talking to Discord over REST only. Both share the database and tell each other about changes
+# through Unix datagram sockets in notify_socket_dir. The scheduler also checks in every scheduler_poll_seconds in
+# case a notification was missed.
+BOT_ROLE = config.get('bot_role', 'all')
+NOTIFY_SOCKET_DIR = config.get('notify_socket_dir', '.')
+SCHEDULER_POLL_SECONDS = config.get('scheduler_poll_seconds', 60)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WaiverBot")
+    parser.add_argument("--role", choices=["all", "interactive", "scheduler"], default=BOT_ROLE,
+                        help="Run everything in one process, or only the slash commands or the scheduled tasks.")
+    BOT_ROLE = parser.parse_args().role
+
 # Create a logger object
 logger = logging.getLogger('discord_bot')
 logger.setLevel(logging.DEBUG)
 
-# Set up logging to a file
-file_handler = logging.FileHandler(filename='discord_bot.log', encoding='utf-8', mode='a')
-file_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(file_handler)
+# Log storage settings. The log file is rotated once it reaches either limit, and rotated segments are compressed and
+# indexed in log_dir for /searchlogs.
+LOG_FILE = config.get('log_file', 'discord_bot.log')
+LOG_DIR = config.get('log_dir', 'logs')
+LOG_ROTATE_MB = config.get('log_rotate_mb', 50)
+LOG_ROTATE_HOURS = config.get('log_rotate_hours', 24)
+LOG_BLOCK_KB = config.get('log_block_kb', 64)
 
-# Set up logging to the console
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(console_handler)
 
-# Discord bot setup
-intents = discord.Intents.default()
-client = discord.Client(case_insensitive=True, intents=intents)
-intents.message_content = True
-bot = commands.Bot(command_prefix='!', case_insensitive=True, ignore_extras=True, intents=intents)
+def log_location(role):
+    # The scheduler process keeps its own log and log index next to the interactive one
+    if role != "scheduler":
+        return LOG_FILE, LOG_DIR
+    base, extension = os.path.splitext(LOG_FILE)
+    return f"{base}_scheduler{extension}", os.path.join(LOG_DIR, "scheduler")
+
+
+log_formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s')
+
+# The bot's log file handler, once setup_logging() has run. Opening it can rotate the live log and starts the log
+# index threads, so it is only set up when the bot itself runs, never when a tool (replay_trace.py, simulate.py)
+# imports this module.
+file_handler = None
+
+
+def setup_logging():
+    global file_handler
+
+    # Set up logging to a file
+    file_handler = logstore.SegmentedLogHandler(*log_location(BOT_ROLE), max_bytes=LOG_ROTATE_MB * 1024 * 1024,
+                                                max_age_seconds=LOG_ROTATE_HOURS * 3600,
+                                                block_bytes=LOG_BLOCK_KB * 1024)
+    file_handler.setFormatter(log_formatter)
+    logger.addHandler(file_handler)
+
+    # Set up logging to the console
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(log_formatter)
+    logger.addHandler(console_handler)
+
 
-# Role and channel dictionaries
+if __name__ == "__main__":
+    setup_logging()
+
+# Discord bot setup
+LOW_MEMORY_PROFILE = config.get('low_memory_profile', False)
+MEMORY_REPORT_INTERVAL_MINUTES = config.get('memory_report_interval_minutes', 60)
+
+if LOW_MEMORY_PROFILE:
+    # Slash commands only need guild events. Interactions carry the invoking member and their roles, so no member
+    # or message events (and no caches for them) are needed.
+    intents = discord.Intents.none()
+    intents.guilds = True
+    bot = commands.Bot(command_prefix='!', case_insensitive=True, ignore_extras=True, intents=intents,
+                       member_cache_flags=discord.MemberCacheFlags.none(), max_messages=None,
+                       chunk_guilds_at_startup=False)
+else:
+    # Nothing looks members up in the cache, so don't request every guild's member list on connect; members are
+    # cached as they show up in events instead
+    intents = discord.Intents.default()
+    intents.message_content = True
+    bot = commands.Bot(command_prefix='!', case_insensitive=True, ignore_extras=True, intents=intents,
+                       chunk_guilds_at_startup=False)
+
+# Role and channel dictionaries. These are the defaults; a league config file replaces them (see load_league_config).
 ROLES_DICT = {
     "Rookie Mentor": 712163051586977893,
     "DSFLGM": 712152408943230977,
@@ -65,16 +152,203 @@ CHANNELS_DICT = {
     "announcement_channel": 712163701167226880,  # Replace with the actual channel ID
 }
 
+# Slash command registration is skipped on startup while the command tree matches the one last synced. A sync still
+# happens at least every command_sync_max_age_days, or straight away if the sync file is deleted.
+COMMAND_SYNC_FILE = config.get('command_sync_file', 'command_sync.json')
+COMMAND_SYNC_MAX_AGE_DAYS = config.get('command_sync_max_age_days', 7)
+
+# League configuration file with the roles, teams and channels, e.g.
+#   {"roles": {"Rookie Mentor": 123, "DSFLGM": 456}, "channels": {"announcement_channel": 789},
+#    "teams": {"BBB": {"name": "Bondi Beach Buccaneers", "role_id": "101"}, ...}}
+# A channel named after a team code with a _claims suffix (e.g. "BBB_claims") receives that team's claim digests.
+# Changes are picked up by /reloadconfig or when the file is modified, without restarting the bot.
+LEAGUE_CONFIG_PATH = config.get('league_config', 'league.json')
+LEAGUE_CONFIG_POLL_SECONDS = config.get('league_config_poll_seconds', 30)
+
+
+def build_league_dicts(league):
+    # Validate a league configuration and turn it into the role, team, team name and channel dictionaries
+    problems = []
+    roles = league.get("roles") or {}
+    for role in ("Rookie Mentor", "DSFLGM"):
+        if not str(roles.get(role, "")).isdigit():
+            problems.append(f"roles.{role} must be a role ID")
+
+    teams = league.get("teams") or {}
+    if not teams:
+        problems.append("teams must list at least one team")
+    team_for_role = {}
+    for code, team in teams.items():
+        if code != code.upper() or not code.isalnum():
+            problems.append(f"team code {code} must be upper case letters or digits")
+        if not isinstance(team, dict) or not team.get("name") or not str(team.get("role_id", "")).isdigit():
+            problems.append(f"teams.{code} needs a name and a role_id")
+        elif str(team["role_id"]) in team_for_role:
+            problems.append(f"teams.{code} has the same role_id as teams.{team_for_role[str(team['role_id'])]}")
+        else:
+            team_for_role[str(team["role_id"])] = code
+
+    channels = league.get("channels") or {}
+    if not str(channels.get("announcement_channel", "")).isdigit():
+        problems.append("channels.announcement_channel must be a channel ID")
+
+    if problems:
+        raise ValueError("Invalid league configuration: " + "; ".join(problems))
+
+    return ({name: int(role_id) for name, role_id in roles.items()},
+            {code: str(team["role_id"]) for code, team in teams.items()},
+            {code: team["name"] for code, team in teams.items()},
+            {name: int(channel_id) for name, channel_id in channels.items()})
+
+
+def load_league_config():
+    with open(LEAGUE_CONFIG_PATH, 'r') as league_file:
+        return build_league_dicts(json.load(league_file))
+
+
+league_config_state = {"mtime": None, "synced": False}
+if os.path.exists(LEAGUE_CONFIG_PATH):
+    league_config_state["mtime"] = os.path.getmtime(LEAGUE_CONFIG_PATH)
+    ROLES_DICT, TEAMS_DICT, TEAM_NAMES_DICT, CHANNELS_DICT = load_league_config()
+
 # SQLite3 Database Connection
 DB_PATH = "waiverbot.db"
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
 
 RETRY_COUNT = 3
 RETRY_DELAY = 5
 
-is_announcements_paused = False
-is_find_clearing_players_paused = False
+# Scheduled tasks /pause_tasks stops, by the name of their paused flag in the TaskState table
+SCHEDULED_TASKS = ("announcements", "clearing")
+
+# Announcement window, in the league's local time. A window ending at or before its start time closes the next day.
+ANNOUNCEMENT_TIMEZONE = config.get('announcement_timezone', 'US/Eastern')
+ANNOUNCEMENT_WINDOW_START = datetime.strptime(config.get('announcement_window_start', '17:00'), '%H:%M').time()
+ANNOUNCEMENT_WINDOW_END = datetime.strptime(config.get('announcement_window_end', '23:00'), '%H:%M').time()
+ANNOUNCEMENT_BLACKOUT_DATES = set(config.get('announcement_blackout_dates', []))  # YYYY-MM-DD, no window that day
+
+# Clock the waiver rules and their scheduled passes run on (see clock.py). "real" is the wall clock; for testing,
+# "accelerated" runs clock_speed times faster from clock_start (YYYY-MM-DD HH:MM:SS, default now) and "manual" only
+# moves when stepped, e.g. by simulate.py. Operational housekeeping (backups, maintenance, memory reports, the lag
+# watchdog and logging) stays on real time.
+CLOCK_MODE = config.get('clock_mode', 'real')
+CLOCK_SPEED = config.get('clock_speed', 60)
+CLOCK_START = config.get('clock_start')
+clock.configure(CLOCK_MODE, CLOCK_START, CLOCK_SPEED)
+
+# Announced players clear this long after their announcement, and the clearing pass checks for them this often
+CLEARING_PERIOD = timedelta(hours=config.get('clearing_period_hours', 24))
+CLEARING_PASS_SECONDS = config.get('clearing_pass_seconds', 60)
+
+# Claim intake queue settings. Claims beyond the depth limits are turned away straight away, and claims still queued
+# after the maximum wait are dropped, so callers get an answer well before their interaction expires.
+CLAIM_QUEUE_CONCURRENCY = config.get('claim_queue_concurrency', 2)
+CLAIM_QUEUE_MAX_DEPTH = config.get('claim_queue_max_depth', 40)
+CLAIM_QUEUE_MAX_PER_TEAM = config.get('claim_queue_max_per_team', 10)
+CLAIM_QUEUE_MAX_WAIT = config.get('claim_queue_max_wait_seconds', 120)
+
+# Scheduler lease (opt-in), for running a standby instance. Only the instance holding the lease runs the
+# announcement, clearing and backup passes; the others keep renewing their claim and take over once the holder has
+# missed heartbeats for scheduler_lease_ttl_seconds, so failover takes at most the TTL plus one heartbeat.
+SCHEDULER_LEASE_ENABLED = config.get('scheduler_lease_enabled', False)
+SCHEDULER_LEASE_TTL = config.get('scheduler_lease_ttl_seconds', 30)
+SCHEDULER_LEASE_HEARTBEAT = config.get('scheduler_lease_heartbeat_seconds', 10)
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Claim digests (opt-in): after each claim or clearing write, teams with a claims channel are sent their current
+# claims whenever the list has changed since the last digest
+CLAIM_DIGEST_ENABLED = config.get('claim_digest_enabled', False)
+
+# Writer settings. Writes arriving within the batch window are committed together in one transaction.
+WRITE_BATCH_WINDOW = config.get('write_batch_window_ms', 2) / 1000
+WRITE_BATCH_MAX = config.get('write_batch_max', 64)
+
+# Event loop lag watchdog settings (opt-in via config.json)
+LAG_WATCHDOG_ENABLED = config.get('lag_watchdog_enabled', False)
+LAG_WATCHDOG_INTERVAL = config.get('lag_watchdog_interval_ms', 100) / 1000
+LAG_WATCHDOG_THRESHOLD = config.get('lag_watchdog_threshold_ms', 500) / 1000
+LAG_WATCHDOG_TOP_N = config.get('lag_watchdog_top_n', 10)
+LAG_WATCHDOG_HISTORY = config.get('lag_watchdog_history', 500)
+
+# /memprofile settings. tracemalloc is only running between /memprofile start and stop.
+MEMPROFILE_FRAMES = config.get('memprofile_frames', 10)
+MEMPROFILE_TOP_N = config.get('memprofile_top_n', 25)
+
+# /profile settings. Nothing is sampled until /profile start arms a command or scheduled task.
+PROFILE_DIR = config.get('profile_dir', 'profiles')
+PROFILE_SAMPLE_INTERVAL = config.get('profile_sample_interval_ms', 1) / 1000
+PROFILE_TOP_N = config.get('profile_top_n', 15)
+profiler.configure(PROFILE_SAMPLE_INTERVAL, PROFILE_DIR, PROFILE_TOP_N)
+
+# Storage settings. Maintenance runs once a day at maintenance_hour, league time, unless an announcement window is open.
+DB_CACHE_SIZE_KIB = config.get('db_cache_size_kib', 16 * 1024)
+DB_MMAP_SIZE_MB = config.get('db_mmap_size_mb', 256)
+MAINTENANCE_ENABLED = config.get('maintenance_enabled', True)
+MAINTENANCE_HOUR = config.get('maintenance_hour', 4)
+queries.configure(DB_CACHE_SIZE_KIB, DB_MMAP_SIZE_MB * 1024 * 1024)
+
+# Static export (opt-in): when export_dir is set, waivers.json and index.html there are rewritten whenever the waiver
+# state changes, for a web server to serve as they are
+EXPORT_DIR = config.get('export_dir')
+EXPORT_POLL_SECONDS = config.get('export_poll_seconds', 5)
+EXPORT_RECENT_RESULTS = config.get('export_recent_results', 25)
+
+# Online backup settings
+BACKUP_ENABLED = config.get('backup_enabled', True)
+BACKUP_DIR = config.get('backup_dir', 'backups')
+BACKUP_INTERVAL_HOURS = config.get('backup_interval_hours', 6)
+BACKUP_KEEP = config.get('backup_keep', 14)
+BACKUP_PAGES_PER_STEP = config.get('backup_pages_per_step', 64)
+BACKUP_STEP_DELAY = config.get('backup_step_delay_ms', 5) / 1000
+
+lag_watchdog_lock = threading.Lock()
+lag_watchdog_state = {"thread": None, "loop_thread_id": None, "last_beat": 0.0, "captured": None, "labels": {}}
+lag_stalls = deque(maxlen=LAG_WATCHDOG_HISTORY)
+
+# The snapshot the next /memprofile diff is compared against
+memprofile_state = {"started": None, "previous": None}
+
+# Only one league config reload runs at a time
+league_config_lock = asyncio.Lock()
+
+# Set to run the announcement task early, e.g. when a player is entered during an open window
+announcement_wakeup = asyncio.Event()
+
+# Held by each scheduled task while a pass runs, so a restore can wait for the passes under way to finish
+scheduled_pass_locks = {task: asyncio.Lock() for task in SCHEDULED_TASKS}
+
+# Database version the static export was last written for, and a hash of what was written
+export_state = {"data_version": None, "hash": None}
+
+# Socket this process receives notifications from the other process on, when the roles are split, and the restores
+# waiting for the scheduler process to confirm it has stopped writing
+notify_state = {"socket": None, "quiesce": {}, "acknowledging": None}
+
+# Until when (Unix time) this instance may run scheduled passes, and who held the lease when last checked
+scheduler_lease_state = {"expires": 0.0, "holder": None}
+
+# Single writer: all database writes are queued for one writer task, which commits them on its own thread
+write_queue = asyncio.Queue()
+writer_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+writer_state = {"task": None, "batches": 0, "writes": 0, "largest_batch": 0}
+
+# Claim digests run in a task of their own (see queue_claim_digests)
+claim_digest_state = {"task": None, "due": False}
+
+# Claim intake queue: one FIFO queue per team, served round robin so a burst from one team can't hold up the others
+claim_queues = {}
+claim_queue_turns = deque()
+claim_queue_state = {"active": 0, "admitted": 0, "completed": 0, "shed_full": 0, "shed_waited": 0, "max_depth": 0}
+claim_queue_waits = deque(maxlen=500)
+
+# Player autocomplete index: player ID -> details for every player not yet claimed, and a sorted list of
+# (search key, player ID) pairs so a prefix lookup is a bisect instead of a table scan
+player_index = {}
+player_index_keys = []
+
+
+def league_channel(channel_id):
+    # The scheduler process has no gateway connection and so no channel cache, but can still send by channel ID
+    return bot.get_channel(channel_id) or bot.get_partial_messageable(channel_id)
 
 
 def split_string_into_chunks(s, chunk_size=2000):
@@ -95,6 +369,88 @@ def split_string_into_chunks(s, chunk_size=2000):
     return chunks
 
 
+def get_db_connection():
+    # Connections are kept open per thread so their prepared statement cache is reused between commands
+    return queries.connection(DB_PATH)
+
+
+async def read_snapshot(read):
+    # Runs read(conn) in a worker thread on a read-only connection. All of its queries see one consistent snapshot
+    # and never wait for a write in progress.
+    def run():
+        with queries.snapshot(DB_PATH) as conn:
+            return read(conn)
+
+    return await asyncio.to_thread(profiler.attributed(run))
+
+
+async def write_db(operation):
+    # Every change to the database goes through here. operation(conn) runs on the writer thread inside its own
+    # savepoint, and this returns its result or raises its error once the transaction it was batched into commits.
+    future = asyncio.get_running_loop().create_future()
+    write_queue.put_nowait((profiler.attributed(operation), future))
+    if writer_state["task"] is None or writer_state["task"].done():
+        writer_state["task"] = asyncio.create_task(writer_main())
+    return await future
+
+
+async def writer_main():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await write_queue.get()]
+
+        # Writes arriving within the batch window, or while the previous batch was committing, share one transaction
+        deadline = loop.time() + WRITE_BATCH_WINDOW
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(write_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                if loop.time() >= deadline:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(write_queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+        results = await loop.run_in_executor(writer_executor, run_write_batch, [operation for operation, _ in batch])
+        for (_, future), (result, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def run_write_batch(operations):
+    # Runs on the writer thread. A failing operation only rolls back its own savepoint; if the commit itself fails,
+    # every operation in the batch gets that error.
+    conn = get_db_connection()
+    started = time.perf_counter()
+    results = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for operation in operations:
+            conn.execute("SAVEPOINT operation")
+            try:
+                results.append((operation(conn), None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO operation")
+                results.append((None, e))
+            conn.execute("RELEASE operation")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error committing a batch of {len(operations)} writes: {e}")
+        return [(None, e)] * len(operations)
+
+    writer_state["batches"] += 1
+    writer_state["writes"] += len(operations)
+    writer_state["largest_batch"] = max(writer_state["largest_batch"], len(operations))
+    logger.debug(f"Committed {len(operations)} writes in one transaction in {time.perf_counter() - started:.3f}s")
+    return results
+
+
 def get_team_priority(team_name_or_id):
     try:
         # Try to get the priority using team name
@@ -110,73 +466,149 @@ def get_team_priority(team_name_or_id):
             return float('inf')  # Return a large value for priority if team not found. Should not be needed.
 
     # Now, fetch the priority using the role_id from the database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT Priority FROM Teams WHERE RoleID = ?", (role_id,))
-    result = cursor.fetchone()
-    conn.close()
+    result = queries.fetchone(get_db_connection(), "team_priority", (role_id,))
 
     if result:
-        return int(result[0])
+        return int(result["Priority"])
 
     logger.warning(f"Team with Role ID {role_id} not found in Teams database table. Returning default priority.")
     return float('inf')  # Return a large value for priority if the team is not found
 
 
-def adjust_team_priority(team_role):
+def adjust_team_priority(conn, team_role):
+    # Runs inside the caller's transaction, so the claim and the priority change are committed together
     logger.info(f"Starting to adjust priority for team {team_role}")
 
     role_id = TEAMS_DICT[team_role]
 
-    # Connect to the database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Fetch the current priority of the claiming team
-    cursor.execute("SELECT Priority FROM Teams WHERE RoleID = ?", (role_id,))
-    current_priority = cursor.fetchone()
-    if not current_priority:
+    # Move the claiming team to the bottom by giving it the next priority sequence value. No other team's row changes.
+    if not queries.execute(conn, "send_team_to_back", (role_id,)).rowcount:
         logger.error(f"Could not find team {team_role} with Role ID {role_id} in Teams database table")
         return
-    current_priority = int(current_priority[0])
 
-    # Get the maximum priority value
-    cursor.execute("SELECT MAX(Priority) FROM Teams")
-    max_priority = int(cursor.fetchone()[0])
+    # Keep the change in the priority history
+    queries.execute(conn, "record_priority_change", (clock.now().strftime('%Y-%m-%d %H:%M:%S'), "claim", role_id))
+
+    logger.info(f"Successfully adjusted priority for team {team_role}")
 
-    # Decrement the priority of all teams with priority greater than the claiming team and less than or equal to the max
-    cursor.execute("UPDATE Teams SET Priority = Priority - 1 WHERE Priority > ? AND Priority <= ?",
-                   (current_priority, max_priority))
 
-    # Increment the priority of the claiming team to the bottom (max)
-    cursor.execute("UPDATE Teams SET Priority = ? WHERE RoleID = ?", (max_priority, role_id))
+def holds_scheduler_lease():
+    # Checked at the start of every scheduled pass
+    return not SCHEDULER_LEASE_ENABLED or clock.timestamp() < scheduler_lease_state["expires"]
 
-    # Commit the changes
-    conn.commit()
-    conn.close()
 
-    logger.info(f"Successfully adjusted priority for team {team_role}")
+def check_scheduler_lease(conn):
+    # Runs inside the writes scheduled passes make, so an instance that has lost the lease part way through a pass
+    # can't award or announce a player the new holder is also handling
+    if not SCHEDULER_LEASE_ENABLED:
+        return
+    lease = queries.fetchone(conn, "scheduler_lease")
+    if lease["Holder"] != INSTANCE_ID or lease["Expires"] < clock.timestamp():
+        raise RuntimeError(f"{INSTANCE_ID} no longer holds the scheduler lease")
+
 
+def renew_scheduler_lease(conn):
+    # Runs on the writer
+    now = clock.timestamp()
+    lease = queries.fetchone(conn, "scheduler_lease")
+    renewed = queries.execute(conn, "renew_scheduler_lease", (INSTANCE_ID, now + SCHEDULER_LEASE_TTL, now, INSTANCE_ID,
+                                                              now, INSTANCE_ID, now)).rowcount
+    return bool(renewed), dict(lease)
 
-def send_announcement(player_row_index, playerid):
+
+async def sleep_between_passes(seconds):
+    # On a virtual clock the paced loops run back to back (see run_loops_on_clock) and wait out their interval here,
+    # on the clock, instead
+    if clock.is_virtual():
+        await clock.sleep(seconds)
+
+
+def run_loops_on_clock():
+    if clock.is_virtual():
+        for loop in (find_clearing_players, scheduler_lease_task):
+            loop.change_interval(seconds=0)
+
+
+@tasks.loop(seconds=SCHEDULER_LEASE_HEARTBEAT)
+async def scheduler_lease_task():
+    await renew_scheduler_lease_pass()
+    await sleep_between_passes(SCHEDULER_LEASE_HEARTBEAT)
+
+
+async def renew_scheduler_lease_pass():
+    started = clock.timestamp()
+    try:
+        renewed, previous = await write_db(renew_scheduler_lease)
+    except Exception as e:
+        # Keep running until the lease we already have runs out, then stand by
+        logger.error(f"Could not renew the scheduler lease: {e}")
+        return
+
+    held = holds_scheduler_lease()
+    if renewed:
+        scheduler_lease_state["expires"] = started + SCHEDULER_LEASE_TTL
+        scheduler_lease_state["holder"] = INSTANCE_ID
+        if not held:
+            if previous["Holder"] and previous["Holder"] != INSTANCE_ID:
+                logger.warning(f"Took over the scheduler lease from {previous['Holder']}, whose last heartbeat was "
+                               f"{started - previous['Heartbeat']:.1f}s ago. Running scheduled tasks.")
+            else:
+                logger.info(f"Acquired the scheduler lease as {INSTANCE_ID}. Running scheduled tasks.")
+            # Run an announcement pass straight away rather than when the announcement task next wakes up
+            announcement_wakeup.set()
+    else:
+        scheduler_lease_state["expires"] = 0.0
+        if held:
+            logger.warning(f"Lost the scheduler lease to {previous['Holder']}. Standing by.")
+        elif scheduler_lease_state["holder"] != previous["Holder"]:
+            logger.info(f"Standing by. The scheduler lease is held by {previous['Holder']} until "
+                        f"{datetime.fromtimestamp(previous['Expires']):%H:%M:%S}.")
+        scheduler_lease_state["holder"] = previous["Holder"]
+
+
+def announcement_window(day):
+    # Opening and closing time of the window on a local calendar date, or None if the date is blacked out.
+    # Localizing each date separately keeps the window on local time across daylight saving changes.
+    if day.isoformat() in ANNOUNCEMENT_BLACKOUT_DATES:
+        return None
+
+    league_timezone = pytz.timezone(ANNOUNCEMENT_TIMEZONE)
+    closing_day = day if ANNOUNCEMENT_WINDOW_END > ANNOUNCEMENT_WINDOW_START else day + timedelta(days=1)
+    opens = league_timezone.normalize(league_timezone.localize(datetime.combine(day, ANNOUNCEMENT_WINDOW_START)))
+    closes = league_timezone.normalize(league_timezone.localize(datetime.combine(closing_day, ANNOUNCEMENT_WINDOW_END)))
+    return opens, closes
+
+
+def current_announcement_window(now):
+    # A window that runs past midnight belongs to the day it opened
+    for day in (now.date() - timedelta(days=1), now.date()):
+        window = announcement_window(day)
+        if window and window[0] <= now < window[1]:
+            return window
+    return None
+
+
+def next_announcement_window(now):
+    for days_ahead in range(366):
+        window = announcement_window(now.date() + timedelta(days=days_ahead))
+        if window and window[0] > now:
+            return window
+    return None
+
+
+async def send_announcement(player_row_index, playerid):
+    # Prepares the announcement of one player. process_announcements stores the TimeClearing of every player it
+    # announces in one write.
     try:
         # Check if the current time is within the allowed announcement time window.
-        eastern = pytz.timezone('US/Eastern')
-        current_time = datetime.now(eastern)
-        if not (17 <= current_time.hour <= 22):  # Checking if the time is between 5pm and 10pm EST
+        if not current_announcement_window(clock.now(pytz.timezone(ANNOUNCEMENT_TIMEZONE))):
             logger.warning(f"Attempted to announce player {playerid} outside of allowed time window")
             return None, None
 
-        current_time = datetime.now()
-
-        # Connect to the database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        current_time = clock.now()
 
         # Fetch the necessary data from the Players table for the announcement message
-        cursor.execute("SELECT PlayerName, Position, PageURL FROM Players WHERE PlayerID = ?",
-                       (playerid,))
-        result = cursor.fetchone()
+        result = await read_snapshot(lambda conn: queries.fetchone(conn, "player_announcement_details", (playerid,)))
         if not result:
             logger.error(f"Player with ID {playerid} not found in Players database table")
             return None, None
@@ -186,17 +618,7 @@ def send_announcement(player_row_index, playerid):
         # Log the intended announcement
         logger.info(f"Prepared announcement for Player {PlayerName} ({player_position}) with ID {playerid}")
 
-        # Update the Players table
-        clearing_time = (current_time + timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute("""
-            UPDATE Players 
-            SET Status = 'Available', Announced = 'Y', TimeAnnounced = ?, TimeClearing = ? 
-            WHERE PlayerID = ?
-        """, (current_time.strftime('%Y-%m-%d %H:%M:%S'), clearing_time, playerid))
-
-        # Commit the changes
-        conn.commit()
-        conn.close()
+        clearing_time = (current_time + CLEARING_PERIOD).strftime('%Y-%m-%d %H:%M:%S')
 
         # Compose the message
         announcement_message = f"ID: {playerid} - {PlayerName} - {player_position} - {player_page}"
@@ -209,23 +631,22 @@ def send_announcement(player_row_index, playerid):
 
 async def handle_normal_claim(player_row, team_role, playerid, claim_order_pref=None):
     try:
-        # Connect to the database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Fetch the necessary data from the Players table
-        cursor.execute("SELECT PlayerName FROM Players WHERE PlayerID = ?", (playerid,))
-        PlayerName = cursor.fetchone()[0]
-
-        # Insert the claim data into the Claims table
-        claim_data = (playerid, TEAMS_DICT[team_role], PlayerName, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                      'normal', claim_order_pref)
-        cursor.execute("INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, ClaimOrderPreference) "
-                       "VALUES (?, ?, ?, ?, ?, ?)", claim_data)
-
-        # Commit the changes
-        conn.commit()
-        conn.close()
+        def lodge_claim(conn):
+            # Check again as part of the write, in case the player cleared or the team claimed them in the meantime
+            player = queries.fetchone(conn, "player_by_id", (playerid,))
+            if not player or player["Status"] not in ["Available", "Free Claim"]:
+                raise ValueError(f"Player with ID {playerid} is no longer available for claim.")
+            if queries.fetchone(conn, "count_team_claims_for_player", (playerid, TEAMS_DICT[team_role]))[0] > 0:
+                raise ValueError(f"You already have a claim for player with ID {playerid}.")
+
+            # Insert the claim data into the Claims table
+            claim_data = (playerid, TEAMS_DICT[team_role], player["PlayerName"],
+                          clock.now().strftime('%Y-%m-%d %H:%M:%S'), claim_order_pref)
+            queries.execute(conn, "insert_normal_claim", claim_data)
+
+        await write_db(lodge_claim)
+        refresh_player_index(playerid)
+        queue_claim_digests()
 
         # Log the successful claim
         logger.info(f"Team {team_role} has successfully lodged a normal claim for Player with ID {playerid}")
@@ -239,49 +660,42 @@ async def handle_quick_claim(player_row, team_role, playerid):
     try:
         logger.info(f"Initiating quick claim for Player with ID {playerid} by Team {team_role}")
 
-        # Check if the team is the highest priority
-        current_priority = get_team_priority(team_role)
-        logger.info(f"Retrieved priority {current_priority} for Team {team_role}")
-        if current_priority != 1:  # Assuming 1 is the highest priority
-            raise ValueError("Only the team with the highest priority can make a quick claim.")
-
-        # Connect to the database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Update the player's status to "Claimed"
-        cursor.execute("UPDATE Players SET Status = 'Claimed', Cleared = 'Y', Claimed = 'Y',"
-                       " SuccessfulTeamID = ? WHERE PlayerID = ?",
-                       (team_role, playerid))
-
-        # Fetch the player's name for the announcement message
-        cursor.execute("SELECT PlayerName FROM Players WHERE PlayerID = ?", (playerid,))
-        PlayerName = cursor.fetchone()[0]
-
-        # Add the successful quick claim to the Claims table
-        claim_data = (playerid, TEAMS_DICT[team_role], PlayerName, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                      'quick', 'Y')
-        cursor.execute("INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, Successful) VALUES"
-                       " (?, ?, ?, ?, ?, ?)",
-                       claim_data)
-
-        # Mark other claims for this player as unsuccessful in the Claims table
-        cursor.execute("""
-               UPDATE Claims 
-               SET Successful = 'N', Unsuccessful = 'Y'
-               WHERE PlayerID = ? AND TeamID != ?
-           """, (playerid, TEAMS_DICT[team_role]))
-
-        # Commit the changes
-        conn.commit()
-        conn.close()
+        def quick_claim(conn):
+            # Check if the team is the highest priority. This runs on the writer, so no other claim can change the
+            # priority order or the player between the check and the claim.
+            current_priority = get_team_priority(team_role)
+            logger.info(f"Retrieved priority {current_priority} for Team {team_role}")
+            if current_priority != 1:  # Assuming 1 is the highest priority
+                raise ValueError("Only the team with the highest priority can make a quick claim.")
 
-        # Get the role ID for the team
-        role_id = TEAMS_DICT[team_role]
+            if queries.fetchone(conn, "player_status", (playerid,))["Status"] not in ["Available", "Free Claim"]:
+                raise ValueError(f"Player with ID {playerid} is no longer available for claim.")
+
+            # Update the player's status to "Claimed"
+            queries.execute(conn, "mark_player_claimed", (team_role, playerid))
+
+            # Fetch the player's name for the announcement message
+            PlayerName = queries.fetchone(conn, "player_name", (playerid,))["PlayerName"]
+
+            # Add the successful quick claim to the Claims table
+            claim_data = (playerid, TEAMS_DICT[team_role], PlayerName, clock.now().strftime('%Y-%m-%d %H:%M:%S'))
+            queries.execute(conn, "insert_quick_claim", claim_data)
 
-        # Adjust the team's priority
-        adjust_team_priority(team_role)
+            # Mark other claims for this player as unsuccessful in the Claims table
+            queries.execute(conn, "mark_other_claims_unsuccessful", (playerid, TEAMS_DICT[team_role]))
+
+            # Adjust the team's priority
+            adjust_team_priority(conn, team_role)
+            return PlayerName
+
+        PlayerName = await write_db(quick_claim)
         logger.info(f"Adjusted priority for Team {team_role}")
+        refresh_player_index(playerid)
+        queue_claim_digests()
+        wake_announcement_task()
+
+        # Get the role ID for the team
+        role_id = TEAMS_DICT[team_role]
 
         # Create and return the announcement message using the role mention
         announcement_message = f"{PlayerName} with ID {playerid} has been quick claimed by <@&{role_id}>!"
@@ -295,36 +709,27 @@ async def handle_quick_claim(player_row, team_role, playerid):
 
 async def handle_free_claim(player_row, team_role, playerid):
     try:
-        # Connect to the database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Check if the player's status is "Free Claim"
-        cursor.execute("SELECT Status FROM Players WHERE PlayerID = ?", (playerid,))
-        current_status = cursor.fetchone()[0]
-        if current_status != "Free Claim":
-            raise ValueError(f"{team_role} attempted to free claim Player with ID {playerid} however this player is not"
-                             f" available for free claim.")
-
-        # Update the player's status to "Claimed"
-        cursor.execute("UPDATE Players SET Status = 'Claimed', Cleared = 'Y', Claimed = 'Y', SuccessfulTeamID = ? "
-                       "WHERE PlayerID = ?",
-                       (team_role, playerid))
-
-        # Fetch the player's name for the announcement message
-        cursor.execute("SELECT PlayerName FROM Players WHERE PlayerID = ?", (playerid,))
-        PlayerName = cursor.fetchone()[0]
-
-        # Add the claim to the Claims table
-        claim_data = (playerid, TEAMS_DICT[team_role], PlayerName, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'free',
-                      'free', 'Y')
-        cursor.execute("INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, ClaimOrderPreference, "
-                       "Successful) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                       claim_data)
-
-        # Commit the changes
-        conn.commit()
-        conn.close()
+        def free_claim(conn):
+            # Check if the player's status is "Free Claim"
+            current_status = queries.fetchone(conn, "player_status", (playerid,))["Status"]
+            if current_status != "Free Claim":
+                raise ValueError(f"{team_role} attempted to free claim Player with ID {playerid} however this player is"
+                                 f" not available for free claim.")
+
+            # Update the player's status to "Claimed"
+            queries.execute(conn, "mark_player_claimed", (team_role, playerid))
+
+            # Fetch the player's name for the announcement message
+            PlayerName = queries.fetchone(conn, "player_name", (playerid,))["PlayerName"]
+
+            # Add the claim to the Claims table
+            claim_data = (playerid, TEAMS_DICT[team_role], PlayerName, clock.now().strftime('%Y-%m-%d %H:%M:%S'))
+            queries.execute(conn, "insert_free_claim", claim_data)
+            return PlayerName
+
+        PlayerName = await write_db(free_claim)
+        refresh_player_index(playerid)
+        queue_claim_digests()
 
         # Get the role ID for the team
         role_id = TEAMS_DICT[team_role]
@@ -333,7 +738,7 @@ async def handle_free_claim(player_row, team_role, playerid):
         announcement_message = f"{PlayerName} with ID {playerid} has been free claimed by <@&{role_id}>!"
 
         # Send the announcement message to the central channel
-        central_channel = bot.get_channel(CHANNELS_DICT["announcement_channel"])
+        central_channel = league_channel(CHANNELS_DICT["announcement_channel"])
         await central_channel.send(announcement_message)
 
         return announcement_message
@@ -344,97 +749,79 @@ async def handle_free_claim(player_row, team_role, playerid):
 
 
 async def process_clearing_claims(clearing_claims, clearing_players):
+    # Awards at most one player. Returns True when it did, so the caller can look for the next one straight away.
     try:
         logger.info("Starting the processing of clearing claims...")
 
-        # Connect to the database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
         if not clearing_claims:
             logger.warning("No clearing claims to process. Exiting.")
             return
 
         # Check if there are players in the clearing_players list who are still available
-        available_players = [player for _, player in clearing_players if player[5] == "Available"]
+        available_players = [player for _, player in clearing_players if player["Status"] == "Available"]
 
         if not available_players:
             logger.info("No more players to clear. Exiting process.")
             return
 
-        logger.info(f"Clearing Claims before sorting: {clearing_claims}")
+        logger.info(f"Clearing Claims before sorting: {[dict(claim) for claim in clearing_claims]}")
 
-        sorted_claims = sorted(clearing_claims,
-                               key=lambda x: (get_team_priority(x[2]), int(x[-3])))
-        logger.info(f"Sorted clearing claims by priority: {sorted_claims}")
+        # Rank every team from one read of the priority order rather than a lookup per claim
+        team_ranks = {team["RoleID"]: rank for rank, team in
+                      enumerate(queries.fetchall(get_db_connection(), "teams_by_priority"), start=1)}
+        sorted_claims = sorted(clearing_claims, key=lambda x: (team_ranks.get(str(x["TeamID"]), float('inf')),
+                                                               int(x["ClaimOrderPreference"])))
+        logger.info(f"Sorted clearing claims by priority: {[dict(claim) for claim in sorted_claims]}")
 
         top_claim = sorted_claims.pop(0)
-        logger.info(f"Processing top claim for Player with ID {top_claim[0]} by team {str(top_claim[2])}.")
+        top_team_id = str(top_claim["TeamID"])
+        logger.info(f"Processing top claim for Player with ID {top_claim['PlayerID']} by team {top_team_id}.")
 
-        playerid = top_claim[1]
-        player_tuple = next((player_tuple for player_tuple in clearing_players if player_tuple[1][0] == playerid),
-                            None)
+        playerid = top_claim["PlayerID"]
+        player_tuple = next((player_tuple for player_tuple in clearing_players
+                             if player_tuple[1]["PlayerID"] == playerid), None)
         if player_tuple is None:
             logger.warning(f"Player with ID {playerid} not found in clearing_players list.")
             return
-        elif player_tuple[1][5] != "Available":
-            logger.warning(f"Player with ID {playerid} has status {player_tuple[1][5]}.")
+        elif player_tuple[1]["Status"] != "Available":
+            logger.warning(f"Player with ID {playerid} has status {player_tuple[1]['Status']}.")
             return
 
         idx, player = player_tuple
         clearing_players.remove(player_tuple)
 
-        team_abbreviation = next((team for team, role_id in TEAMS_DICT.items() if role_id == str(top_claim[2])), None)
+        team_abbreviation = next((team for team, role_id in TEAMS_DICT.items() if role_id == top_team_id), None)
         if not team_abbreviation:
-            logger.error(f"Couldn't find team abbreviation for Role ID {top_claim[2]}.")
+            logger.error(f"Couldn't find team abbreviation for Role ID {top_team_id}.")
             return
 
-        # Update player's status to "Claimed" in the Players table
-        cursor.execute("""
-               UPDATE Players 
-               SET Status = 'Claimed', Cleared = 'Y', Claimed = 'Y', SuccessfulTeamID = ? 
-               WHERE PlayerID = ?
-           """, (team_abbreviation, playerid))
-
-        # Mark the successful claim in the Claims table
-        cursor.execute("""
-               UPDATE Claims 
-               SET Successful = 'Y', Unsuccessful = 'N'
-               WHERE PlayerID = ? AND TeamID = ?
-           """, (playerid, top_claim[2]))
-
-        # Mark other claims as unsuccessful in the Claims table
-        cursor.execute("""
-               UPDATE Claims 
-               SET Successful = 'N', Unsuccessful = 'Y'
-               WHERE PlayerID = ? AND TeamID != ?
-           """, (playerid, top_claim[2]))
+        def award_claim(conn):
+            check_scheduler_lease(conn)
 
-        conn.commit()
+            # Update player's status to "Claimed" in the Players table
+            queries.execute(conn, "mark_player_claimed", (team_abbreviation, playerid))
 
-        announcement_channel = bot.get_channel(CHANNELS_DICT["announcement_channel"])
-        await announcement_channel.send(
-            f"{player[1]} with ID: {playerid} has been claimed by <@&{top_claim[2]}>!")
-        logger.info(f"Processed claim for {player[1]} with ID {playerid} by team {str(top_claim[2])}")
+            # Mark the successful claim in the Claims table
+            queries.execute(conn, "mark_claim_successful", (playerid, top_claim["TeamID"]))
 
-        team_name = next((team for team, role_id in TEAMS_DICT.items() if role_id == str(top_claim[2])), None)
-        if team_name:
-            adjust_team_priority(team_name)
-        else:
-            logger.warning(f"Couldn't find team name for Role ID {top_claim[2]}. Skipping priority adjustment.")
+            # Mark other claims as unsuccessful in the Claims table
+            queries.execute(conn, "mark_other_claims_unsuccessful", (playerid, top_claim["TeamID"]))
 
-        conn.close()
-        logger.info("Finished processing clearing claims.")
+            # Send the claiming team to the back of the priority order
+            adjust_team_priority(conn, team_abbreviation)
 
-        # Reinvoke the find_clearing_players task (wait 3 seconds to avoid rate limiting)
-        async def delayed_start():
-            await asyncio.sleep(3)
-            if find_clearing_players.is_running():
-                find_clearing_players.restart()
-            else:
-                find_clearing_players.start()
+        await write_db(award_claim)
+        refresh_player_index(playerid)
+        queue_claim_digests()
+        wake_announcement_task()
 
-        asyncio.create_task(delayed_start())
+        announcement_channel = league_channel(CHANNELS_DICT["announcement_channel"])
+        await announcement_channel.send(
+            f"{player['PlayerName']} with ID: {playerid} has been claimed by <@&{top_team_id}>!")
+        logger.info(f"Processed claim for {player['PlayerName']} with ID {playerid} by team {top_team_id}")
+
+        logger.info("Finished processing clearing claims.")
+        return True
 
     except Exception as e:
         logger.error(f"Error in process_clearing_claims: {e}")
@@ -445,62 +832,149 @@ async def process_announcements():
     try:
         logger.info("Fetching players from the database...")
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        def read_players(conn):
+            return (queries.fetchone(conn, "count_available_players")[0],
+                    queries.fetchall(conn, "players_to_announce"))
+
+        available_count, player_rows = await read_snapshot(read_players)
 
         # Check if there are players marked as "Available" in their status.
-        cursor.execute("SELECT COUNT(*) FROM Players WHERE Status = 'Available'")
-        available_count = cursor.fetchone()[0]
         if available_count > 0:
             logger.warning("Attempted to announce players while there are players with status 'Available'")
-            conn.close()
             return
 
-        cursor.execute("SELECT * FROM Players WHERE Announced = 'N' OR Announced = '1'")
-        player_rows = cursor.fetchall()
-
         logger.info(f"Fetched {len(player_rows)} player rows from the database.")
 
         players_to_announce = []
-        cells_to_update = []
+        clearing_times = []
+        announced_rows = []
 
         logger.info("Iterating over the rows to find players that need to be announced...")
-        for row in player_rows:
-            player_id = row[0]  # assuming PlayerID is the first column in your Players table
-            announcement_message, clearing_time = send_announcement(row, player_id)
+        time_announced = clock.now().strftime('%Y-%m-%d %H:%M:%S')
+        announcements = await asyncio.gather(*[send_announcement(row, row["PlayerID"]) for row in player_rows])
+        for row, (announcement_message, clearing_time) in zip(player_rows, announcements):
             if announcement_message and clearing_time:  # Check if they're not None
                 players_to_announce.append(announcement_message)
-                cells_to_update.append({"column": "TimeClearing", "value": clearing_time, "row_id": player_id})
+                clearing_times.append(clearing_time)
+                announced_rows.append((time_announced, clearing_time, row["PlayerID"]))
 
-        # Batch update all cells
-        if cells_to_update:
-            for cell in cells_to_update:
-                cursor.execute(f"UPDATE Players SET {cell['column']} = ? WHERE PlayerID = ?",
-                               (cell['value'], cell['row_id']))
-            conn.commit()
+        if announced_rows:
+            # Every announced player is updated in one transaction, so the announcement is stored whole or not at all
+            def announce_players(conn):
+                check_scheduler_lease(conn)
+                queries.executemany(conn, "announce_player", announced_rows)
+
+            await write_db(announce_players)
+            for _, _, playerid in announced_rows:
+                refresh_player_index(playerid)
 
         if players_to_announce:
             gm_role_mention = f"<@&{ROLES_DICT['DSFLGM']}>"
-            earliest_clearing_time = min([cell['value'] for cell in cells_to_update if cell['column'] == "TimeClearing"])
+            earliest_clearing_time = min(clearing_times)
             timestamp = datetime.strptime(earliest_clearing_time, '%Y-%m-%d %H:%M:%S').timestamp()
             combined_message = (f"{gm_role_mention}\nThe following waivers are now available to claim and clear on "
                                 f"<t:{int(timestamp)}:F>:\n\n") + "\n".join(players_to_announce)
             logger.info("Sending announcement message...")
-            announcement_channel = bot.get_channel(CHANNELS_DICT["announcement_channel"])
+            announcement_channel = league_channel(CHANNELS_DICT["announcement_channel"])
             await announcement_channel.send(combined_message)
             logger.info("Announcement message sent successfully!")
         else:
             logger.info("No players to be announced in this iteration.")
 
-        conn.close()
-
     except Exception as e:
         logger.error(f"Error in process_announcements: {e}")
         raise e
 
 
-@tasks.loop(minutes=10)
-async def announcement_task():
+def claim_digest_hash(claims):
+    return hashlib.sha256(repr([tuple(claim) for claim in claims]).encode('utf-8')).hexdigest()
+
+
+async def send_claim_digests():
+    if not CLAIM_DIGEST_ENABLED:
+        return
+
+    try:
+        def read_claims(conn):
+            return (queries.fetchall(conn, "uncleared_claims_by_team"),
+                    dict(queries.fetchall(conn, "claim_digest_hashes")))
+
+        claim_rows, sent_hashes = await read_snapshot(read_claims)
+        team_claims = {}
+        for claim in claim_rows:
+            team_claims.setdefault(str(claim["TeamID"]), []).append(claim[1:])
+
+        # A team that was never sent a digest has nothing to hear about until it lodges a claim
+        empty_hash = claim_digest_hash([])
+        for team_code, team_id in TEAMS_DICT.items():
+            channel_id = CHANNELS_DICT.get(f"{team_code}_claims")
+            claims = team_claims.get(team_id, [])
+            digest_hash = claim_digest_hash(claims)
+            if channel_id is None or digest_hash == sent_hashes.get(team_id, empty_hash):
+                continue
+
+            channel = league_channel(channel_id)
+            response = (f"**Current claims by {team_code} for uncleared players "
+                        f"(sorted by claim order preference):**\n\n")
+            for player_id, claim_type, preference_order, name, position in claims:
+                response += f"{preference_order} - **{name}** - {position} - ID: {player_id} \n\n"
+            if not claims:
+                response += "No active claims."
+
+            try:
+                for chunk in split_string_into_chunks(response):
+                    await channel.send(embed=Embed(description=chunk, color=0x1D8348))
+            except Exception as e:
+                logger.error(f"Error sending the claim digest to team {team_code}: {e}")
+                continue
+
+            # Recorded as soon as the digest is out, so a failure later in the round can't send it again
+            sent = (team_id, digest_hash, clock.now().strftime('%Y-%m-%d %H:%M:%S'))
+            await write_db(lambda conn, sent=sent: queries.execute(conn, "set_claim_digest_hash", sent))
+            logger.info(f"Sent a claim digest with {len(claims)} claims to team {team_code}")
+    except Exception as e:
+        logger.error(f"Error sending claim digests: {e}")
+
+
+def queue_claim_digests():
+    # Called after every write that changes claims or clears a player. The digests go out from their own task rather
+    # than the pass or command that made the write, so a restart of the clearing loop can't cancel them between the
+    # sends and recording what was sent. Writes made while digests are going out queue one more round.
+    if not CLAIM_DIGEST_ENABLED:
+        return
+    claim_digest_state["due"] = True
+    if claim_digest_state["task"] is None or claim_digest_state["task"].done():
+        claim_digest_state["task"] = asyncio.create_task(claim_digest_main())
+
+
+async def claim_digest_main():
+    while claim_digest_state["due"]:
+        claim_digest_state["due"] = False
+        await send_claim_digests()
+
+
+def wake_announcement_task():
+    # Called whenever a player is entered or leaves the Available list, which may let pending players be announced
+    if BOT_ROLE == "interactive":
+        notify_peer("wake")
+    else:
+        announcement_wakeup.set()
+
+
+async def wait_for_announcement_wakeup(seconds):
+    if BOT_ROLE == "scheduler":
+        seconds = min(seconds, SCHEDULER_POLL_SECONDS)
+    await clock.wait(announcement_wakeup, seconds)
+    announcement_wakeup.clear()
+
+
+async def run_announcement_pass():
+    async with scheduled_pass_locks["announcements"]:
+        if holds_scheduler_lease() and not task_paused("announcements"):
+            await announcement_pass()
+
+
+async def announcement_pass():
     for _ in range(RETRY_COUNT):
         try:
             logger.info("Starting announcement_task loop...")
@@ -515,93 +989,1169 @@ async def announcement_task():
             break  # Exit the retry loop on unexpected errors
 
 
+# Runs again as soon as each pass returns. Rather than polling, every pass sleeps until the next window opens or,
+# while a window is open, until a player is entered or cleared or the window closes.
+@tasks.loop(seconds=0)
+async def announcement_task():
+    league_timezone = pytz.timezone(ANNOUNCEMENT_TIMEZONE)
+    now = clock.now(league_timezone)
+    window = current_announcement_window(now)
+
+    if window is None:
+        next_window = next_announcement_window(now)
+        if next_window is None:
+            logger.warning("No announcement window in the next year. Check announcement_blackout_dates.")
+            await wait_for_announcement_wakeup(24 * 60 * 60)
+            return
+        logger.info(f"Next announcement window opens at {next_window[0]:%Y-%m-%d %H:%M %Z}")
+        await wait_for_announcement_wakeup((next_window[0] - now).total_seconds())
+        return
+
+    await run_announcement_pass()
+    await wait_for_announcement_wakeup((window[1] - clock.now(league_timezone)).total_seconds())
+
+
 # Loop to check for cleared players
-@tasks.loop(minutes=1)
+@tasks.loop(seconds=CLEARING_PASS_SECONDS)
 async def find_clearing_players():
+    # After an award, run the next pass 3 seconds later (to avoid rate limiting) rather than at the next interval. The
+    # wait is on the clock, in this task, so a simulated clock runs the follow-up pass at its simulated time too.
+    while await run_clearing_pass():
+        await clock.sleep(3)
+    await sleep_between_passes(CLEARING_PASS_SECONDS)
+
+
+async def run_clearing_pass():
+    # Returns True when a player was awarded
+    async with scheduled_pass_locks["clearing"]:
+        if not holds_scheduler_lease() or task_paused("clearing"):
+            return False
+        return await clearing_pass()
+
+
+async def clearing_pass():
     for retry in range(RETRY_COUNT):
         try:
             logger.info("Starting find_clearing_players loop...")
-            current_time = datetime.now()
+            current_time = clock.now()
 
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
+            conn = get_db_connection()
 
-            cursor.execute("SELECT * FROM Players")
-            player_rows = cursor.fetchall()
-            cursor.execute("SELECT * FROM Claims")
-            claim_rows = cursor.fetchall()
+            player_rows = queries.fetchall(conn, "all_players")
+            claim_rows = queries.fetchall(conn, "all_claims")
 
             logger.info(f"Fetched {len(player_rows)} player rows and {len(claim_rows)} claim rows from the database.")
 
             clearing_players = []
             for idx, player in enumerate(player_rows):
-                if player[8]:  # If the Claimed column is not empty
+                if player["Claimed"]:  # If the Claimed column is not empty
                     continue
 
-                if player[9] is not None:  # Checking TimeClearing column
+                if player["TimeClearing"] is not None:
                     try:
-                        player_time = datetime.strptime(player[9], '%Y-%m-%d %H:%M:%S')
+                        player_time = datetime.strptime(player["TimeClearing"], '%Y-%m-%d %H:%M:%S')
                         if player_time <= current_time:
                             clearing_players.append((idx, player))
                     except ValueError:
-                        logger.error(
-                            f"Error parsing time for player with PlayerID {player[0]}. Value encountered: {player[9]}")
+                        logger.error(f"Error parsing time for player with PlayerID {player['PlayerID']}. "
+                                     f"Value encountered: {player['TimeClearing']}")
                 else:
-                    logger.warning(f"Clearing time is None for player with PlayerID {player[0]}. Skipping...")
+                    logger.warning(f"Clearing time is None for player with PlayerID {player['PlayerID']}. Skipping...")
 
             clearing_claims = [claim for claim in claim_rows if
-                               claim[1] in [player[0] for _, player in clearing_players]]
+                               claim["PlayerID"] in [player["PlayerID"] for _, player in clearing_players]]
             logger.info(f"Identified {len(clearing_claims)} clearing claims to process.")
 
-            # Check for players without claims and set them to "Free Claim"
-            for _, player in clearing_players:
-                player_id = player[0]
-                matching_claims = [claim for claim in claim_rows if claim[1] == player_id]
+            # Check for players without claims and set them to "Free Claim"
+            for _, player in clearing_players:
+                player_id = player["PlayerID"]
+                matching_claims = [claim for claim in claim_rows if claim["PlayerID"] == player_id]
+
+                if not matching_claims and player["Status"] != "Free Claim":
+                    # Player has no claims, set to "Free Claim"
+                    logger.info(
+                        f"Attempting to set Player with ID {player_id} to Free Claim.")
+                    def mark_free_claim(conn):
+                        check_scheduler_lease(conn)
+                        queries.execute(conn, "mark_player_free_claim", (player_id,))
+
+                    await write_db(mark_free_claim)
+                    refresh_player_index(player_id)
+                    queue_claim_digests()
+                    wake_announcement_task()
+
+                    announcement_channel = league_channel(CHANNELS_DICT["announcement_channel"])
+                    await announcement_channel.send(f"<@&{ROLES_DICT['DSFLGM']}> {player['PlayerName']} with ID "
+                                                    f"{player_id} is now available for Free Claim!")
+                    logger.info(f"Set Player with ID {player_id} as Free Claim")
+                else:
+                    logger.info(
+                        f"Skipping Player with ID {player_id} for Free Claim. Claims found: {len(matching_claims)},"
+                        f" Current Status: {player['Status']}")
+
+            awarded = False
+            if clearing_claims:
+                awarded = await process_clearing_claims(clearing_claims, clearing_players)
+
+            logger.info("Finished find_clearing_players loop.")
+            return bool(awarded)
+        except (Timeout, RequestException) as e:
+            logger.warning(f"Database connection error on attempt {retry + 1}/{RETRY_COUNT}: {e}")
+            if retry < RETRY_COUNT - 1:  # Check if this is the last retry
+                logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+                await asyncio.sleep(RETRY_DELAY)
+            else:
+                logger.error("All retry attempts exhausted. Moving on.")
+        except Exception as e:
+            logger.error(f"Unexpected error in find_clearing_players: {e}")
+            break  # Exit the retry loop on unexpected errors
+    return False
+
+
+def list_backups():
+    # Newest first. Timestamps in the filenames sort chronologically.
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = [name for name in os.listdir(BACKUP_DIR) if name.startswith("waiverbot-") and name.endswith(".db.gz")]
+    return sorted(backups, reverse=True)
+
+
+def create_backup(label="scheduled"):
+    # Runs in a worker thread. The online backup API copies a few pages at a time, pausing between steps so commands
+    # keep getting the database, and restarts by itself if a commit lands mid-copy.
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    snapshot_path = os.path.join(BACKUP_DIR, f"waiverbot-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{label}.db")
+
+    source = queries.connect(DB_PATH)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP,
+                      progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_DELAY))
+    finally:
+        target.close()
+        source.close()
+
+    # Compress the snapshot and drop the oldest ones beyond the retention count
+    with open(snapshot_path, 'rb') as snapshot_file, gzip.open(snapshot_path + ".gz", 'wb') as compressed_file:
+        shutil.copyfileobj(snapshot_file, compressed_file)
+    raw_size = os.path.getsize(snapshot_path)
+    os.remove(snapshot_path)
+
+    for old_backup in list_backups()[BACKUP_KEEP:]:
+        os.remove(os.path.join(BACKUP_DIR, old_backup))
+
+    return snapshot_path + ".gz", raw_size, os.path.getsize(snapshot_path + ".gz")
+
+
+def verify_backup(backup_name):
+    # Decompress a snapshot to a temporary file and make sure it is a healthy waiver database
+    backup_path = os.path.join(BACKUP_DIR, os.path.basename(backup_name))
+    if not os.path.exists(backup_path):
+        raise ValueError(f"Backup {backup_name} does not exist.")
+
+    with tempfile.NamedTemporaryFile(prefix="waiverbot-restore-", suffix=".db", delete=False) as restore_file:
+        restore_path = restore_file.name
+
+    conn = None
+    try:
+        with gzip.open(backup_path, 'rb') as compressed_file, open(restore_path, 'wb') as restore_file:
+            shutil.copyfileobj(compressed_file, restore_file)
+
+        conn = sqlite3.connect(restore_path)
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if integrity != "ok":
+            raise ValueError(f"Backup {backup_name} failed the integrity check: {integrity}")
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("Players", "Claims", "Teams")}
+    except (OSError, EOFError, sqlite3.DatabaseError, ValueError) as e:
+        if conn:
+            conn.close()
+        os.remove(restore_path)
+        if isinstance(e, ValueError):
+            raise
+        raise ValueError(f"Backup {backup_name} is not a valid waiver database: {e}")
+    conn.close()
+
+    return restore_path, counts
+
+
+def restore_backup(restore_path):
+    # Runs on the writer thread (see restore_quiesced). Copy the verified snapshot over the live database through the
+    # backup API, so open connections see the restored data without the file being swapped underneath them.
+    source = sqlite3.connect(restore_path)
+    try:
+        source.backup(get_db_connection())
+    finally:
+        source.close()
+        os.remove(restore_path)
+
+
+# Longest a restore keeps the scheduler lease if this instance stops before handing it back
+RESTORE_LEASE_SECONDS = 600
+
+# Longest a restore from the interactive process waits for the scheduler process to confirm it has stopped writing
+RESTORE_QUIESCE_SECONDS = 60
+
+
+def take_scheduler_lease(conn):
+    # Runs on the writer
+    if SCHEDULER_LEASE_ENABLED:
+        now = clock.timestamp()
+        queries.execute(conn, "take_scheduler_lease", (INSTANCE_ID, now + RESTORE_LEASE_SECONDS, now, now))
+
+
+def release_scheduler_lease(conn):
+    # Runs on the writer
+    if SCHEDULER_LEASE_ENABLED:
+        queries.execute(conn, "release_scheduler_lease", (INSTANCE_ID,))
+
+
+async def finish_scheduled_passes():
+    # Called with the tasks paused, so no new pass starts. Waits for the passes under way to finish, then for the
+    # writer to drain: writes are committed in the order they are queued.
+    for lock in scheduled_pass_locks.values():
+        async with lock:
+            pass
+    await write_db(lambda conn: None)
+
+
+async def acknowledge_quiesce(token):
+    # Runs in the scheduler process when the interactive process is about to restore a backup
+    try:
+        await finish_scheduled_passes()
+    except Exception as e:
+        logger.error(f"Could not finish the scheduled passes before a restore: {e}")
+        return
+    notify_peer(f"quiesced {token}")
+
+
+async def quiesce_scheduler_process():
+    # The scheduler process confirms it has finished its passes under way before anything is copied. If nothing is
+    # listening on its socket it isn't running, and catches up from the database when it starts.
+    if notify_state["socket"] is None:
+        if SCHEDULER_LEASE_ENABLED:
+            # The lease taken for the restore stops any pass under way there at its next write
+            return
+        raise RuntimeError("Can't reach the scheduler process to make sure it has stopped writing. Stop it, or "
+                           "enable the scheduler lease, before restoring.")
+
+    token = os.urandom(8).hex()
+    acknowledged = asyncio.get_running_loop().create_future()
+    notify_state["quiesce"][token] = acknowledged
+    try:
+        try:
+            notify_state["socket"].sendto(f"quiesce {token}".encode('utf-8'), notify_socket_path("scheduler"))
+        except (FileNotFoundError, ConnectionRefusedError):
+            logger.info("The scheduler process isn't running, so there are no scheduled passes to wait for.")
+            return
+        await asyncio.wait_for(acknowledged, RESTORE_QUIESCE_SECONDS)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"The scheduler process didn't confirm within {RESTORE_QUIESCE_SECONDS} seconds that it "
+                           f"had stopped writing, so nothing was restored.")
+    finally:
+        notify_state["quiesce"].pop(token, None)
+
+
+async def restore_quiesced(restore_path):
+    # Nothing may write while the backup is copied over the live database. The scheduled tasks are paused, and the
+    # passes already under way finish first, here and in the scheduler process when the roles are split. This
+    # instance also takes the scheduler lease so a standby instance stops too. The copy runs on the writer thread once
+    # every write queued before it has committed.
+    was_paused = await read_snapshot(paused_tasks)
+    await set_paused_tasks(set(SCHEDULED_TASKS))
+    try:
+        try:
+            await write_db(take_scheduler_lease)
+            if BOT_ROLE == "interactive":
+                await quiesce_scheduler_process()
+            await finish_scheduled_passes()
+        except Exception:
+            os.remove(restore_path)
+            raise
+        await asyncio.get_running_loop().run_in_executor(writer_executor, restore_backup, restore_path)
+        # The restored copy may predate a schema change or use a different journal mode
+        queries.prepare(DB_PATH, force=True)
+        rebuild_player_index()
+        if BOT_ROLE == "interactive":
+            notify_peer("restored")
+        else:
+            wake_announcement_task()
+    finally:
+        try:
+            await write_db(release_scheduler_lease)
+        except Exception as e:
+            logger.error(f"Could not release the scheduler lease after a restore: {e}")
+        # The restored copy has the paused flags of its own time, so each is put back as it was before the restore
+        try:
+            await set_paused_tasks(was_paused)
+        except Exception as e:
+            logger.error(f"Could not reset the paused tasks after a restore: {e}")
+
+
+async def run_backup(label="scheduled"):
+    logger.info(f"Starting {label} backup of {DB_PATH}...")
+    started = time.perf_counter()
+    backup_path, raw_size, compressed_size = await asyncio.to_thread(create_backup, label)
+    logger.info(f"Backed up {DB_PATH} to {backup_path} in {time.perf_counter() - started:.2f}s "
+                f"({raw_size} bytes, {compressed_size} bytes compressed)")
+    return backup_path
+
+
+@tasks.loop(hours=BACKUP_INTERVAL_HOURS)
+async def backup_task():
+    if not holds_scheduler_lease():
+        return
+
+    try:
+        await run_backup()
+    except Exception as e:
+        logger.error(f"Unexpected error in backup_task: {e}")
+
+
+def read_waiver_state(conn):
+    team_codes_by_role = {role_id: code for code, role_id in TEAMS_DICT.items()}
+    return {
+        "priority": [{"rank": rank, "team": team_codes_by_role.get(str(team["RoleID"])), "name": team["Name"]}
+                     for rank, team in enumerate(queries.fetchall(conn, "teams_by_priority"), start=1)],
+        "available": [{"id": player["PlayerID"], "name": player["PlayerName"], "position": player["Position"],
+                       "page": player["PageURL"], "status": player["Status"], "clearing": player["TimeClearing"]}
+                      for player in queries.fetchall(conn, "eligible_players")],
+        "pending": [{"id": player["PlayerID"], "name": player["PlayerName"], "position": player["Position"],
+                     "page": player["PageURL"]}
+                    for player in queries.fetchall(conn, "pending_players")],
+        "recent_results": [{"id": result["PlayerID"], "name": result["PlayerName"], "position": result["Position"],
+                            "team": team_codes_by_role.get(str(result["TeamID"]), result["TeamID"]),
+                            "claim_type": result["ClaimType"], "claimed_at": result["ClaimedAt"]}
+                           for result in queries.fetchall(conn, "recent_results", (EXPORT_RECENT_RESULTS,))],
+    }
+
+
+def render_waiver_html(state, generated):
+    def table(title, columns, rows):
+        header = "".join(f"<th>{html.escape(label)}</th>" for label, _ in columns)
+        body = "".join("<tr>" + "".join(f"<td>{html.escape(str(row[key] if row[key] is not None else ''))}</td>"
+                                        for _, key in columns) + "</tr>\n" for row in rows)
+        return f"<h2>{html.escape(title)}</h2>\n<table>\n<tr>{header}</tr>\n{body}</table>\n"
+
+    return ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>Waivers</title>\n"
+            "<style>table { border-collapse: collapse; } th, td { border: 1px solid #ccc; padding: 4px 8px; }</style>\n"
+            f"</head>\n<body>\n<h1>Waivers</h1>\n<p>Updated {html.escape(generated)}</p>\n"
+            + table("Priority order", [("#", "rank"), ("Team", "team"), ("Name", "name")], state["priority"])
+            + table("Available players", [("ID", "id"), ("Name", "name"), ("Position", "position"),
+                                          ("Status", "status"), ("Clears", "clearing"), ("Roster page", "page")],
+                    state["available"])
+            + table("Pending players", [("ID", "id"), ("Name", "name"), ("Position", "position"),
+                                        ("Roster page", "page")], state["pending"])
+            + table("Recent results", [("ID", "id"), ("Name", "name"), ("Position", "position"), ("Team", "team"),
+                                       ("Claim", "claim_type"), ("Claimed", "claimed_at")], state["recent_results"])
+            + "</body>\n</html>\n")
+
+
+def write_file_atomically(path, data):
+    # Readers see either the old file or the new one, never a partly written one
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".export-", delete=False) as temporary:
+        temporary.write(data)
+        temporary.flush()
+        os.fsync(temporary.fileno())
+    os.chmod(temporary.name, 0o644)
+    os.replace(temporary.name, path)
+
+
+async def export_waiver_state():
+    state = await read_snapshot(read_waiver_state)
+    state_hash = hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+    if state_hash == export_state["hash"]:
+        return False
+
+    generated = clock.now().strftime('%Y-%m-%d %H:%M:%S')
+    json_data = json.dumps(dict(state, generated=generated), indent=2).encode('utf-8')
+    html_data = render_waiver_html(state, generated).encode('utf-8')
+
+    def write_export():
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        write_file_atomically(os.path.join(EXPORT_DIR, "waivers.json"), json_data)
+        write_file_atomically(os.path.join(EXPORT_DIR, "index.html"), html_data)
+
+    await asyncio.to_thread(write_export)
+    export_state["hash"] = state_hash
+    return True
+
+
+@tasks.loop(seconds=EXPORT_POLL_SECONDS)
+async def export_task():
+    if not holds_scheduler_lease():
+        return
+
+    try:
+        # data_version changes whenever any other connection, in this process or another, commits. Checking it only
+        # touches shared memory, so nothing is read from the tables until something has changed.
+        data_version = queries.reader(DB_PATH).execute("PRAGMA data_version").fetchone()[0]
+        if data_version == export_state["data_version"]:
+            return
+        export_state["data_version"] = data_version
+
+        started = time.perf_counter()
+        if await export_waiver_state():
+            logger.info(f"Exported the waiver state to {EXPORT_DIR} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        logger.error(f"Unexpected error in export_task: {e}")
+
+
+def database_file_sizes():
+    # Database and WAL file sizes in bytes, or zeros when the database isn't a file (see storage.py)
+    if queries.backend(DB_PATH) is not None:
+        return 0, 0
+    wal_path = f"{DB_PATH}-wal"
+    return os.path.getsize(DB_PATH), os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+
+async def run_maintenance():
+    database_size, wal_size = database_file_sizes()
+
+    # On the writer thread, so no write is in progress on its connection
+    steps, before, after = await asyncio.get_running_loop().run_in_executor(writer_executor, queries.maintain, DB_PATH)
+
+    for step, elapsed, detail in steps:
+        logger.info(f"Maintenance: {step} took {elapsed * 1000:.0f} ms ({detail})")
+    for name in before:
+        logger.info(f"Maintenance: {name} took {before[name] * 1000:.2f} ms before, {after[name] * 1000:.2f} ms after")
+    new_database_size, new_wal_size = database_file_sizes()
+    logger.info(f"Maintenance finished. Database {database_size / 1024:.0f} KiB -> {new_database_size / 1024:.0f} "
+                f"KiB, WAL {wal_size / 1024:.0f} KiB -> {new_wal_size / 1024:.0f} KiB, benchmark queries "
+                f"{sum(before.values()) * 1000:.1f} ms -> {sum(after.values()) * 1000:.1f} ms")
+
+
+@tasks.loop(hours=1)
+async def maintenance_task():
+    if not holds_scheduler_lease():
+        return
+
+    now = datetime.now(pytz.timezone(ANNOUNCEMENT_TIMEZONE))
+    if now.hour != MAINTENANCE_HOUR or current_announcement_window(now):
+        return
+
+    try:
+        await run_maintenance()
+    except Exception as e:
+        logger.error(f"Unexpected error in maintenance_task: {e}")
+
+
+def get_resident_memory():
+    # Current resident set size in bytes. Falls back to the peak where /proc is not available.
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def log_memory_usage(stage):
+    resident_memory = get_resident_memory()
+    cached_members = sum(len(guild.members) for guild in bot.guilds)
+    memory_text = f"{resident_memory / 1024 / 1024:.1f} MiB" if resident_memory is not None else "unknown"
+    logger.info(f"Memory usage ({stage}): resident {memory_text}, {len(bot.guilds)} guilds, "
+                f"{cached_members} cached members, {len(bot.cached_messages)} cached messages")
+
+
+@tasks.loop(minutes=MEMORY_REPORT_INTERVAL_MINUTES)
+async def memory_report_task():
+    try:
+        log_memory_usage("periodic")
+    except Exception as e:
+        logger.error(f"Unexpected error in memory_report_task: {e}")
+
+
+def count_sqlite_objects():
+    # Live sqlite3 connections (and how many are still open) and cursors, found through the garbage collector
+    connections = open_connections = cursors = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, sqlite3.Connection):
+            connections += 1
+            try:
+                obj.total_changes
+                open_connections += 1
+            except sqlite3.ProgrammingError:
+                pass
+        elif isinstance(obj, sqlite3.Cursor):
+            cursors += 1
+    return connections, open_connections, cursors
+
+
+def take_memprofile_snapshot():
+    # Leave out tracemalloc's own allocations and the import machinery
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def build_memprofile_report(action):
+    snapshot = take_memprofile_snapshot()
+    previous = memprofile_state["previous"]
+    memprofile_state["previous"] = snapshot
+
+    traced, peak = tracemalloc.get_traced_memory()
+    resident_memory = get_resident_memory()
+    connections, open_connections, cursors = count_sqlite_objects()
+    report = (f"Memory profile ({action}) at {datetime.now():%Y-%m-%d %H:%M:%S}, tracing since "
+              f"{memprofile_state['started']:%Y-%m-%d %H:%M:%S}\n")
+    if resident_memory is not None:
+        report += f"Resident: {resident_memory / 1024 / 1024:.1f} MiB\n"
+    report += (f"Traced: {traced / 1024 / 1024:.1f} MiB now, {peak / 1024 / 1024:.1f} MiB peak, "
+               f"{tracemalloc.get_tracemalloc_memory() / 1024 / 1024:.1f} MiB used by tracemalloc\n"
+               f"SQLite: {connections} connections ({open_connections} open), {cursors} cursors\n\n")
+
+    if action == "diff":
+        report += f"== Top {MEMPROFILE_TOP_N} allocation sites by growth since the previous snapshot ==\n"
+        stats = snapshot.compare_to(previous, 'lineno')
+        trace_stats = snapshot.compare_to(previous, 'traceback')
+    else:
+        report += f"== Top {MEMPROFILE_TOP_N} allocation sites ==\n"
+        stats = snapshot.statistics('lineno')
+        trace_stats = snapshot.statistics('traceback')
+    report += "".join(f"{stat}\n" for stat in stats[:MEMPROFILE_TOP_N])
+
+    report += "\n== Tracebacks of the top 5 ==\n"
+    for stat in trace_stats[:5]:
+        report += f"\n{stat}\n" + "\n".join(stat.traceback.format()) + "\n"
+
+    summary = (f"Traced {traced / 1024 / 1024:.1f} MiB ({peak / 1024 / 1024:.1f} MiB peak), {connections} SQLite "
+               f"connections ({open_connections} open), {cursors} cursors.")
+    return summary, report
+
+
+def profile_targets():
+    # Every slash command and scheduled task /profile can be pointed at
+    targets = [f"/{command.name}" for command in bot.pending_application_commands]
+    return sorted(targets) + sorted(f"task:{loop.coro.__name__}" for loop in scheduled_loops())
+
+
+async def finish_profile(profile):
+    profiler.end(profile)
+    try:
+        path = await asyncio.to_thread(profiler.write_profile, profile)
+        logger.info(f"Profiled {profile.target} {profile.arguments} ({profile.wall * 1000:.0f} ms, "
+                    f"{sum(profile.stacks.values())} samples) to {path}")
+    except Exception as e:
+        logger.error(f"Error writing the profile of {profile.target}: {e}")
+
+
+def profile_loop(loop):
+    # Swaps the task's body for one that profiles each pass while the task is armed, and puts the original back once
+    # it no longer is
+    if hasattr(loop.coro, '__wrapped__'):
+        return
+    original = loop.coro
+    target = f"task:{original.__name__}"
+
+    @functools.wraps(original)
+    async def profiled(*args, **kwargs):
+        profile = profiler.begin(target, "", sys._getframe())
+        if profile is None:
+            loop.coro = original
+            return await original(*args, **kwargs)
+        token = profiler.current.set(profile)
+        try:
+            return await original(*args, **kwargs)
+        finally:
+            profiler.current.reset(token)
+            if target not in profiler.armed:
+                loop.coro = original
+            await finish_profile(profile)
+
+    loop.coro = profiled
+
+
+def build_profile_report(target):
+    profiles, stacks = profiler.summary(target)
+    samples = sum(stacks.values())
+    walls = sorted(profile.wall for profile in profiles)
+    armed = ", ".join(f"{name} ({count} left)" for name, count in sorted(dict(profiler.armed).items())) or "nothing"
+    if not profiles:
+        return f"No profiles of {target or 'any target'} yet. Armed: {armed}.", None
+
+    # As many top functions as fit in one message
+    top_n = PROFILE_TOP_N
+    while True:
+        summary = (f"{len(profiles)} profiles of {target or 'all targets'}, {samples} samples, "
+                   f"{walls[len(walls) // 2] * 1000:.0f} ms median and {walls[-1] * 1000:.0f} ms longest run. "
+                   f"Armed: {armed}.\n```\n{profiler.format_top(stacks, samples, top_n=top_n)}\n```")
+        if len(summary) <= 1900 or top_n <= 1:
+            break
+        top_n -= 1
+    report = (f"{summary}\n\nProfiles:\n"
+              + "\n".join(f"{profile.started:%Y-%m-%d %H:%M:%S} {profile.wall * 1000:>8.1f} ms "
+                          f"{sum(profile.stacks.values()):>6} samples  {profile.path or '(not written)'}"
+                          for profile in profiles)
+              + f"\n\nTop functions over all of them:\n{profiler.format_top(stacks, samples, top_n=100)}\n")
+    return summary, report
+
+
+def scheduled_loops():
+    return (announcement_task, find_clearing_players, backup_task, memory_report_task, league_config_watcher,
+            scheduler_lease_task, maintenance_task, export_task)
+
+
+def build_lag_labels():
+    # Map the code objects of every slash command and task loop to a readable label
+    labels = {}
+    for command in bot.pending_application_commands:
+        callback = getattr(command, 'callback', None)
+        if callback is not None:
+            labels[callback.__code__] = f"/{command.name}"
+    for loop in scheduled_loops():
+        labels[loop.coro.__code__] = f"task:{loop.coro.__name__}"
+    return labels
+
+
+def attribute_stall(frame):
+    # Walk outwards from the blocking frame until we reach a known command or task loop
+    labels = lag_watchdog_state["labels"]
+    site = f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+    fallback = None
+    current = frame
+    while current is not None:
+        if current.f_code in labels:
+            return labels[current.f_code], site
+        if fallback is None and current.f_code.co_filename == __file__:
+            fallback = f"{current.f_code.co_name}()"
+        current = current.f_back
+    return fallback or "unknown", site
+
+
+def record_stall(lag, captured):
+    if captured is None:
+        captured = {"label": "unattributed (stall ended before capture)", "site": None, "stack": ""}
+
+    lag_stalls.append(dict(captured, lag=lag, time=datetime.now()))
+    logger.warning(f"Event loop stalled for {lag * 1000:.0f} ms in {captured['label']} at {captured['site']}")
+    if captured["stack"]:
+        logger.debug(f"Stack of the blocking code:\n{captured['stack']}")
+
+
+def lag_report_top():
+    # Aggregate the rolling stall history per handler, keeping the stack of the worst stall
+    totals = {}
+    for event in list(lag_stalls):
+        entry = totals.setdefault(event["label"], {"count": 0, "total": 0.0, "max": 0.0, "site": None, "stack": ""})
+        entry["count"] += 1
+        entry["total"] += event["lag"]
+        if event["lag"] >= entry["max"]:
+            entry["max"] = event["lag"]
+            entry["site"] = event["site"]
+            entry["stack"] = event["stack"]
+
+    return sorted(totals.items(), key=lambda item: item[1]["total"], reverse=True)[:LAG_WATCHDOG_TOP_N]
+
+
+async def lag_heartbeat():
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_WATCHDOG_INTERVAL
+        await asyncio.sleep(LAG_WATCHDOG_INTERVAL)
+        lag = loop.time() - expected
+
+        with lag_watchdog_lock:
+            lag_watchdog_state["last_beat"] = time.monotonic()
+            captured = lag_watchdog_state["captured"]
+            lag_watchdog_state["captured"] = None
+
+        if lag >= LAG_WATCHDOG_THRESHOLD:
+            record_stall(lag, captured)
+
+
+def lag_watchdog_main():
+    # Runs in its own thread so it can look at the event loop thread while it is blocked
+    while True:
+        time.sleep(LAG_WATCHDOG_THRESHOLD / 4)
+
+        with lag_watchdog_lock:
+            last_beat = lag_watchdog_state["last_beat"]
+            already_captured = lag_watchdog_state["captured"] is not None
+
+        if already_captured or time.monotonic() - last_beat - LAG_WATCHDOG_INTERVAL < LAG_WATCHDOG_THRESHOLD:
+            continue
+
+        frame = sys._current_frames().get(lag_watchdog_state["loop_thread_id"])
+        if frame is None:
+            continue
+
+        label, site = attribute_stall(frame)
+        stack = "".join(traceback.format_stack(frame))
+        del frame
+
+        with lag_watchdog_lock:
+            # Only keep the capture if the loop is still stuck in the same stall
+            if lag_watchdog_state["last_beat"] == last_beat and lag_watchdog_state["captured"] is None:
+                lag_watchdog_state["captured"] = {"label": label, "site": site, "stack": stack}
+
+
+def start_lag_watchdog():
+    if not LAG_WATCHDOG_ENABLED or lag_watchdog_state["thread"] is not None:
+        return
+
+    lag_watchdog_state["labels"] = build_lag_labels()
+    lag_watchdog_state["loop_thread_id"] = threading.get_ident()
+    lag_watchdog_state["last_beat"] = time.monotonic()
+
+    asyncio.create_task(lag_heartbeat())
+    thread = threading.Thread(target=lag_watchdog_main, name="lag-watchdog", daemon=True)
+    thread.start()
+    lag_watchdog_state["thread"] = thread
+
+    logger.info(f"Lag watchdog started with a {LAG_WATCHDOG_THRESHOLD * 1000:.0f} ms threshold.")
+
+
+def player_search_keys(player_id, name):
+    # A player can be found by ID, by their full name or by any single word of their name
+    lowered_name = name.lower()
+    return {str(player_id), lowered_name} | set(lowered_name.split())
+
+
+def index_entry(row, claim_teams):
+    return {"name": row["PlayerName"], "position": row["Position"], "status": row["Status"],
+            "announced": row["Announced"], "cleared": row["Cleared"], "teams": {str(team) for team in claim_teams},
+            "keys": player_search_keys(row["PlayerID"], row["PlayerName"])}
+
+
+def rebuild_player_index():
+    if BOT_ROLE == "scheduler":
+        # The scheduler has no slash commands to autocomplete
+        return
+
+    conn = get_db_connection()
+    claim_teams = {}
+    for claim in queries.fetchall(conn, "indexed_claims"):
+        claim_teams.setdefault(claim["PlayerID"], []).append(claim["TeamID"])
+
+    entries = {row["PlayerID"]: index_entry(row, claim_teams.get(row["PlayerID"], []))
+               for row in queries.fetchall(conn, "indexed_players")}
+    keys = sorted((key, player_id) for player_id, entry in entries.items() for key in entry["keys"])
+
+    # Swap both structures in together so autocomplete never sees a half built index
+    player_index.clear()
+    player_index.update(entries)
+    player_index_keys[:] = keys
+    logger.info(f"Built the player autocomplete index with {len(entries)} players and {len(keys)} search keys")
+
+
+def refresh_player_index(player_id):
+    # Called by every write path after its transaction commits. Claimed and removed players drop out of the index.
+    if BOT_ROLE == "scheduler":
+        # The index lives with the slash commands
+        notify_peer(f"player {player_id}")
+        return
+
+    entry = player_index.pop(player_id, None)
+    if entry:
+        for key in entry["keys"]:
+            position = bisect.bisect_left(player_index_keys, (key, player_id))
+            if position < len(player_index_keys) and player_index_keys[position] == (key, player_id):
+                del player_index_keys[position]
+
+    conn = get_db_connection()
+    row = queries.fetchone(conn, "indexed_player", (player_id,))
+    if row:
+        claim_teams = [claim["TeamID"] for claim in queries.fetchall(conn, "claim_teams_for_player", (player_id,))]
+        entry = index_entry(row, claim_teams)
+        player_index[player_id] = entry
+        for key in entry["keys"]:
+            bisect.insort(player_index_keys, (key, player_id))
+
+
+def notify_socket_path(role):
+    return os.path.join(NOTIFY_SOCKET_DIR, f"waiverbot-{role}.sock")
+
+
+def notify_peer(message):
+    # Best effort: if the other process is down it catches up from the database when it starts
+    if notify_state["socket"] is None:
+        return
+    peer = "scheduler" if BOT_ROLE == "interactive" else "interactive"
+    try:
+        notify_state["socket"].sendto(message.encode('utf-8'), notify_socket_path(peer))
+    except OSError as e:
+        logger.debug(f"Could not notify the {peer} process ({message}): {e}")
+
+
+def handle_notifications():
+    while True:
+        try:
+            message = notify_state["socket"].recv(256).decode('utf-8')
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.warning(f"Error receiving a notification: {e}")
+            return
+
+        logger.debug(f"Received notification: {message}")
+        command, _, argument = message.partition(" ")
+        if command == "wake":
+            announcement_wakeup.set()
+        elif command == "player":
+            refresh_player_index(int(argument))
+        elif command == "quiesce":
+            notify_state["acknowledging"] = asyncio.create_task(acknowledge_quiesce(argument))
+        elif command == "quiesced":
+            acknowledged = notify_state["quiesce"].get(argument)
+            if acknowledged is not None and not acknowledged.done():
+                acknowledged.set_result(None)
+        elif command == "restored":
+            queries.prepare(DB_PATH, force=True)
+            rebuild_player_index()
+            announcement_wakeup.set()
+
+
+def start_notify_listener():
+    if BOT_ROLE == "all" or notify_state["socket"] is not None:
+        return
+    if not hasattr(socket, "AF_UNIX"):
+        logger.warning("Unix sockets are not available, so the processes will only notice changes by polling.")
+        return
+
+    path = notify_socket_path(BOT_ROLE)
+    if os.path.exists(path):
+        os.remove(path)
+    notify_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    notify_socket.bind(path)
+    notify_socket.setblocking(False)
+    asyncio.get_running_loop().add_reader(notify_socket.fileno(), handle_notifications)
+    notify_state["socket"] = notify_socket
+    logger.info(f"Listening for notifications from the other process on {path}")
+
+
+def paused_tasks(conn):
+    return {row["Task"] for row in queries.fetchall(conn, "paused_tasks")}
+
+
+def task_paused(task):
+    # Checked at the start of every scheduled pass. The flags live in the database, so a pause made in the other
+    # process holds from the next pass here without waiting on a notification.
+    result = queries.fetchone(get_db_connection(), "task_paused", (task,))
+    return bool(result and result["Paused"])
+
+
+async def set_paused_tasks(paused):
+    # Pauses the scheduled tasks named in paused and unpauses the rest
+    await write_db(lambda conn: queries.executemany(conn, "set_task_paused",
+                                                    [(int(task in paused), task) for task in SCHEDULED_TASKS]))
+    # An unpaused announcement task may be asleep until its window closes
+    if "announcements" not in paused:
+        wake_announcement_task()
+
+
+def search_player_index(text, allowed, limit=25):
+    text = text.strip().lower()
+    if text:
+        # Every key starting with the typed text sits in one contiguous run of the sorted key list
+        candidates = []
+        position = bisect.bisect_left(player_index_keys, (text,))
+        while position < len(player_index_keys) and player_index_keys[position][0].startswith(text):
+            candidates.append(player_index_keys[position][1])
+            position += 1
+    else:
+        candidates = sorted(player_index)
+
+    matches = []
+    for player_id in dict.fromkeys(candidates):
+        if allowed(player_index[player_id]):
+            matches.append(player_id)
+            if len(matches) == limit:
+                break
+    return matches
+
+
+def member_team_id(member):
+    member_role_ids = {str(role.id) for role in member.roles}
+    return next((role_id for role_id in TEAMS_DICT.values() if role_id in member_role_ids), None)
+
+
+def player_choices(player_ids):
+    return [discord.OptionChoice(name=f"{player_id} - {player_index[player_id]['name']} "
+                                      f"({player_index[player_id]['position']})"[:100], value=player_id)
+            for player_id in player_ids]
+
+
+async def team_codes(ctx: discord.AutocompleteContext):
+    # Served from TEAMS_DICT so added teams show up without re-registering the command
+    return [code for code in sorted(TEAMS_DICT) if code.startswith((ctx.value or "").strip().upper())]
+
+
+async def profile_target_names(ctx: discord.AutocompleteContext):
+    value = (ctx.value or "").strip().lower()
+    return [target for target in profile_targets() if value in target.lower()][:25]
+
+
+async def claimable_players(ctx: discord.AutocompleteContext):
+    # Announced players open for claims that the caller's team has not claimed yet
+    team_id = member_team_id(ctx.interaction.user)
+    if not team_id:
+        return []
+    return player_choices(search_player_index(
+        ctx.value or "", lambda entry: entry["announced"] == 'Y' and entry["status"] in ["Available", "Free Claim"]
+        and team_id not in entry["teams"]))
+
+
+async def adjustable_players(ctx: discord.AutocompleteContext):
+    # Players still awaiting clearing that the caller's team holds a claim on
+    team_id = member_team_id(ctx.interaction.user)
+    if not team_id:
+        return []
+    return player_choices(search_player_index(
+        ctx.value or "", lambda entry: entry["announced"] == 'Y' and not entry["cleared"] and team_id in entry["teams"]))
+
+
+async def removable_players(ctx: discord.AutocompleteContext):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.interaction.user.roles]:
+        return []
+    return player_choices(search_player_index(ctx.value or "", lambda entry: True))
+
+
+def sync_teams_table(conn, old_teams, new_teams, team_names):
+    # Runs on the writer. Brings the Teams table, and the role IDs stored with claims and priority history, in line
+    # with a new league configuration.
+    changed_at = clock.now().strftime('%Y-%m-%d %H:%M:%S')
+    for code, role_id in old_teams.items():
+        if code not in new_teams and queries.fetchone(conn, "count_team_open_claims", (role_id,))[0] > 0:
+            raise ValueError(f"Team {code} can't be removed while it has claims on players who haven't cleared.")
+
+    for code, role_id in old_teams.items():
+        if code not in new_teams:
+            queries.execute(conn, "delete_team", (role_id,))
+        elif new_teams[code] != role_id:
+            for statement in ("set_team_role", "set_claims_team", "set_priority_history_role"):
+                queries.execute(conn, statement, (new_teams[code], role_id))
+
+    for code, role_id in new_teams.items():
+        if not queries.execute(conn, "set_team_name", (team_names[code], role_id)).rowcount:
+            # New teams start at the back of the priority order
+            queries.execute(conn, "insert_team", (team_names[code], role_id))
+            queries.execute(conn, "record_priority_change", (changed_at, "added", role_id))
+
+
+async def reload_league_config():
+    global ROLES_DICT, TEAMS_DICT, TEAM_NAMES_DICT, CHANNELS_DICT
+    async with league_config_lock:
+        mtime = os.path.getmtime(LEAGUE_CONFIG_PATH)
+        roles, teams, team_names, channels = load_league_config()
+
+        old_roles = {role_id: code for code, role_id in TEAMS_DICT.items()}
+        for code, role_id in teams.items():
+            if old_roles.get(role_id, code) != code:
+                raise ValueError(f"Team {code} takes the role ID {old_roles[role_id]} had. Move role IDs between "
+                                 f"teams in two separate reloads.")
+
+        added = [code for code in teams if code not in TEAMS_DICT]
+        removed = [code for code in TEAMS_DICT if code not in teams]
+        moved = [code for code in teams if code in TEAMS_DICT and TEAMS_DICT[code] != teams[code]]
+
+        old_teams = TEAMS_DICT
+        await write_db(lambda conn: sync_teams_table(conn, old_teams, teams, team_names))
+
+        # Swap every dictionary in one step, so no command sees a mix of the old and new configuration
+        ROLES_DICT, TEAMS_DICT, TEAM_NAMES_DICT, CHANNELS_DICT = roles, teams, team_names, channels
+        league_config_state["mtime"] = mtime
+
+        # Rebuild the lookups derived from the configuration
+        rebuild_player_index()
+        if LAG_WATCHDOG_ENABLED:
+            lag_watchdog_state["labels"] = build_lag_labels()
+
+    summary = (f"{len(teams)} teams, added: {', '.join(added) or 'none'}, removed: {', '.join(removed) or 'none'}, "
+               f"new role IDs: {', '.join(moved) or 'none'}")
+    logger.info(f"Reloaded the league configuration from {LEAGUE_CONFIG_PATH}: {summary}")
+    return summary
+
+
+def sync_teams_at_startup(conn):
+    # Runs on the writer. The Teams table still holds the teams the bot last ran with, so each stored team is matched
+    # to a team in the configuration loaded at startup by role ID, then by name. Stored teams matching neither were
+    # removed from the configuration since.
+    codes_by_role = {role_id: code for code, role_id in TEAMS_DICT.items()}
+    codes_by_name = {name: code for code, name in TEAM_NAMES_DICT.items()}
+    stored = queries.fetchall(conn, "teams_by_priority")
+    stored_roles = {row["RoleID"] for row in stored}
+    old_teams = {}
+    for row in stored:
+        code = codes_by_role.get(row["RoleID"])
+        if code is None and TEAMS_DICT.get(codes_by_name.get(row["Name"])) not in stored_roles:
+            code = codes_by_name.get(row["Name"])
+        old_teams[code or row["RoleID"]] = row["RoleID"]
+    sync_teams_table(conn, old_teams, TEAMS_DICT, TEAM_NAMES_DICT)
+
+
+async def sync_league_config():
+    # The league configuration is loaded before there is a writer to apply it, so the Teams table is brought in line
+    # with it here, before any scheduled task runs
+    if league_config_state["mtime"] is None or league_config_state["synced"]:
+        return
+    async with league_config_lock:
+        try:
+            await write_db(sync_teams_at_startup)
+            league_config_state["synced"] = True
+        except ValueError as e:
+            logger.error(f"The league configuration in {LEAGUE_CONFIG_PATH} was loaded but not applied to the Teams "
+                         f"table: {e}")
+
+
+@tasks.loop(seconds=LEAGUE_CONFIG_POLL_SECONDS)
+async def league_config_watcher():
+    try:
+        mtime = os.path.getmtime(LEAGUE_CONFIG_PATH)
+    except OSError:
+        return
+    if mtime == league_config_state["mtime"]:
+        return
+
+    # Remember the new version even if it is invalid, so a broken file is reported once rather than on every check
+    league_config_state["mtime"] = mtime
+    try:
+        await reload_league_config()
+    except (OSError, ValueError) as e:
+        logger.error(f"The league configuration changed but was not applied: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error in league_config_watcher: {e}")
+
+
+def command_tree_fingerprint():
+    # Hash of everything Discord is told about the commands: names, descriptions, options, choices and permissions
+    command_payloads = sorted((command.to_dict() for command in bot.pending_application_commands),
+                              key=lambda payload: (payload["name"], payload.get("type", 1)))
+    payload = json.dumps({"application_id": bot.application_id, "commands": command_payloads}, sort_keys=True,
+                         default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def restore_command_ids(command_ids):
+    # Give every command the ID Discord assigned to it at the last sync, as sync_commands would have. This is the one
+    # place that relies on py-cord internals: interactions are routed through its private ID -> command map. If that
+    # map isn't there, the caller syncs as the default on_connect would.
+    application_commands = getattr(bot, "_application_commands", None)
+    if not isinstance(application_commands, dict):
+        logger.warning("This version of py-cord has no command map to restore the command IDs into. Syncing instead.")
+        return False
+    if any(command.name not in command_ids for command in bot.pending_application_commands):
+        return False
+    for command in bot.pending_application_commands:
+        command.id = command_ids[command.name]
+        application_commands[command.id] = command
+    return True
+
+
+def command_sync_is_current(fingerprint):
+    try:
+        with open(COMMAND_SYNC_FILE, 'r') as sync_file:
+            last_sync = json.load(sync_file)
+    except (OSError, ValueError):
+        return False
+
+    sync_age = time.time() - last_sync.get("synced_at", 0)
+    if (last_sync.get("fingerprint") != fingerprint or sync_age >= COMMAND_SYNC_MAX_AGE_DAYS * 24 * 60 * 60
+            or not restore_command_ids(last_sync.get("command_ids", {}))):
+        return False
+    logger.info(f"Slash commands are unchanged since the last sync {sync_age / 3600:.1f} hours ago. "
+                f"Skipped syncing {len(last_sync['command_ids'])} commands.")
+    return True
 
-                if not matching_claims and player[5] != "Free Claim":
-                    # Player has no claims, set to "Free Claim"
-                    logger.info(
-                        f"Attempting to set Player with ID {player_id} to Free Claim.")
-                    cursor.execute("""
-                           UPDATE Players 
-                           SET Status = 'Free Claim' 
-                           WHERE PlayerID = ?
-                       """, (player_id,))
-                    conn.commit()  # Commit the changes to the database.
-
-                    announcement_channel = bot.get_channel(CHANNELS_DICT["announcement_channel"])
-                    await announcement_channel.send(f"<@&{ROLES_DICT['DSFLGM']}> {player[1]} with ID {player_id}"
-                                                    f" is now available for Free Claim!")
-                    logger.info(f"Set Player with ID {player_id} as Free Claim")
-                else:
-                    logger.info(
-                        f"Skipping Player with ID {player_id} for Free Claim. Claims found: {len(matching_claims)},"
-                        f" Current Status: {player[5]}")
 
-            if clearing_claims:
-                await process_clearing_claims(clearing_claims, clearing_players)
+@bot.event
+async def on_connect():
+    # Replaces the default on_connect, which registers every slash command with Discord again on each connect, and
+    # only hands over to it when the command tree changed since the last sync
+    fingerprint = command_tree_fingerprint()
+    if command_sync_is_current(fingerprint):
+        return
 
-            logger.info("Finished find_clearing_players loop.")
-            conn.close()
-            break
-        except (Timeout, RequestException) as e:
-            logger.warning(f"Database connection error on attempt {retry + 1}/{RETRY_COUNT}: {e}")
-            if retry < RETRY_COUNT - 1:  # Check if this is the last retry
-                logger.info(f"Retrying in {RETRY_DELAY} seconds...")
-                await asyncio.sleep(RETRY_DELAY)
-            else:
-                logger.error("All retry attempts exhausted. Moving on.")
-        except Exception as e:
-            logger.error(f"Unexpected error in find_clearing_players: {e}")
-            break  # Exit the retry loop on unexpected errors
+    started = time.perf_counter()
+    await commands.Bot.on_connect(bot)
+    command_ids = {command.name: command.id for command in bot.pending_application_commands if command.id}
+    logger.info(f"Synced {len(command_ids)} slash commands with Discord in {time.perf_counter() - started:.2f}s")
+
+    # Write the new fingerprint atomically, so a crash never leaves a half written sync file
+    sync_state = {"fingerprint": fingerprint, "synced_at": time.time(), "command_ids": command_ids}
+    with open(COMMAND_SYNC_FILE + ".tmp", 'w') as sync_file:
+        json.dump(sync_state, sync_file, indent=2)
+    os.replace(COMMAND_SYNC_FILE + ".tmp", COMMAND_SYNC_FILE)
 
 
 @bot.event
 async def on_ready():
-    logger.info("Bot is ready. Starting tasks...")
-    announcement_task.start()
-    find_clearing_players.start()
-    logger.info("Tasks started successfully.")
+    logger.info(f"Bot is ready{' with the low-memory profile' if LOW_MEMORY_PROFILE else ''}. Starting tasks...")
+    log_memory_usage("startup")
+    rebuild_player_index()
+    await sync_league_config()
+    start_tasks()
+
+
+def start_tasks():
+    start_lag_watchdog()
+    start_notify_listener()
+    run_loops_on_clock()
+    if BOT_ROLE != "interactive":
+        if SCHEDULER_LEASE_ENABLED and not scheduler_lease_task.is_running():
+            scheduler_lease_task.start()
+        if not announcement_task.is_running():
+            announcement_task.start()
+        if not find_clearing_players.is_running():
+            find_clearing_players.start()
+        if BACKUP_ENABLED and not backup_task.is_running():
+            backup_task.start()
+        if MAINTENANCE_ENABLED and not maintenance_task.is_running():
+            maintenance_task.start()
+        if EXPORT_DIR and not export_task.is_running():
+            export_task.start()
+    if not memory_report_task.is_running():
+        memory_report_task.start()
+    if not league_config_watcher.is_running():
+        league_config_watcher.start()
+    logger.info(f"Tasks started successfully ({BOT_ROLE} role).")
+
+
+async def run_scheduler():
+    # The scheduler never connects to the gateway. Logging in is enough to post announcements over REST.
+    await bot.login(TOKEN)
+    logger.info("Scheduler logged in. Starting tasks...")
+    log_memory_usage("startup")
+    await sync_league_config()
+    start_tasks()
+    await asyncio.Event().wait()
+
+
+@bot.before_invoke
+async def tag_command_logs(ctx):
+    # Every line logged while the command runs is indexed under the command, the caller's team and the player
+    keys = [("command", f"/{ctx.command.qualified_name}")]
+    team_id = member_team_id(ctx.author)
+    if team_id is not None:
+        keys.append(("team", next(team for team, role_id in TEAMS_DICT.items() if role_id == team_id)))
+    for option in ctx.selected_options or []:
+        if option["name"] in ("player_id", "playerid"):
+            keys.append(("player", str(option["value"])))
+    logstore.log_context.set(tuple(keys))
+
+    # Profile this invocation if /profile armed the command
+    if profiler.armed:
+        arguments = " ".join(f"{option['name']}={option['value']}" for option in ctx.selected_options or [])
+        profile = profiler.begin(f"/{ctx.command.qualified_name}", arguments,
+                                 asyncio.current_task().get_coro().cr_frame)
+        if profile is not None:
+            profiler.current.set(profile)
+
+
+@bot.after_invoke
+async def finish_command_profile(ctx):
+    profile = profiler.current.get()
+    if profile is not None:
+        profiler.current.set(None)
+        await finish_profile(profile)
 
 
 @bot.slash_command(name="input", description="Allows RMs to input a player into the system.")
@@ -621,31 +2171,27 @@ async def input_player(ctx, name: str, position: str, pageurl: str):
             logger.warning(f"{ctx.author} tried to use /input command without proper permissions")
             return
 
-        # Establish a connection to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Generate player ID based on the next available ID in the database
-        cursor.execute("SELECT MAX(PlayerID) FROM Players")
-        result = cursor.fetchone()
-        playerid = result[0] + 1 if result and result[0] else 1  # Start from 1 if no entries found
-
-        # Step 2: Add player details to the database.
-        player_data = (
-            playerid,
-            name,
-            position,
-            pageurl,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "Pending",
-            "N"
-        )
-        cursor.execute("""
-            INSERT INTO Players (PlayerID, PlayerName, Position, PageURL, TimeEntered, Status, Announced) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, player_data)
-        conn.commit()
-        conn.close()
+        def add_player(conn):
+            # Generate player ID based on the next available ID in the database
+            result = queries.fetchone(conn, "max_player_id")
+            playerid = result[0] + 1 if result and result[0] else 1  # Start from 1 if no entries found
+
+            # Step 2: Add player details to the database.
+            player_data = (
+                playerid,
+                name,
+                position,
+                pageurl,
+                clock.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "Pending",
+                "N"
+            )
+            queries.execute(conn, "insert_player", player_data)
+            return playerid
+
+        playerid = await write_db(add_player)
+        refresh_player_index(playerid)
+        wake_announcement_task()
 
         logger.info(f"Successfully added Player {name} ({position}) with ID {playerid} to the database")
 
@@ -659,45 +2205,148 @@ async def input_player(ctx, name: str, position: str, pageurl: str):
         raise e
 
 
+def claim_queue_depth():
+    return sum(len(team_queue) for team_queue in claim_queues.values())
+
+
+def admit_claim(team):
+    if claim_queue_depth() >= CLAIM_QUEUE_MAX_DEPTH or len(claim_queues.get(team, ())) >= CLAIM_QUEUE_MAX_PER_TEAM:
+        claim_queue_state["shed_full"] += 1
+        return None
+
+    job = {"team": team, "future": asyncio.get_running_loop().create_future(), "granted": False,
+           "enqueued": time.monotonic(), "waited": 0.0}
+    claim_queues.setdefault(team, deque()).append(job)
+    if team not in claim_queue_turns:
+        claim_queue_turns.append(team)
+    claim_queue_state["admitted"] += 1
+    claim_queue_state["max_depth"] = max(claim_queue_state["max_depth"], claim_queue_depth())
+
+    dispatch_claims()
+    return job
+
+
+def claim_queue_position(job):
+    # How many claims will be served before this one, plus one. 0 once the claim has its turn.
+    if job["granted"]:
+        return 0
+    team = job["team"]
+    own_index = claim_queues[team].index(job)
+    turn_index = claim_queue_turns.index(team)
+    ahead = own_index
+    for index, other_team in enumerate(claim_queue_turns):
+        if other_team != team:
+            # Round robin serves every other team once per turn, and once more if it comes first in the rotation
+            ahead += min(len(claim_queues[other_team]), own_index + (1 if index < turn_index else 0))
+    return ahead + 1
+
+
+def dispatch_claims():
+    # Hand free processing slots to the next team in the rotation
+    while claim_queue_state["active"] < CLAIM_QUEUE_CONCURRENCY and claim_queue_turns:
+        team = claim_queue_turns.popleft()
+        job = claim_queues[team].popleft()
+        if claim_queues[team]:
+            claim_queue_turns.append(team)
+        else:
+            del claim_queues[team]
+
+        job["granted"] = True
+        claim_queue_state["active"] += 1
+        job["future"].set_result(None)
+
+
+async def wait_for_claim_turn(job):
+    await job["future"]
+    job["waited"] = time.monotonic() - job["enqueued"]
+    claim_queue_waits.append(job["waited"])
+    logger.info(f"Claim by {job['team']} waited {job['waited']:.2f}s in the claim queue "
+                f"({claim_queue_depth()} still queued)")
+
+    if job["waited"] > CLAIM_QUEUE_MAX_WAIT:
+        claim_queue_state["shed_waited"] += 1
+        return False
+    return True
+
+
+def finish_claim(job):
+    # Free the claim's processing slot, or take it out of the queue if the command ended before its turn
+    if job["granted"]:
+        claim_queue_state["active"] -= 1
+        claim_queue_state["completed"] += 1
+    else:
+        job["future"].cancel()
+        team_queue = claim_queues.get(job["team"])
+        if team_queue and job in team_queue:
+            team_queue.remove(job)
+            if not team_queue:
+                del claim_queues[job["team"]]
+                claim_queue_turns.remove(job["team"])
+    dispatch_claims()
+
+
 @bot.slash_command(name="claim", description="Allows GMs to claim a player.")
-@discord.option(name='player_id', description="The ID number of the player you are claiming.", type=int)
+@discord.option(name='player_id', description="The ID number of the player you are claiming.", type=int,
+                autocomplete=claimable_players)
 @discord.option(name='type_of_claim', description="The type of claim..", type=str,
                 choices=["Quick", "Normal", "Free"])
 @discord.option(name='claim_order_pref', description="Preferred claim order ranking, if applicable.", type=int,
                 required=False)
 async def claim_player(ctx, player_id: int, type_of_claim: str, claim_order_pref: int = None):
     await ctx.defer()
-    await ctx.respond(content="WaiverBot is attempting to process your claim.")
+    logger.info(f"{ctx.author} is starting to claim Player with ID {player_id} using a {type_of_claim} claim")
 
-    try:
-        logger.info(f"{ctx.author} is starting to claim Player with ID {player_id} using a {type_of_claim} claim")
+    # Check for valid claim_order_pref
+    if claim_order_pref:
+        if claim_order_pref <= 0 or claim_order_pref > 68 or not isinstance(claim_order_pref, int):
+            await ctx.respond("Invalid claim order preference. Preference must be a whole number between 1 and 68. "
+                              "Nice try though Hudz.")
+            return
 
-        # Check for valid claim_order_pref
-        if claim_order_pref:
-            if claim_order_pref <= 0 or claim_order_pref > 68 or not isinstance(claim_order_pref, int):
-                await ctx.respond("Invalid claim order preference. Preference must be a whole number between 1 and 68. "
-                                  "Nice try though Hudz.")
-                return
+    # Check if user has a team role.
+    team_role = None
+    for team, role_id in TEAMS_DICT.items():
+        if role_id in [str(role.id) for role in ctx.author.roles]:
+            team_role = team
+            break
 
-        # Establish a connection to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+    if not team_role:
+        await ctx.respond("Sorry, you do not have permission to claim a player. Ensure you have a team role.")
+        logger.warning(f"{ctx.author} tried to use /claim command without a team role")
+        return
 
-        # Check if user has a team role.
-        team_role = None
-        for team, role_id in TEAMS_DICT.items():
-            if role_id in [str(role.id) for role in ctx.author.roles]:
-                team_role = team
-                break
+    # Join the claim queue, or turn the claim away straight away if the queue is full
+    job = admit_claim(team_role)
+    if job is None:
+        await ctx.respond("WaiverBot is handling too many claims right now. Please try again in a minute.")
+        logger.warning(f"Shed a claim by {ctx.author} ({team_role}) with {claim_queue_depth()} claims queued")
+        return
 
-        if not team_role:
-            await ctx.respond("Sorry, you do not have permission to claim a player. Ensure you have a team role.")
-            logger.warning(f"{ctx.author} tried to use /claim command without a team role")
+    try:
+        position = claim_queue_position(job)
+        if position:
+            await ctx.respond(content=f"WaiverBot has queued your claim. You are number {position} in the claim queue.")
+        else:
+            await ctx.respond(content="WaiverBot is attempting to process your claim.")
+
+        if not await wait_for_claim_turn(job):
+            await ctx.respond(f"Your claim waited more than {CLAIM_QUEUE_MAX_WAIT} seconds in the claim queue and was "
+                              f"not processed. Please try again.")
+            logger.warning(f"Dropped a claim by {ctx.author} ({team_role}) after {job['waited']:.1f}s in the queue")
             return
 
+        await process_claim(ctx, team_role, player_id, type_of_claim, claim_order_pref)
+    finally:
+        finish_claim(job)
+
+
+async def process_claim(ctx, team_role, player_id, type_of_claim, claim_order_pref):
+    try:
+        conn = get_db_connection()
+
         # Check if the team already has a claim lodged for the player
-        cursor.execute("SELECT COUNT(*) FROM Claims WHERE PlayerID=? AND TeamID=?", (player_id, TEAMS_DICT[team_role]))
-        existing_claim_count = cursor.fetchone()[0]
+        existing_claim_count = queries.fetchone(conn, "count_team_claims_for_player",
+                                                (player_id, TEAMS_DICT[team_role]))[0]
 
         if existing_claim_count > 0:
             await ctx.respond(
@@ -706,17 +2355,17 @@ async def claim_player(ctx, player_id: int, type_of_claim: str, claim_order_pref
             return
 
         # Check if the player is set to "Pending".
-        cursor.execute("SELECT * FROM Players WHERE PlayerID=?", (player_id,))
-        player_row = cursor.fetchone()
+        player_row = queries.fetchone(conn, "player_by_id", (player_id,))
 
         # Check if the player has been announced
-        if player_row and player_row[6] != 'Y':  # Checking if the 'Announced' column is not 'Y'
-            await ctx.respond(f"{player_row[1]} with ID {player_id} hasn't been announced yet and cannot be claimed.")
+        if player_row and player_row["Announced"] != 'Y':
+            await ctx.respond(f"{player_row['PlayerName']} with ID {player_id} hasn't been announced yet and cannot be "
+                              f"claimed.")
             return
 
         # Update the check to consider only "Available" and "Free Claim" statuses
-        if not player_row or player_row[5] not in ["Available", "Free Claim"]:
-            await ctx.respond(f"{player_row[1]} ID {player_id} is not yet available for claim.")
+        if not player_row or player_row["Status"] not in ["Available", "Free Claim"]:
+            await ctx.respond(f"{player_row['PlayerName']} ID {player_id} is not yet available for claim.")
             return
 
         # Convert the type_of_claim to lowercase for case-insensitive comparison
@@ -725,13 +2374,8 @@ async def claim_player(ctx, player_id: int, type_of_claim: str, claim_order_pref
         # Based on the type of claim, call the appropriate helper function
         if type_of_claim == "normal":
             # Fetch all claims by the team for uncleared players
-            cursor.execute("""
-                   SELECT ClaimOrderPreference 
-                   FROM Claims 
-                   INNER JOIN Players ON Claims.PlayerID = Players.PlayerID 
-                   WHERE TeamID = ? AND (Players.Status = 'Available')
-               """, (TEAMS_DICT[team_role],))
-            existing_team_claims = [int(row[0]) for row in cursor.fetchall() if
+            team_claim_rows = queries.fetchall(conn, "team_available_claim_preferences", (TEAMS_DICT[team_role],))
+            existing_team_claims = [int(row[0]) for row in team_claim_rows if
                                     row[0] is not None and (isinstance(row[0], int) or row[0].isdigit())]
 
             if not claim_order_pref:
@@ -756,7 +2400,7 @@ async def claim_player(ctx, player_id: int, type_of_claim: str, claim_order_pref
             announcement_message = await handle_quick_claim(player_row, team_role, player_id)
 
             # Send the announcement message to the announcements channel
-            announcement_channel = bot.get_channel(CHANNELS_DICT["announcement_channel"])
+            announcement_channel = league_channel(CHANNELS_DICT["announcement_channel"])
             await announcement_channel.send(announcement_message)
 
         elif type_of_claim == "free":
@@ -771,7 +2415,8 @@ async def claim_player(ctx, player_id: int, type_of_claim: str, claim_order_pref
 
         # Send confirmation message.
         await ctx.respond(
-            f"{player_row[1]} with ID {player_id} has had a {type_of_claim} claim lodged successfully by {team_role}!")
+            f"{player_row['PlayerName']} with ID {player_id} has had a {type_of_claim} claim lodged successfully by "
+            f"{team_role}!")
         logger.info(f"{ctx.author} ({team_role}) claimed Player with ID {player_id} using a {type_of_claim}")
 
     except Exception as e:
@@ -785,20 +2430,12 @@ async def priority_list(ctx):
     try:
         logger.info(f"{ctx.author} is requesting the priority list")
 
-        # Establish a connection to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Get the "Teams" data
-        cursor.execute("SELECT Name, Priority FROM Teams")
-        teams_data = cursor.fetchall()
-
-        # Sort teams based on priority
-        sorted_teams = sorted(teams_data, key=lambda x: x[1])
+        # Get the "Teams" data, sorted based on priority
+        sorted_teams = await read_snapshot(lambda conn: queries.fetchall(conn, "teams_by_priority"))
 
         # Create the response message
         response = "**Team Priority List:**\n\n"
-        for idx, (team_name, priority) in enumerate(sorted_teams, start=1):
+        for idx, (team_name, role_id) in enumerate(sorted_teams, start=1):
             response += f"{idx}. {team_name}\n"
 
         # Create an embedded response
@@ -812,15 +2449,63 @@ async def priority_list(ctx):
         raise e
 
 
+@bot.slash_command(name="priorityat", description="Displays the priority list as it stood at a given time.")
+@discord.option(name='when', description="The date and time to look up (YYYY-MM-DD HH:MM, bot server time).",
+                type=str)
+async def priority_at(ctx, when: str):
+    try:
+        logger.info(f"{ctx.author} is requesting the priority list at {when}")
+
+        # Accept a full timestamp, or a date meaning the end of that day
+        lookup_time = None
+        for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                lookup_time = datetime.strptime(when.strip(), time_format)
+            except ValueError:
+                continue
+            if time_format == '%Y-%m-%d':
+                lookup_time += timedelta(days=1, seconds=-1)
+            break
+
+        if lookup_time is None:
+            await ctx.respond("Invalid time. Please use the format YYYY-MM-DD HH:MM.")
+            return
+
+        history = await read_snapshot(lambda conn: queries.fetchall(
+            conn, "priority_at_time", (lookup_time.strftime('%Y-%m-%d %H:%M:%S'),)))
+        if not history:
+            await ctx.respond(f"No priority history has been recorded before {lookup_time:%Y-%m-%d %H:%M}.")
+            return
+
+        response = f"**Team Priority List at {lookup_time:%Y-%m-%d %H:%M}:**\n\n"
+        for idx, entry in enumerate(history, start=1):
+            team_name = entry["Name"] or entry["RoleID"]
+            response += f"{idx}. {team_name} (since {entry['Time']}, {entry['Reason']})\n"
+
+        embed = Embed(description=response, color=0xF39C12)  # Orange Gold embed
+        await ctx.respond(embed=embed)
+        logger.info(f"Sent the priority list at {lookup_time} to {ctx.author}")
+
+    except Exception as e:
+        logger.error(f"Error in /priorityat command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+
 @bot.slash_command(name="currentteamclaims", description="Displays the current claims for a specified team.")
 @discord.option(name='team_code', description="The three letter code of the team for which to show claims.", type=str,
-                choices=["BBB", "DAL", "KCC", "LDN", "MIN", "NOR", "PDX", "TIJ"])
+                autocomplete=team_codes)
 async def current_team_claims(ctx, team_code: str):
     try:
         # Convert the team_code to uppercase for case-insensitivity
         team_code = team_code.upper()
         logger.info(f"{ctx.author} is requesting the current claims for team {team_code}")
 
+        # Team codes are typed with autocomplete rather than picked from fixed choices, so check them first
+        if team_code not in TEAMS_DICT:
+            await ctx.respond("Invalid team code provided. Please check and try again.")
+            logger.warning(f"{ctx.author} provided an invalid team code: {team_code}")
+            return
+
         user_roles = [role.id for role in ctx.author.roles]
         is_rookie_mentor = ROLES_DICT["Rookie Mentor"] in user_roles
         user_roles_str = [str(role) for role in user_roles]
@@ -837,39 +2522,22 @@ async def current_team_claims(ctx, team_code: str):
             logger.warning(f"{ctx.author} tried to view claims for a different team")
             return
 
-        if team_code not in TEAMS_DICT:
-            await ctx.respond("Invalid team code provided. Please check and try again.")
-            logger.warning(f"{ctx.author} provided an invalid team code: {team_code}")
-            return
-
         team_id = TEAMS_DICT[team_code]
         logger.info(f"Team ID for {team_code}: {team_id}")
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Players WHERE (Cleared IS NULL OR Cleared = 0)"
-                       " AND (Claimed IS NULL OR Claimed = 0)")
-        uncleared_players = cursor.fetchall()
-        logger.info(f"Uncleared players: {uncleared_players}")
+        # Claims of the team joined with their uncleared players, already sorted by claim order preference
+        team_claims = await read_snapshot(
+            lambda conn: queries.fetchall(conn, "team_claims_for_uncleared_players", (team_id,)))
 
-        uncleared_playerids = [str(row[0]) for row in uncleared_players]
-        query = (f"SELECT * FROM Claims WHERE TeamID = ? AND PlayerID IN ({','.join(['?'] * len(uncleared_playerids))})"
-                 f" ORDER BY ClaimOrderPreference")
-        team_claims = cursor.execute(query, (team_id, *uncleared_playerids)).fetchall()
-
-        logger.info(f"Claims for team {team_code}: {team_claims}")
+        logger.info(f"Claims for team {team_code}: {[dict(claim) for claim in team_claims]}")
 
         response = f"**Current claims by {team_code} for uncleared players (sorted by claim order preference):**\n\n"
         for claim in team_claims:
-            playerid = claim[1]
-            player_data = next((row for row in uncleared_players if row[0] == playerid), None)
-            if not player_data:
-                logger.info(f"No uncleared player data found for player ID: {playerid}")
-                continue
-            name = player_data[1]
-            position = player_data[2]
-            claim_type = claim[5]
-            preference_order = claim[6]
+            playerid = claim["PlayerID"]
+            name = claim["PlayerName"]
+            position = claim["Position"]
+            claim_type = claim["ClaimType"]
+            preference_order = claim["ClaimOrderPreference"]
             response += f"{preference_order} - **{name}** - {position} - ID: {playerid} \n\n"
             logger.info(f"Response built for {name} (ID: {playerid}): {response}")
 
@@ -894,24 +2562,19 @@ async def player_list(ctx):
     try:
         logger.info(f"{ctx.author} is requesting the list of eligible players")
 
-        # Establish a connection to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
         # Get the players from the "Players" table in the SQLite3 database
-        cursor.execute("SELECT * FROM Players WHERE Announced = 'Y' AND (Status = 'Available' OR Status = 'Free Claim')")
-        eligible_players = cursor.fetchall()
+        eligible_players = await read_snapshot(lambda conn: queries.fetchall(conn, "eligible_players"))
 
         # Format the player details
         if eligible_players:
             response = "**Eligible Players:**\n\n"
             for player in eligible_players:
-                playerid = player[0]
-                name = player[1]
-                position = player[2]
-                pageurl = player[3]
-                status = player[5]
-                clearing_time = player[9]
+                playerid = player["PlayerID"]
+                name = player["PlayerName"]
+                position = player["Position"]
+                pageurl = player["PageURL"]
+                status = player["Status"]
+                clearing_time = player["TimeClearing"]
                 timestamp = datetime.strptime(clearing_time, '%Y-%m-%d %H:%M:%S').timestamp()
                 response += (f"**{name}** - {position} - ID {playerid}\nRoster Page: {pageurl}\nStatus: {status}\n"
                              f"Clearing Time: <t:{int(timestamp)}:F>\n\n")
@@ -936,24 +2599,19 @@ async def pending_players(ctx):
     try:
         logger.info(f"{ctx.author} is requesting the list of pending players")
 
-        # Establish a connection to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
         # Get the players from the "Players" table in the SQLite3 database where they are marked as 'Pending'
         # and not announced
-        cursor.execute("SELECT * FROM Players WHERE Announced = 'N' AND Status = 'Pending'")
-        pending_players = cursor.fetchall()
+        pending_players = await read_snapshot(lambda conn: queries.fetchall(conn, "pending_players"))
 
         # Format the player details
         if pending_players:
             response = "**Pending Players:**\n\n"
             for player in pending_players:
-                playerid = player[0]  # Player ID
-                name = player[1]
-                position = player[2]
-                pageurl = player[3]
-                status = player[5]
+                playerid = player["PlayerID"]
+                name = player["PlayerName"]
+                position = player["Position"]
+                pageurl = player["PageURL"]
+                status = player["Status"]
                 response += f"ID {playerid} - **{name}** - {position}\nRoster Page: {pageurl}\nStatus: {status}\n\n"
         else:
             response = "No pending players currently."
@@ -969,6 +2627,53 @@ async def pending_players(ctx):
         await ctx.respond(f"An error occurred: {e}")
 
 
+def player_search_query(text, any_term=False):
+    # FTS5 query matching every word of the text as a prefix, or any of them. Words are quoted so characters FTS5
+    # treats as syntax are searched for literally.
+    terms = re.findall(r"\w+", text)
+    return (" OR " if any_term else " ").join(f'"{term}"*' for term in terms), len(terms)
+
+
+@bot.slash_command(name="findplayer", description="Searches for players by name, position or roster page.")
+@discord.option(name='query', description="Part of the player's name, position or roster page URL.", type=str)
+@discord.option(name='status', description="Only show players with this status.", type=str,
+                choices=["Pending", "Available", "Free Claim", "Claimed"], required=False)
+async def find_player(ctx, query: str, status: str = None):
+    try:
+        logger.info(f"{ctx.author} is searching for players matching '{query}'")
+
+        match_all, term_count = player_search_query(query)
+        if not term_count:
+            await ctx.respond("Please enter part of a player's name, position or roster page.")
+            return
+
+        def search(conn):
+            players = queries.fetchall(conn, "search_players", (match_all, status, status, 25))
+            if not players and term_count > 1:
+                # Nothing matches every word, so show the players matching the most of them
+                match_any, _ = player_search_query(query, any_term=True)
+                players = queries.fetchall(conn, "search_players", (match_any, status, status, 25))
+            return players
+
+        players = await read_snapshot(search)
+        if not players:
+            await ctx.respond(f"No players found matching '{query}'.")
+            return
+
+        response = f"**Players matching '{query}':**\n\n"
+        for player in players:
+            response += (f"ID {player['PlayerID']} - **{player['PlayerName']}** - {player['Position']}\n"
+                         f"Roster Page: {player['PageURL']}\nStatus: {player['Status']}\n\n")
+
+        for chunk in split_string_into_chunks(response):
+            await ctx.respond(embed=Embed(description=chunk, color=0x5DADE2))
+        logger.info(f"Sent {len(players)} players matching '{query}' to {ctx.author}")
+
+    except Exception as e:
+        logger.error(f"Error in /findplayer command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+
 @bot.slash_command(name="teamclaimhistory", description="Displays the last 10 claims history for your team.")
 async def team_claims_history(ctx):
     try:
@@ -983,17 +2688,9 @@ async def team_claims_history(ctx):
             logger.warning(f"{ctx.author} tried to use /teamclaimhistory command without a team role")
             return
 
-        # Establish a connection to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Fetch the team claims from the database
-        cursor.execute("SELECT * FROM Claims WHERE TeamID = ? ORDER BY Time DESC LIMIT 10", (team_role_id_str,))
-        team_claims = cursor.fetchall()
-
-        # Fetch the player data from the database
-        cursor.execute("SELECT * FROM Players")
-        player_rows = {row[0]: row for row in cursor.fetchall()}  # Dictionary with PlayerID as key for easy lookup
+        # Fetch the team claims from the database, joined with the player they were lodged for
+        team_claims = await read_snapshot(
+            lambda conn: queries.fetchall(conn, "recent_team_claims", (team_role_id_str,)))
 
         # Retrieve the team name (three-letter code)
         team_name = next((key for key, value in TEAMS_DICT.items() if value == team_role_id_str), None)
@@ -1002,17 +2699,13 @@ async def team_claims_history(ctx):
 
         response = f"**Claim History for {team_name}:**\n\n"
         for claim in team_claims:
-            playerid = claim[1]
-            player_data = player_rows.get(playerid)
-            if not player_data:
-                continue
-            name = player_data[1]
-            position = player_data[2]
-            claim_time = claim[4]
+            name = claim["PlayerName"]
+            position = claim["Position"]
+            claim_time = claim["Time"]
             timestamp = datetime.strptime(claim_time, '%Y-%m-%d %H:%M:%S').timestamp()
-            claim_type = claim[5]
-            preference_order = claim[6]
-            successful = claim[7]
+            claim_type = claim["ClaimType"]
+            preference_order = claim["ClaimOrderPreference"]
+            successful = claim["Successful"]
             response += (f"**{name}** - {position}\nClaim Time: <t:{int(timestamp)}:F>\nClaim Type: {claim_type}\n"
                          f"Preference Order: {preference_order}\nSuccessful: {successful}\n\n")
 
@@ -1025,8 +2718,76 @@ async def team_claims_history(ctx):
         await ctx.respond(f"An error occurred: {e}")
 
 
+def write_waiver_report(report_path, since):
+    # Runs in a worker thread on a read-only snapshot, so both sections describe the same moment. Both are aggregated by
+    # SQL and streamed row by row into the CSV file, so memory use does not grow with the size of the season.
+    role_to_team = {role_id: team for team, role_id in TEAMS_DICT.items()}
+
+    with queries.snapshot(DB_PATH) as conn, open(report_path, 'w', newline='', encoding='utf-8') as report_file:
+        writer = csv.writer(report_file)
+
+        writer.writerow(["Team", "Claims", "Successful", "Success Rate", "Normal", "Quick", "Free",
+                         "Average Hours To Clear"])
+        for row in queries.iterate(conn, "report_team_summary", (since,)):
+            success_rate = row["SuccessfulClaims"] / row["ClaimCount"] if row["ClaimCount"] else 0
+            average_hours = row["AverageHoursToClear"]
+            writer.writerow([role_to_team.get(str(row["TeamID"]), row["TeamID"]), row["ClaimCount"],
+                             row["SuccessfulClaims"], f"{success_rate:.1%}", row["NormalClaims"], row["QuickClaims"],
+                             row["FreeClaims"], f"{average_hours:.1f}" if average_hours is not None else ""])
+
+        writer.writerow([])
+        writer.writerow(["Player ID", "Name", "Position", "Status", "Time Entered", "Time Announced", "Time Clearing",
+                         "Claims", "Winning Team", "Winning Claim Type", "Hours To Clear"])
+        for row in queries.iterate(conn, "report_players", (since,)):
+            hours_to_clear = row["HoursToClear"]
+            writer.writerow([row["PlayerID"], row["PlayerName"], row["Position"], row["Status"], row["TimeEntered"],
+                             row["TimeAnnounced"], row["TimeClearing"], row["ClaimCount"], row["SuccessfulTeamID"],
+                             row["WinningClaimType"], f"{hours_to_clear:.1f}" if hours_to_clear is not None else ""])
+
+
+@bot.slash_command(name="waiverreport", description="Exports season waiver statistics as a CSV file.")
+@discord.option(name='since', description="Only include players and claims from this date on (YYYY-MM-DD).",
+                type=str, required=False)
+async def waiver_report(ctx, since: str = None):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can export the waiver report.")
+        return
+
+    try:
+        since_date = datetime.strptime(since, '%Y-%m-%d').strftime('%Y-%m-%d') if since else ""
+    except ValueError:
+        await ctx.respond("Invalid date. Please use the format YYYY-MM-DD.")
+        return
+
+    await ctx.defer()
+    report_path = None
+    try:
+        logger.info(f"{ctx.author} is requesting the waiver report since {since_date or 'the beginning'}")
+
+        # Generate the report in a worker thread so the event loop keeps serving other commands
+        started = time.perf_counter()
+        with tempfile.NamedTemporaryFile(prefix="waiverreport-", suffix=".csv", delete=False) as report_file:
+            report_path = report_file.name
+        await asyncio.to_thread(write_waiver_report, report_path, since_date)
+        logger.info(f"Generated the waiver report in {time.perf_counter() - started:.2f}s "
+                    f"({os.path.getsize(report_path)} bytes)")
+
+        filename = f"waiver_report_{since_date or 'all'}.csv"
+        await ctx.respond("Here is the waiver report.", file=discord.File(report_path, filename=filename))
+        logger.info(f"Sent the waiver report to {ctx.author}")
+
+    except Exception as e:
+        logger.error(f"Error in /waiverreport command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+    finally:
+        if report_path and os.path.exists(report_path):
+            os.remove(report_path)
+
+
 @bot.slash_command(name="adjustclaims", description="Allows modification of player claims.")
-@discord.option(name='playerid', description="The ID of the player for which to adjust the claim.", type=int)
+@discord.option(name='playerid', description="The ID of the player for which to adjust the claim.", type=int,
+                autocomplete=adjustable_players)
 @discord.option(name='action', description="The action to take.", type=str,
                 choices=["adjust", "withdraw"])
 @discord.option(name='new_priority', description="The new preference order number for the claim, if applicable.",
@@ -1053,69 +2814,64 @@ async def adjust_claims(ctx, playerid: int, action: str, new_priority: int = Non
             logger.warning(f"{ctx.author} tried to use /adjustclaims command without a team role")
             return
 
-        # Connect to the SQLite3 database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        # Fetch the players who are yet to clear
-        cursor.execute("SELECT PlayerID FROM Players WHERE (Cleared IS NULL OR Cleared='') AND Announced='Y'")
-        clearing_players = [row[0] for row in cursor.fetchall()]
+        conn = get_db_connection()
 
-        # Add logging to print the clearing_players list
-        logger.info(f"Clearing players: {clearing_players}")
-
-        if playerid not in clearing_players:
+        # Check that the player is yet to clear
+        if not queries.fetchone(conn, "player_awaiting_clearing", (playerid,)):
             await ctx.respond(f"Player with ID {playerid} has already cleared or doesn't exist.")
             return
 
         # Check if team has made a claim on that player
-        cursor.execute("SELECT * FROM Claims WHERE PlayerID=? AND TeamID=?", (playerid, TEAMS_DICT[team_role]))
-        claim_data = cursor.fetchone()
-        original_priority = claim_data[6] if claim_data else None
+        claim_data = queries.fetchone(conn, "team_claim_for_player", (playerid, TEAMS_DICT[team_role]))
+        original_priority = claim_data["ClaimOrderPreference"] if claim_data else None
 
         if original_priority is None:
             await ctx.respond(f"Your team does not have a claim for player with ID {playerid}.")
             return
 
+        def current_priority(conn):
+            # Read the preference again on the writer, as another adjustment may have moved it since the check above
+            claim = queries.fetchone(conn, "team_claim_for_player", (playerid, TEAMS_DICT[team_role]))
+            if claim is None:
+                raise ValueError(f"Your team does not have a claim for player with ID {playerid}.")
+            return claim["ClaimOrderPreference"]
+
         # Adjust the claim
         if action == "adjust" and new_priority:
 
-            if new_priority > original_priority:
-                # Increase priority
-                cursor.execute(
-                    "UPDATE Claims SET ClaimOrderPreference = ClaimOrderPreference - 1 WHERE TeamID = ? "
-                    "AND ClaimOrderPreference BETWEEN ? AND ?",
-                    (TEAMS_DICT[team_role], original_priority, new_priority))
-
-            elif new_priority < original_priority:
-                # Decrease priority
-                cursor.execute(
-                    "UPDATE Claims SET ClaimOrderPreference = ClaimOrderPreference + 1 WHERE TeamID = ? "
-                    "AND ClaimOrderPreference BETWEEN ? AND ?",
-                    (TEAMS_DICT[team_role], new_priority, original_priority))
-
-            # Update the priority of the adjusted claim
-            cursor.execute("UPDATE Claims SET ClaimOrderPreference = ? WHERE PlayerID = ? AND TeamID = ?",
-                           (new_priority, playerid, TEAMS_DICT[team_role]))
-            conn.commit()
-            await ctx.respond(f"Claim priority for player with ID {playerid} has been adjusted to {new_priority}.")
+            def adjust_claim(conn):
+                original_priority = current_priority(conn)
+                if new_priority > original_priority:
+                    # Increase priority
+                    queries.execute(conn, "move_claims_up_between",
+                                    (TEAMS_DICT[team_role], original_priority, new_priority))
 
-        elif action == "withdraw":
+                elif new_priority < original_priority:
+                    # Decrease priority
+                    queries.execute(conn, "move_claims_down_between",
+                                    (TEAMS_DICT[team_role], new_priority, original_priority))
 
-            withdrawn_priority = original_priority
+                # Update the priority of the adjusted claim
+                queries.execute(conn, "set_claim_preference", (new_priority, playerid, TEAMS_DICT[team_role]))
 
-            # Adjust the priority of other claims
+            await write_db(adjust_claim)
+            queue_claim_digests()
+            await ctx.respond(f"Claim priority for player with ID {playerid} has been adjusted to {new_priority}.")
+
+        elif action == "withdraw":
 
-            cursor.execute(
-                "UPDATE Claims SET ClaimOrderPreference = ClaimOrderPreference - 1 WHERE TeamID = ? "
-                "AND ClaimOrderPreference > ?",
-                (TEAMS_DICT[team_role], withdrawn_priority))
+            def withdraw_claim(conn):
+                withdrawn_priority = current_priority(conn)
 
-            # Delete the withdrawn claim
+                # Adjust the priority of other claims
+                queries.execute(conn, "move_claims_up_after", (TEAMS_DICT[team_role], withdrawn_priority))
 
-            cursor.execute("DELETE FROM Claims WHERE PlayerID = ? AND TeamID = ?", (playerid, TEAMS_DICT[team_role]))
+                # Delete the withdrawn claim
+                queries.execute(conn, "delete_team_claim", (playerid, TEAMS_DICT[team_role]))
 
-            conn.commit()
+            await write_db(withdraw_claim)
+            refresh_player_index(playerid)
+            queue_claim_digests()
 
             await ctx.respond(f"Withdrew the claim for player with ID {playerid}.")
 
@@ -1179,27 +2935,32 @@ async def set_all_priorities(ctx, priorities: str):
         await ctx.respond("Please specify the exact number of teams in correct priority order.")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Update priorities based on the list order provided
-    for index, team in enumerate(priority_list, start=1):
-        if team.strip().upper() in TEAM_NAMES_DICT:
-            cursor.execute("UPDATE Teams SET Priority=? WHERE RoleID=?", (index, TEAMS_DICT[team.strip().upper()]))
-        else:
-            conn.close()
+    # Validate every team before writing anything
+    for team in priority_list:
+        if team.strip().upper() not in TEAM_NAMES_DICT:
             await ctx.respond(f"Invalid team abbreviation: {team}. Please check your input.")
             return
 
-    conn.commit()
-    conn.close()
+    # Update priorities based on the list order provided, continuing the priority sequence
+    role_ids = [TEAMS_DICT[team.strip().upper()] for team in priority_list]
+    changed_at = clock.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def set_priorities(conn):
+        last_seq = queries.fetchone(conn, "max_priority_seq")[0]
+        queries.executemany(conn, "set_team_priority_seq", [(last_seq + index, role_id)
+                                                            for index, role_id in enumerate(role_ids, start=1)])
+        queries.executemany(conn, "record_priority_change", [(changed_at, "setpriority", role_id)
+                                                             for role_id in role_ids])
+
+    await write_db(set_priorities)
 
     await ctx.respond("Team priorities have been successfully set based on your input.")
     logger.info(f"{ctx.author} set team priorities based on input order.")
 
 
 @bot.slash_command(name="removeplayer", description="Remove a player from the system.")
-@discord.option(name='player_id', description="The ID of the player to remove.", type=int)
+@discord.option(name='player_id', description="The ID of the player to remove.", type=int,
+                autocomplete=removable_players)
 async def remove_player(ctx, player_id: int):
     if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
         await ctx.respond("Only Rookie Mentors can remove players.")
@@ -1215,12 +2976,14 @@ async def remove_player(ctx, player_id: int):
             await interaction.response.send_message("You do not have permission to confirm this action.", ephemeral=True)
             return
 
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM Players WHERE PlayerID=?", (player_id,))
-        cursor.execute("DELETE FROM Claims WHERE PlayerID=?", (player_id,))
-        conn.commit()
-        conn.close()
+        def delete_player(conn):
+            queries.execute(conn, "delete_player", (player_id,))
+            queries.execute(conn, "delete_player_claims", (player_id,))
+
+        await write_db(delete_player)
+        refresh_player_index(player_id)
+        queue_claim_digests()
+        wake_announcement_task()
 
         await interaction.response.edit_message(content=f"Player ID {player_id} has been removed.", view=None)
 
@@ -1239,43 +3002,360 @@ async def remove_player(ctx, player_id: int):
     await ctx.respond(f"Are you sure you want to remove the player with ID {player_id}? This action cannot be undone.", view=view)
 
 
+@bot.slash_command(name="restorebackup", description="Verifies a database backup and optionally restores it.")
+@discord.option(name='backup', description="Backup file name. Defaults to the most recent backup.", type=str,
+                required=False)
+@discord.option(name='verify_only', description="Only verify the backup without restoring it.", type=bool,
+                required=False)
+async def restore_backup_command(ctx, backup: str = None, verify_only: bool = False):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can restore backups.")
+        return
+
+    backups = list_backups()
+    if not backups:
+        await ctx.respond("There are no backups available.")
+        return
+    backup = backup or backups[0]
+
+    await ctx.defer()
+    try:
+        restore_path, counts = await asyncio.to_thread(verify_backup, backup)
+    except ValueError as ve:
+        await ctx.respond(str(ve))
+        logger.warning(f"{ctx.author} tried to restore an invalid backup: {ve}")
+        return
+
+    summary = f"Backup {backup} passed the integrity check: " + ", ".join(
+        f"{count} {table}" for table, count in counts.items()) + "."
+    logger.info(f"{ctx.author} verified backup {backup}: {counts}")
+
+    if verify_only:
+        os.remove(restore_path)
+        await ctx.respond(summary)
+        return
+
+    # Prepare a confirmation message with buttons
+    view = discord.ui.View()
+    confirm_button = discord.ui.Button(style=discord.ButtonStyle.red, label="Confirm Restore")
+    cancel_button = discord.ui.Button(style=discord.ButtonStyle.gray, label="Cancel")
+
+    async def confirm_interaction(interaction):
+        if interaction.user != ctx.author:
+            await interaction.response.send_message("You do not have permission to confirm this action.", ephemeral=True)
+            return
+
+        await interaction.response.edit_message(content=f"Restoring {backup}...", view=None)
+        try:
+            # Keep a copy of the current state so the restore itself can be undone
+            safety_backup = await run_backup("pre-restore")
+            started = time.perf_counter()
+            await restore_quiesced(restore_path)
+            logger.info(f"{ctx.author} restored backup {backup} in {time.perf_counter() - started:.2f}s")
+            await interaction.edit_original_response(
+                content=f"Restored {backup}. The previous state was saved as {os.path.basename(safety_backup)}.")
+        except Exception as e:
+            logger.error(f"Error restoring backup {backup}: {e}")
+            await interaction.edit_original_response(content=f"An error occurred: {e}")
+
+    async def cancel_interaction(interaction):
+        if interaction.user != ctx.author:
+            await interaction.response.send_message("You do not have permission to cancel this action.", ephemeral=True)
+            return
+
+        os.remove(restore_path)
+        await interaction.response.edit_message(content="Backup restore has been cancelled.", view=None)
+
+    confirm_button.callback = confirm_interaction
+    cancel_button.callback = cancel_interaction
+    view.add_item(confirm_button)
+    view.add_item(cancel_button)
+
+    await ctx.respond(f"{summary} Are you sure you want to restore it? This replaces all current data.", view=view)
+
+
+@bot.slash_command(name="reloadconfig", description="Reloads league teams, roles and channels from the config file.")
+async def reload_config(ctx):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can reload the league configuration.")
+        return
+
+    try:
+        summary = await reload_league_config()
+    except (OSError, ValueError) as e:
+        await ctx.respond(f"The league configuration was not reloaded: {e}")
+        logger.warning(f"{ctx.author} tried to reload an invalid league configuration: {e}")
+        return
+    except Exception as e:
+        logger.error(f"Error in /reloadconfig command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+        return
+
+    await ctx.respond(f"Reloaded the league configuration: {summary}.")
+    logger.info(f"{ctx.author} reloaded the league configuration.")
+
+
 @bot.slash_command(name="pause_tasks", description="Pauses the bots scheduled tasks.")
 async def pause_tasks(ctx):
-    global is_announcements_paused, is_find_clearing_players_paused
     if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
         await ctx.respond("Only Rookie Mentors can pause tasks.")
         return
 
-    # Check if tasks are already paused
-    if is_announcements_paused and is_find_clearing_players_paused:
-        await ctx.respond("All tasks are already paused.")
-        return
+    try:
+        # Check if tasks are already paused
+        if await read_snapshot(paused_tasks) == set(SCHEDULED_TASKS):
+            await ctx.respond("All tasks are already paused.")
+            return
 
-    is_announcements_paused = True
-    is_find_clearing_players_paused = True
-    announcement_task.cancel()
-    find_clearing_players.cancel()
-    await ctx.respond("All scheduled tasks have been paused.")
-    logger.info(f"{ctx.author} paused all tasks.")
+        await set_paused_tasks(set(SCHEDULED_TASKS))
+        await ctx.respond("All scheduled tasks have been paused.")
+        logger.info(f"{ctx.author} paused all tasks.")
+    except Exception as e:
+        logger.error(f"Error pausing tasks: {e}")
+        await ctx.respond(f"An error occurred: {e}")
 
 
 @bot.slash_command(name="unpause_tasks", description="Unpauses the bots scheduled tasks.")
 async def unpause_tasks(ctx):
-    global is_announcements_paused, is_find_clearing_players_paused
     if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
         await ctx.respond("Only Rookie Mentors can unpause tasks.")
         return
 
-    if not is_announcements_paused and not is_find_clearing_players_paused:
-        await ctx.respond("All tasks are already running.")
+    try:
+        if not await read_snapshot(paused_tasks):
+            await ctx.respond("All tasks are already running.")
+            return
+
+        await set_paused_tasks(set())
+        await ctx.respond("All scheduled tasks have been unpaused.")
+        logger.info(f"{ctx.author} unpaused all tasks.")
+    except Exception as e:
+        logger.error(f"Error unpausing tasks: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+
+@bot.slash_command(name="lagreport", description="Displays the commands and tasks that have stalled the bot the most.")
+async def lag_report(ctx):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can view the lag report.")
+        return
+
+    if not LAG_WATCHDOG_ENABLED:
+        await ctx.respond("The lag watchdog is disabled. Set lag_watchdog_enabled in config.json to enable it.")
+        return
+
+    top_stalls = lag_report_top()
+    if not top_stalls:
+        await ctx.respond("No event loop stalls have been recorded.")
+        return
+
+    response = f"**Top event loop stalls (threshold {LAG_WATCHDOG_THRESHOLD * 1000:.0f} ms):**\n\n"
+    stacks = ""
+    for idx, (label, entry) in enumerate(top_stalls, start=1):
+        response += (f"{idx}. **{label}** - {entry['count']} stalls, {entry['total'] * 1000:.0f} ms total, "
+                     f"{entry['max'] * 1000:.0f} ms worst\nBlocking site: {entry['site']}\n\n")
+        stacks += f"== {label} (worst stall {entry['max'] * 1000:.0f} ms) ==\n{entry['stack']}\n"
+
+    # Send the summary as embeds and the full stacks of the worst stalls as an attachment
+    chunks = split_string_into_chunks(response)
+    for chunk in chunks[:-1]:
+        await ctx.respond(embed=Embed(description=chunk, color=0xC0392B))
+    await ctx.respond(embed=Embed(description=chunks[-1], color=0xC0392B),
+                      file=discord.File(io.BytesIO(stacks.encode('utf-8')), filename="lag_report.txt"))
+    logger.info(f"Sent the lag report to {ctx.author}")
+
+
+@bot.slash_command(name="searchlogs", description="Finds the log lines about a player, team or command.")
+@discord.option(name='kind', description="What to search for.", type=str, choices=["player", "team", "command"])
+@discord.option(name='value', description="Player ID, team code or command name.", type=str)
+@discord.option(name='limit', description="Maximum number of log lines, newest first. Defaults to 100.", type=int,
+                required=False)
+async def search_logs(ctx, kind: str, value: str, limit: int = 100):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can search the logs.")
+        return
+
+    try:
+        value = value.strip()
+        values = [value]
+        if kind == "team":
+            # Some lines name a team by its role ID instead of its code
+            value = value.upper()
+            values = [value, TEAMS_DICT[value]] if value in TEAMS_DICT else [value]
+        elif kind == "command" and not value.startswith("/"):
+            value = f"/{value}"
+            values = [value]
+
+        limit = max(1, min(limit, 1000))
+        started = time.perf_counter()
+        records = await asyncio.to_thread(logstore.search, file_handler.baseFilename, file_handler.log_dir, kind,
+                                          values, limit, file_handler)
+        if BOT_ROLE != "all":
+            # Include what the other process logged, e.g. clearing awards when split into interactive and scheduler
+            peer_log_file, peer_log_dir = log_location("scheduler" if BOT_ROLE == "interactive" else "interactive")
+            records += await asyncio.to_thread(logstore.search, peer_log_file, peer_log_dir, kind, values, limit)
+            records = sorted(records, reverse=True)[:limit]
+        elapsed = time.perf_counter() - started
+
+        if not records:
+            await ctx.respond(f"No log lines found for {kind} {value} ({elapsed * 1000:.0f} ms).")
+            return
+
+        # Oldest first reads more naturally in the attachment
+        report = "\n".join(reversed(records)) + "\n"
+        await ctx.respond(f"Found {len(records)} log lines for {kind} {value} in {elapsed * 1000:.0f} ms.",
+                          file=discord.File(io.BytesIO(report.encode('utf-8')), filename=f"logs_{kind}.txt"))
+        logger.info(f"{ctx.author} searched the logs for {kind} {value}")
+    except Exception as e:
+        logger.error(f"Error in /searchlogs command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+
+@bot.slash_command(name="memprofile", description="Starts, snapshots, diffs or stops memory allocation tracing.")
+@discord.option(name='action', description="The action to take.", type=str,
+                choices=["start", "snapshot", "diff", "stop"])
+async def memory_profile(ctx, action: str):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can profile memory.")
+        return
+
+    try:
+        if action == "start":
+            if tracemalloc.is_tracing():
+                await ctx.respond("Memory tracing is already running.")
+                return
+            tracemalloc.start(MEMPROFILE_FRAMES)
+            memprofile_state["started"] = datetime.now()
+            memprofile_state["previous"] = await asyncio.to_thread(take_memprofile_snapshot)
+            await ctx.respond(f"Started memory tracing ({MEMPROFILE_FRAMES} frames per allocation). "
+                              f"Use /memprofile diff to see what has grown since now.")
+            logger.info(f"{ctx.author} started memory tracing")
+            return
+
+        if not tracemalloc.is_tracing():
+            await ctx.respond("Memory tracing is not running. Use /memprofile start first.")
+            return
+
+        if action == "stop":
+            tracemalloc.stop()
+            memprofile_state["started"] = None
+            memprofile_state["previous"] = None
+            await ctx.respond("Stopped memory tracing.")
+            logger.info(f"{ctx.author} stopped memory tracing")
+            return
+
+        summary, report = await asyncio.to_thread(build_memprofile_report, action)
+        filename = f"memprofile_{action}_{datetime.now():%Y%m%d_%H%M%S}.txt"
+        await ctx.respond(summary, file=discord.File(io.BytesIO(report.encode('utf-8')), filename=filename))
+        logger.info(f"Sent a memory profile {action} to {ctx.author}: {summary}")
+    except Exception as e:
+        logger.error(f"Error in /memprofile command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+
+@bot.slash_command(name="profile", description="Profiles the next invocations of a command or scheduled task.")
+@discord.option(name='action', description="The action to take.", type=str, choices=["start", "status", "stop"])
+@discord.option(name='target', description="The command or scheduled task, e.g. /currentteamclaims or "
+                                           "task:announcement_task.", type=str, required=False,
+                autocomplete=profile_target_names)
+@discord.option(name='count', description="How many invocations to profile (start only, default 5).", type=int,
+                required=False)
+async def profile_command(ctx, action: str, target: str = None, count: int = None):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can profile commands.")
+        return
+
+    try:
+        if target:
+            target = target.strip()
+            if not target.startswith(("/", "task:")):
+                target = f"task:{target}" if f"task:{target}" in profile_targets() else f"/{target}"
+            if target not in profile_targets():
+                await ctx.respond(f"There is no command or scheduled task called {target}.")
+                return
+
+        if action == "start":
+            if not target:
+                await ctx.respond("Choose the command or scheduled task to profile.")
+                return
+            count = count or 5
+            if count < 1 or count > 100:
+                await ctx.respond("The count must be between 1 and 100.")
+                return
+            profiler.arm(target, count)
+            for loop in scheduled_loops():
+                if target == f"task:{loop.coro.__name__}":
+                    profile_loop(loop)
+            await ctx.respond(f"Profiling the next {count} invocations of {target}, sampling every "
+                              f"{PROFILE_SAMPLE_INTERVAL * 1000:g} ms. Profiles are written to {PROFILE_DIR}. "
+                              f"Use /profile status to see the top functions so far.")
+            logger.info(f"{ctx.author} armed the profiler for {count} invocations of {target}")
+            return
+
+        if action == "stop":
+            profiler.disarm(target)
+            logger.info(f"{ctx.author} stopped profiling {target or 'all targets'}")
+
+        summary, report = await asyncio.to_thread(build_profile_report, target)
+        if report is None:
+            await ctx.respond(summary)
+            return
+        filename = f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"
+        await ctx.respond(summary, file=discord.File(io.BytesIO(report.encode('utf-8')), filename=filename))
+    except Exception as e:
+        logger.error(f"Error in /profile command: {e}")
+        await ctx.respond(f"An error occurred: {e}")
+
+
+@bot.slash_command(name="claimqueue", description="Displays claim queue depth, wait times and shed claims.")
+async def claim_queue_stats(ctx):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can view claim queue statistics.")
+        return
+
+    waits = sorted(claim_queue_waits)
+    if waits:
+        wait_text = (f"{waits[len(waits) // 2]:.2f}s median, {waits[int(len(waits) * 0.95)]:.2f}s 95th percentile, "
+                     f"{waits[-1]:.2f}s longest (last {len(waits)} claims)")
+    else:
+        wait_text = "no claims yet"
+
+    response = (f"**Claim queue:**\n\n"
+                f"Queued now: {claim_queue_depth()} ({len(claim_queue_turns)} teams), processing: "
+                f"{claim_queue_state['active']}/{CLAIM_QUEUE_CONCURRENCY}\n"
+                f"Deepest queue: {claim_queue_state['max_depth']}\n"
+                f"Admitted: {claim_queue_state['admitted']}, completed: {claim_queue_state['completed']}\n"
+                f"Turned away (queue full): {claim_queue_state['shed_full']}, dropped (waited over "
+                f"{CLAIM_QUEUE_MAX_WAIT}s): {claim_queue_state['shed_waited']}\n"
+                f"Wait: {wait_text}")
+
+    await ctx.respond(embed=Embed(description=response, color=0x117A65))
+    logger.info(f"Sent the claim queue statistics to {ctx.author}")
+
+
+@bot.slash_command(name="querystats", description="Displays the SQL statements the bot spends the most time in.")
+async def query_stats(ctx):
+    if ROLES_DICT["Rookie Mentor"] not in [role.id for role in ctx.author.roles]:
+        await ctx.respond("Only Rookie Mentors can view query statistics.")
+        return
+
+    timings = queries.timing_report()
+    if not timings:
+        await ctx.respond("No statements have been executed yet.")
         return
 
-    is_announcements_paused = False
-    is_find_clearing_players_paused = False
-    announcement_task.start()
-    find_clearing_players.start()
-    await ctx.respond("All scheduled tasks have been unpaused.")
-    logger.info(f"{ctx.author} unpaused all tasks.")
+    response = "**SQL statement timings (by total time):**\n\n"
+    if writer_state["batches"]:
+        response += (f"Writer: {writer_state['writes']} writes in {writer_state['batches']} transactions, "
+                     f"{writer_state['writes'] / writer_state['batches']:.1f} per transaction on average, "
+                     f"{writer_state['largest_batch']} at most\n\n")
+    for name, count, total, slowest in timings[:20]:
+        response += (f"**{name}** - {count} runs, {total * 1000:.1f} ms total, {total / count * 1000:.2f} ms average, "
+                     f"{slowest * 1000:.1f} ms slowest\n\n")
+
+    for chunk in split_string_into_chunks(response):
+        await ctx.respond(embed=Embed(description=chunk, color=0x2E4053))
+    logger.info(f"Sent the query statistics to {ctx.author}")
 
 
 # @bot.slash_command(name="trade", description="Trade the priority of two teams based on team abbreviations.")
@@ -1328,4 +3408,13 @@ async def unpause_tasks(ctx):
 #         conn.close()
 
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    if BOT_ROLE == "scheduler":
+        try:
+            bot.loop.run_until_complete(run_scheduler())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            bot.loop.run_until_complete(bot.close())
+    else:
+        bot.run(TOKEN)
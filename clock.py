@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime
+
+# The time the waiver rules run on. Deadlines, announcement windows, claim times and the scheduled passes all read
+# this clock instead of the wall clock, so a simulation can run days of waiver activity in seconds.
+#
+#   real         the wall clock (the default)
+#   accelerated  starts at a given time and runs speed times faster than the wall clock
+#   manual       stands still until advanced with advance() or advance_to(), which wakes every sleeper that falls
+#                due on the way, in order, and waits for each one to settle before moving on
+#
+# Sleeping and waiting must go through sleep() and wait() for virtual time to apply to them.
+
+MODES = ("real", "accelerated", "manual")
+
+# How long advance() waits (real seconds) for woken tasks to go back to sleep on the clock or finish
+SETTLE_TIMEOUT = 10
+
+state = {"mode": "real", "speed": 1.0, "origin": 0.0, "started": 0.0, "manual": 0.0}
+
+# Manual mode: (deadline, sequence, task, future) for every task sleeping on the clock
+sleepers = []
+sleeper_sequence = itertools.count()
+
+
+def configure(mode, start=None, speed=1.0):
+    # start is a datetime, a 'YYYY-MM-DD HH:MM:SS' string or a Unix time, and defaults to now
+    if mode not in MODES:
+        raise ValueError(f"Unknown clock mode {mode!r}, expected one of {', '.join(MODES)}")
+    if speed <= 0:
+        raise ValueError("The clock speed must be positive")
+    if isinstance(start, str):
+        start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
+    if isinstance(start, datetime):
+        start = start.timestamp()
+    state["mode"] = mode
+    state["speed"] = float(speed) if mode == "accelerated" else 1.0
+    state["origin"] = time.time() if start is None else float(start)
+    state["started"] = time.monotonic()
+    state["manual"] = state["origin"]
+
+
+def is_virtual():
+    return state["mode"] != "real"
+
+
+def timestamp():
+    # Unix time on the clock
+    if state["mode"] == "real":
+        return time.time()
+    if state["mode"] == "accelerated":
+        return state["origin"] + (time.monotonic() - state["started"]) * state["speed"]
+    return state["manual"]
+
+
+def now(tz=None):
+    # Like datetime.now(tz)
+    return datetime.fromtimestamp(timestamp(), tz)
+
+
+def register(deadline):
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(sleepers, (deadline, next(sleeper_sequence), asyncio.current_task(), future))
+    return future
+
+
+async def sleep(seconds):
+    if state["mode"] != "manual":
+        await asyncio.sleep(max(seconds, 0) / state["speed"])
+        return
+    await register(timestamp() + max(seconds, 0))
+
+
+async def wait(event, seconds):
+    # Waits until the event is set or the given time has passed on the clock. Returns whether the event was set.
+    if state["mode"] != "manual":
+        try:
+            await asyncio.wait_for(event.wait(), timeout=max(seconds, 0) / state["speed"])
+            return True
+        except asyncio.TimeoutError:
+            return event.is_set()
+
+    timer = register(timestamp() + max(seconds, 0))
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        await asyncio.wait([timer, waiter], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        timer.cancel()
+        waiter.cancel()
+    return event.is_set()
+
+
+def sleeping_tasks():
+    return {task for _, _, task, future in sleepers if not future.done()}
+
+
+async def settle(tasks):
+    # Gives the woken tasks time to run until each one is asleep on the clock again or finished
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0)
+        waiting = sleeping_tasks()
+        if all(task is None or task.done() or task in waiting for task in tasks):
+            return True
+        await asyncio.sleep(0.001)
+    return False
+
+
+async def advance(seconds):
+    await advance_to(timestamp() + seconds)
+
+
+async def advance_to(moment):
+    # Manual mode only: moves the clock to moment (Unix time or datetime), stopping at every sleeper's deadline
+    if state["mode"] != "manual":
+        raise RuntimeError("Only a manual clock can be advanced")
+    if isinstance(moment, datetime):
+        moment = moment.timestamp()
+
+    while sleepers and sleepers[0][0] <= moment:
+        state["manual"] = max(state["manual"], sleepers[0][0])
+        woken = []
+        while sleepers and sleepers[0][0] <= state["manual"]:
+            _, _, task, future = heapq.heappop(sleepers)
+            if not future.done():
+                future.set_result(None)
+                woken.append(task)
+        if woken:
+            await settle(woken)
+    state["manual"] = max(state["manual"], moment)
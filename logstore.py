@@ -0,0 +1,275 @@
+import contextvars
+import gzip
+import logging
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Log storage: the bot writes to one active log file, which is rotated into a numbered segment once it is big or old
+# enough. Rotated segments are compressed on a background thread as a series of independent gzip members (blocks),
+# so a line can be read back by seeking to its block instead of decompressing the whole segment.
+#
+# Every log line mentioning a player, team or command is recorded in an SQLite index as (kind, value) -> (segment,
+# offset), so looking up everything about a player reads a handful of index rows and blocks.
+
+# Keys for every line logged while a command runs, set by the bot before each command (see tag_command_logs)
+log_context = contextvars.ContextVar('log_context', default=())
+
+PLAYER_ID_PATTERN = re.compile(r"(?:Player ID|PlayerID|[Ww]ith ID|\(ID:) ?(\d+)")
+TEAM_PATTERN = re.compile(r"\b[Tt]eam (?:or Role ID )?([A-Z]{2,4}|\d{15,20})\b")
+COMMAND_PATTERN = re.compile(r"(/[a-z_]+) command")
+RECORD_START_PATTERN = re.compile(rb"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS Segments (SegmentID INTEGER PRIMARY KEY, Started REAL, Ended REAL, "
+    "Compressed INTEGER NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS Blocks (SegmentID INTEGER, PlainOffset INTEGER, CompressedOffset INTEGER, "
+    "PRIMARY KEY (SegmentID, PlainOffset)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS Entries (Kind TEXT, Value TEXT, SegmentID INTEGER, Offset INTEGER, "
+    "PRIMARY KEY (Kind, Value, SegmentID, Offset)) WITHOUT ROWID",
+]
+
+
+def line_keys(message):
+    # Players, teams and commands a log message is about
+    keys = {("player", player_id) for player_id in PLAYER_ID_PATTERN.findall(message)}
+    keys.update(("team", team) for team in TEAM_PATTERN.findall(message))
+    keys.update(("command", command) for command in COMMAND_PATTERN.findall(message))
+    return keys
+
+
+def connect_index(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def segment_path(log_file, log_dir, segment_id, compressed=False):
+    name = f"{os.path.splitext(os.path.basename(log_file))[0]}.{segment_id:06d}.log"
+    return os.path.join(log_dir, name + ".gz" if compressed else name)
+
+
+def read_record(conn, log_file, log_dir, segment_id, offset, active, max_lines=50):
+    # The log record starting at the given offset, including any continuation lines such as tracebacks. The active
+    # segment is the log file itself; rotated ones are read plain until compressed, then block by block.
+    if active:
+        stream = open(log_file, 'rb')
+        stream.seek(offset)
+    else:
+        try:
+            stream = open(segment_path(log_file, log_dir, segment_id), 'rb')
+            stream.seek(offset)
+        except FileNotFoundError:
+            block = conn.execute("SELECT PlainOffset, CompressedOffset FROM Blocks WHERE SegmentID = ? "
+                                 "AND PlainOffset <= ? ORDER BY PlainOffset DESC LIMIT 1",
+                                 (segment_id, offset)).fetchone()
+            if block is None:
+                return None
+            raw = open(segment_path(log_file, log_dir, segment_id, compressed=True), 'rb')
+            raw.seek(block[1])
+            stream = gzip.GzipFile(fileobj=raw, mode='rb')
+            stream.read(offset - block[0])
+
+    with stream:
+        lines = [stream.readline()]
+        while len(lines) < max_lines:
+            line = stream.readline()
+            if not line or RECORD_START_PATTERN.match(line):
+                break
+            lines.append(line)
+    return b"".join(lines).decode('utf-8', errors='replace').rstrip("\n")
+
+
+def search(log_file, log_dir, kind, values, limit=100, handler=None):
+    # The most recent log records for any of the values, newest first. Without the handler writing the log (e.g. for
+    # another process's log), the segment still open in the index is taken to be the log file.
+    index_path = os.path.join(log_dir, "log_index.db")
+    if not os.path.exists(index_path):
+        return []
+
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, timeout=30)
+    try:
+        placeholders = ", ".join("?" for _ in values)
+        rows = conn.execute(f"SELECT SegmentID, Offset FROM Entries WHERE Kind = ? AND Value IN ({placeholders}) "
+                            f"ORDER BY SegmentID DESC, Offset DESC LIMIT ?", (kind, *values, limit)).fetchall()
+        if handler is None:
+            active_segment = conn.execute("SELECT MAX(SegmentID) FROM Segments WHERE Ended IS NULL").fetchone()[0]
+
+        records = []
+        for segment_id, offset in rows:
+            if handler is not None:
+                # Hold the handler lock so the file can't be rotated between the check and the read
+                with handler.lock:
+                    handler.flush()
+                    if segment_id == handler.segment_id:
+                        records.append(read_record(conn, log_file, log_dir, segment_id, offset, active=True))
+                        continue
+            active = handler is None and segment_id == active_segment
+            records.append(read_record(conn, log_file, log_dir, segment_id, offset, active))
+    finally:
+        conn.close()
+    return [record for record in records if record is not None]
+
+
+class SegmentedLogHandler(logging.FileHandler):
+    def __init__(self, filename, log_dir, max_bytes, max_age_seconds, block_bytes=64 * 1024):
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.block_bytes = block_bytes
+        self.index_path = os.path.join(log_dir, "log_index.db")
+        self.index_queue = queue.SimpleQueue()
+        self.compress_queue = queue.SimpleQueue()
+
+        conn = connect_index(self.index_path)
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        open_segment = conn.execute("SELECT SegmentID, Started FROM Segments WHERE Ended IS NULL "
+                                    "ORDER BY SegmentID DESC LIMIT 1").fetchone()
+        last_segment = conn.execute("SELECT COALESCE(MAX(SegmentID), 0) FROM Segments").fetchone()[0]
+        uncompressed = conn.execute("SELECT SegmentID FROM Segments WHERE Ended IS NOT NULL AND Compressed = 0 "
+                                    "ORDER BY SegmentID").fetchall()
+        conn.close()
+
+        super().__init__(filename, mode='a', encoding='utf-8')
+
+        if open_segment is not None:
+            # Carry on appending to the segment the previous run was writing
+            self.segment_id, self.segment_started = open_segment
+        else:
+            self.segment_id = last_segment
+            if self.stream.tell() > 0:
+                # A log written before the log index existed: archive it now and index it while compressing
+                self.segment_id += 1
+                self.segment_started = os.path.getmtime(self.baseFilename)
+                self.index_queue.put(("segment", self.segment_id, self.segment_started))
+                self.rotate(index_while_compressing=True)
+            else:
+                self.segment_id += 1
+                self.segment_started = time.time()
+                self.index_queue.put(("segment", self.segment_id, self.segment_started))
+
+        # Segments rotated by a run that stopped before compressing them
+        for (segment_id,) in uncompressed:
+            if os.path.exists(self.segment_path(segment_id)):
+                self.compress_queue.put((segment_id, False))
+
+        threading.Thread(target=self.indexer_main, name="log-indexer", daemon=True).start()
+        threading.Thread(target=self.compressor_main, name="log-compressor", daemon=True).start()
+
+    def segment_path(self, segment_id, compressed=False):
+        return segment_path(self.baseFilename, self.log_dir, segment_id, compressed)
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            offset = self.stream.tell()
+            if offset >= self.max_bytes or time.time() - self.segment_started >= self.max_age_seconds:
+                self.rotate()
+                offset = 0
+
+            logging.StreamHandler.emit(self, record)
+
+            keys = line_keys(record.getMessage())
+            keys.update(log_context.get())
+            if keys:
+                self.index_queue.put(("entries", [(kind, value, self.segment_id, offset) for kind, value in keys]))
+        except Exception:
+            self.handleError(record)
+
+    def rotate(self, index_while_compressing=False):
+        # Called with the handler lock held (or before any records are written)
+        self.stream.close()
+        os.replace(self.baseFilename, self.segment_path(self.segment_id))
+        ended = time.time()
+        self.index_queue.put(("ended", self.segment_id, ended))
+        self.compress_queue.put((self.segment_id, index_while_compressing))
+
+        self.segment_id += 1
+        self.segment_started = ended
+        self.index_queue.put(("segment", self.segment_id, self.segment_started))
+        self.stream = self._open()
+
+    def indexer_main(self):
+        # The only thread writing to the log index. Everything queued since the last pass is committed together.
+        conn = connect_index(self.index_path)
+        while True:
+            items = [self.index_queue.get()]
+            while True:
+                try:
+                    items.append(self.index_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                removals = []
+                with conn:
+                    for item in items:
+                        if item[0] == "entries":
+                            conn.executemany("INSERT OR IGNORE INTO Entries VALUES (?, ?, ?, ?)", item[1])
+                        elif item[0] == "segment":
+                            conn.execute("INSERT OR IGNORE INTO Segments (SegmentID, Started) VALUES (?, ?)",
+                                         item[1:])
+                        elif item[0] == "ended":
+                            conn.execute("UPDATE Segments SET Ended = ? WHERE SegmentID = ?", (item[2], item[1]))
+                        elif item[0] == "compressed":
+                            segment_id, blocks = item[1:]
+                            conn.execute("DELETE FROM Blocks WHERE SegmentID = ?", (segment_id,))
+                            conn.executemany("INSERT INTO Blocks VALUES (?, ?, ?)",
+                                             [(segment_id, plain, compressed) for plain, compressed in blocks])
+                            conn.execute("UPDATE Segments SET Compressed = 1 WHERE SegmentID = ?", (segment_id,))
+                            removals.append(self.segment_path(segment_id))
+                # The plain segment is only removed once its blocks are in the index
+                for path in removals:
+                    os.remove(path)
+            except Exception as e:
+                print(f"Log index update failed: {e}", file=sys.stderr)
+
+    def compressor_main(self):
+        while True:
+            segment_id, index_lines = self.compress_queue.get()
+            try:
+                self.compress_segment(segment_id, index_lines)
+            except Exception as e:
+                print(f"Compressing log segment {segment_id} failed: {e}", file=sys.stderr)
+
+    def compress_segment(self, segment_id, index_lines):
+        # Writes the segment as one gzip member per block of whole lines, remembering where each block starts in both
+        # the plain and compressed file
+        plain_path = self.segment_path(segment_id)
+        compressed_path = self.segment_path(segment_id, compressed=True)
+        blocks = []
+        plain_offset = 0
+        with open(plain_path, 'rb') as plain, open(compressed_path + ".tmp", 'wb') as compressed:
+            block = []
+            block_start = block_size = 0
+            for line in plain:
+                if index_lines:
+                    keys = line_keys(line.decode('utf-8', errors='replace'))
+                    if keys:
+                        self.index_queue.put(("entries", [(kind, value, segment_id, plain_offset)
+                                                          for kind, value in keys]))
+                if block_size >= self.block_bytes and RECORD_START_PATTERN.match(line):
+                    blocks.append((block_start, compressed.tell()))
+                    compressed.write(gzip.compress(b"".join(block)))
+                    block = []
+                    block_start = plain_offset
+                    block_size = 0
+                block.append(line)
+                block_size += len(line)
+                plain_offset += len(line)
+            if block:
+                blocks.append((block_start, compressed.tell()))
+                compressed.write(gzip.compress(b"".join(block)))
+            compressed.flush()
+            os.fsync(compressed.fileno())
+        os.replace(compressed_path + ".tmp", compressed_path)
+        self.index_queue.put(("compressed", segment_id, blocks))
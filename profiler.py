@@ -0,0 +1,221 @@
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+# Hot path profiler: samples the stacks of the next N invocations of a chosen slash command or scheduled task.
+# Nothing runs until a target is armed. While an invocation is being profiled, a sampling thread looks at the event
+# loop thread every interval and keeps the stack when that invocation is the one running, plus the stacks of any
+# database reads and writes running on worker threads on its behalf (see attributed()).
+#
+# Each invocation is written to its own file in the profile directory: the top functions, then every sampled stack
+# in collapsed form ("outer;inner;leaf count"), which flamegraph.pl and speedscope read as they are.
+
+SAMPLE_INTERVAL = 0.001
+PROFILE_DIR = "profiles"
+TOP_N = 15
+
+# Target -> invocations still to profile. Empty when profiling is off.
+armed = {}
+
+# Profiles being sampled, and worker thread ID -> (profile, frame it was attributed from) while one runs for it
+active = set()
+owners = {}
+lock = threading.Lock()
+state = {"thread": None, "switch_interval": None}
+
+# Finished profiles, most recent last
+finished = deque(maxlen=200)
+
+# The profile of the invocation running in this task, if any
+current = contextvars.ContextVar('profile', default=None)
+
+
+class Profile:
+    def __init__(self, target, arguments, root):
+        self.target = target
+        self.arguments = arguments
+        self.root = root
+        self.thread_id = threading.get_ident()
+        self.started = datetime.now()
+        self.started_monotonic = time.perf_counter()
+        self.wall = None
+        self.rounds = 0
+        self.stacks = Counter()
+        self.path = None
+
+
+def configure(interval, directory, top_n):
+    global SAMPLE_INTERVAL, PROFILE_DIR, TOP_N
+    SAMPLE_INTERVAL = interval
+    PROFILE_DIR = directory
+    TOP_N = top_n
+
+
+def arm(target, count):
+    armed[target] = count
+
+
+def disarm(target=None):
+    if target is None:
+        armed.clear()
+    else:
+        armed.pop(target, None)
+
+
+def begin(target, arguments, root):
+    # Starts profiling this invocation if its target is armed. root is a frame that stays on the stack for as long as
+    # the invocation runs, so its samples can be told apart from other tasks on the event loop.
+    remaining = armed.get(target)
+    if not remaining:
+        return None
+    if remaining > 1:
+        armed[target] = remaining - 1
+    else:
+        del armed[target]
+
+    profile = Profile(target, arguments, root)
+    with lock:
+        active.add(profile)
+        if state["thread"] is None:
+            # The sampler only sees the event loop thread when it gets the GIL, which a busy loop only hands over
+            # every switch interval (5 ms by default). Switch as often as we sample while profiling.
+            state["switch_interval"] = sys.getswitchinterval()
+            sys.setswitchinterval(min(SAMPLE_INTERVAL, state["switch_interval"]))
+            state["thread"] = threading.Thread(target=sampler_main, name="profiler", daemon=True)
+            state["thread"].start()
+    return profile
+
+
+def end(profile):
+    with lock:
+        active.discard(profile)
+        for thread_id, (owner, _) in list(owners.items()):
+            if owner is profile:
+                del owners[thread_id]
+        profile.wall = time.perf_counter() - profile.started_monotonic
+        profile.root = None
+        finished.append(profile)
+
+
+def attributed(function):
+    # Wraps work handed to a worker thread so it is sampled as part of the invocation that handed it over. Returns
+    # the function unchanged when this task is not being profiled.
+    profile = current.get()
+    if profile is None:
+        return function
+
+    def run(*args, **kwargs):
+        thread_id = threading.get_ident()
+        with lock:
+            owners[thread_id] = (profile, sys._getframe())
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with lock:
+                owners.pop(thread_id, None)
+
+    return run
+
+
+def stack_below(frame, root):
+    # The functions on the stack from just inside root down to the running frame, or None if root isn't on it
+    functions = []
+    while frame is not None and frame is not root:
+        code = frame.f_code
+        functions.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    if frame is None or not functions:
+        return None
+    functions.reverse()
+    return tuple(functions)
+
+
+def sampler_main():
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        frames = sys._current_frames()
+        with lock:
+            if not active:
+                sys.setswitchinterval(state["switch_interval"])
+                state["thread"] = None
+                return
+            for profile in active:
+                profile.rounds += 1
+                stack = stack_below(frames.get(profile.thread_id), profile.root)
+                if stack is not None:
+                    profile.stacks[stack] += 1
+            for thread_id, (profile, root) in owners.items():
+                stack = stack_below(frames.get(thread_id), root)
+                if stack is not None:
+                    profile.stacks[(("<worker thread>", 0, "worker"),) + stack] += 1
+        del frames
+
+
+def function_name(function):
+    filename, first_line, name = function
+    if not first_line:
+        return f"[{name}]"
+    return f"{name} ({os.path.basename(filename)}:{first_line})"
+
+
+def top_functions(stacks, top_n=None):
+    # (function, self samples, samples with the function anywhere on the stack), by self samples
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for function in set(stack):
+            inclusive[function] += count
+    ranked = sorted(inclusive, key=lambda function: (own[function], inclusive[function]), reverse=True)
+    return [(function, own[function], inclusive[function]) for function in ranked[:top_n or TOP_N]]
+
+
+def format_top(stacks, total, top_n=None):
+    lines = [f"{'self':>7}{'total':>8}  function"]
+    for function, own, inclusive in top_functions(stacks, top_n):
+        lines.append(f"{own / max(total, 1):>7.1%}{inclusive / max(total, 1):>8.1%}  {function_name(function)}")
+    return "\n".join(lines)
+
+
+def profile_filename(profile):
+    label = f"{profile.target} {profile.arguments}".strip()
+    label = re.sub(r"[^A-Za-z0-9.=-]+", "_", label).strip("_")[:120]
+    return f"{profile.started:%Y%m%d_%H%M%S_%f}_{label}.txt"
+
+
+def write_profile(profile):
+    # Runs off the event loop. Returns the path written.
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, profile_filename(profile))
+    samples = sum(profile.stacks.values())
+    lines = [
+        f"# {profile.target} {profile.arguments}".rstrip(),
+        f"# Started {profile.started:%Y-%m-%d %H:%M:%S.%f}, ran {profile.wall * 1000:.1f} ms",
+        f"# {samples} samples in {profile.rounds} rounds every {SAMPLE_INTERVAL * 1000:g} ms "
+        f"(rounds without a sample were spent waiting)",
+        "",
+        format_top(profile.stacks, samples, top_n=50),
+        "",
+        "# Collapsed stacks",
+    ]
+    for stack, count in profile.stacks.most_common():
+        lines.append(f"{';'.join(function_name(function) for function in stack)} {count}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    profile.path = path
+    return path
+
+
+def summary(target=None):
+    # Aggregated over the finished profiles of target (all targets when None): the profiles, samples and top functions
+    with lock:
+        profiles = [profile for profile in finished if target is None or profile.target == target]
+    stacks = Counter()
+    for profile in profiles:
+        stacks.update(profile.stacks)
+    return profiles, stacks
@@ -0,0 +1,489 @@
+import contextlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from urllib.request import pathname2url
+
+# Every connection keeps this many prepared statements around, enough for the whole registry below
+STATEMENT_CACHE_SIZE = 256
+
+# Page cache per connection and how much of the file is memory-mapped, so hot reads are served from mapped pages
+# instead of read() calls. Set from config.json by the bot through configure().
+PAGE_CACHE_KIB = 16 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Read-only statements timed before and after storage maintenance
+MAINTENANCE_BENCHMARK = ["all_players", "all_claims", "eligible_players", "pending_players", "indexed_players",
+                         "uncleared_claims_by_team", "teams_by_priority"]
+
+# Every SQL statement the bot runs, defined once and referenced by name. Statements only ever take values as
+# parameters so each one is prepared a single time per connection and reused from the statement cache.
+STATEMENTS = {
+    # Teams. Priority order is a monotonic sequence: the team with the lowest PrioritySeq picks first, and sending a
+    # team to the back hands it the next sequence value, a single row update. A team's priority number is its rank in
+    # that order, counted from the PrioritySeq index when read.
+    "team_priority": "SELECT (SELECT COUNT(*) FROM Teams WHERE PrioritySeq <= Team.PrioritySeq) AS Priority "
+                     "FROM Teams AS Team WHERE Team.RoleID = ?",
+    "max_priority_seq": "SELECT COALESCE(MAX(PrioritySeq), 0) FROM Teams",
+    "send_team_to_back": "UPDATE Teams SET PrioritySeq = (SELECT MAX(PrioritySeq) + 1 FROM Teams) WHERE RoleID = ?",
+    "set_team_priority_seq": "UPDATE Teams SET PrioritySeq = ? WHERE RoleID = ?",
+    "teams_by_priority": "SELECT Name, RoleID FROM Teams ORDER BY PrioritySeq",
+    "insert_team": "INSERT INTO Teams (Name, RoleID, PrioritySeq) SELECT ?, ?, COALESCE(MAX(PrioritySeq), 0) + 1 "
+                   "FROM Teams",
+    "set_team_name": "UPDATE Teams SET Name = ? WHERE RoleID = ?",
+    "set_team_role": "UPDATE Teams SET RoleID = ? WHERE RoleID = ?",
+    "set_priority_history_role": "UPDATE PriorityHistory SET RoleID = ? WHERE RoleID = ?",
+    "delete_team": "DELETE FROM Teams WHERE RoleID = ?",
+    "record_priority_change": "INSERT INTO PriorityHistory (Time, RoleID, PrioritySeq, Reason) "
+                              "SELECT ?, RoleID, PrioritySeq, ? FROM Teams WHERE RoleID = ?",
+    # The order at a given time is every team's latest sequence value from before then. SQLite returns the other
+    # columns from the row holding MAX(ChangeID).
+    "priority_at_time": "SELECT Teams.Name, History.RoleID, History.Time, History.Reason FROM "
+                        "(SELECT RoleID, PrioritySeq, Time, Reason, MAX(ChangeID) FROM PriorityHistory "
+                        "WHERE Time <= ? GROUP BY RoleID) AS History "
+                        "LEFT JOIN Teams ON Teams.RoleID = History.RoleID ORDER BY History.PrioritySeq",
+
+    # Players
+    "player_by_id": "SELECT * FROM Players WHERE PlayerID = ?",
+    "player_name": "SELECT PlayerName FROM Players WHERE PlayerID = ?",
+    "player_status": "SELECT Status FROM Players WHERE PlayerID = ?",
+    "player_announcement_details": "SELECT PlayerName, Position, PageURL FROM Players WHERE PlayerID = ?",
+    "player_awaiting_clearing": "SELECT PlayerID FROM Players WHERE PlayerID = ? AND (Cleared IS NULL OR Cleared = '') "
+                                "AND Announced = 'Y'",
+    "all_players": "SELECT * FROM Players",
+    "players_to_announce": "SELECT * FROM Players WHERE Announced = 'N' OR Announced = '1'",
+    "eligible_players": "SELECT * FROM Players WHERE Announced = 'Y' "
+                        "AND (Status = 'Available' OR Status = 'Free Claim')",
+    "pending_players": "SELECT * FROM Players WHERE Announced = 'N' AND Status = 'Pending'",
+    "count_available_players": "SELECT COUNT(*) FROM Players WHERE Status = 'Available'",
+    "max_player_id": "SELECT MAX(PlayerID) FROM Players",
+    "insert_player": "INSERT INTO Players (PlayerID, PlayerName, Position, PageURL, TimeEntered, Status, Announced) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "announce_player": "UPDATE Players SET Status = 'Available', Announced = 'Y', TimeAnnounced = ?, TimeClearing = ? "
+                       "WHERE PlayerID = ?",
+    "mark_player_claimed": "UPDATE Players SET Status = 'Claimed', Cleared = 'Y', Claimed = 'Y', SuccessfulTeamID = ? "
+                           "WHERE PlayerID = ?",
+    "mark_player_free_claim": "UPDATE Players SET Status = 'Free Claim' WHERE PlayerID = ?",
+    "delete_player": "DELETE FROM Players WHERE PlayerID = ?",
+    "indexed_players": "SELECT PlayerID, PlayerName, Position, Status, Announced, Cleared FROM Players "
+                       "WHERE Status != 'Claimed'",
+    "indexed_player": "SELECT PlayerID, PlayerName, Position, Status, Announced, Cleared FROM Players "
+                      "WHERE PlayerID = ? AND Status != 'Claimed'",
+    # Full-text player search, best match first. Name matches count more than position or roster page matches.
+    "search_players": "SELECT Players.PlayerID, Players.PlayerName, Players.Position, Players.PageURL, Players.Status "
+                      "FROM PlayersFTS INNER JOIN Players ON Players.PlayerID = PlayersFTS.rowid "
+                      "WHERE PlayersFTS MATCH ? AND (? IS NULL OR Players.Status = ?) "
+                      "ORDER BY bm25(PlayersFTS, 10.0, 2.0, 1.0) LIMIT ?",
+
+    # Claims
+    "all_claims": "SELECT * FROM Claims",
+    "count_team_claims_for_player": "SELECT COUNT(*) FROM Claims WHERE PlayerID = ? AND TeamID = ?",
+    "team_claim_for_player": "SELECT * FROM Claims WHERE PlayerID = ? AND TeamID = ?",
+    "team_available_claim_preferences": "SELECT ClaimOrderPreference FROM Claims "
+                                        "INNER JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                                        "WHERE TeamID = ? AND Players.Status = 'Available'",
+    "team_claims_for_uncleared_players": "SELECT Claims.PlayerID, Claims.ClaimType, Claims.ClaimOrderPreference, "
+                                         "Players.PlayerName, Players.Position FROM Claims "
+                                         "INNER JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                                         "WHERE Claims.TeamID = ? AND (Players.Cleared IS NULL OR Players.Cleared = 0) "
+                                         "AND (Players.Claimed IS NULL OR Players.Claimed = 0) "
+                                         "ORDER BY Claims.ClaimOrderPreference",
+    "recent_team_claims": "SELECT Claims.PlayerID, Claims.Time, Claims.ClaimType, Claims.ClaimOrderPreference, "
+                          "Claims.Successful, Players.PlayerName, Players.Position FROM Claims "
+                          "INNER JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                          "WHERE Claims.TeamID = ? ORDER BY Claims.Time DESC LIMIT 10",
+    "insert_normal_claim": "INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, ClaimOrderPreference) "
+                           "VALUES (?, ?, ?, ?, 'normal', ?)",
+    "insert_quick_claim": "INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, Successful) "
+                          "VALUES (?, ?, ?, ?, 'quick', 'Y')",
+    "insert_free_claim": "INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, ClaimOrderPreference, "
+                         "Successful) VALUES (?, ?, ?, ?, 'free', 'free', 'Y')",
+    "mark_claim_successful": "UPDATE Claims SET Successful = 'Y', Unsuccessful = 'N' WHERE PlayerID = ? AND TeamID = ?",
+    "mark_other_claims_unsuccessful": "UPDATE Claims SET Successful = 'N', Unsuccessful = 'Y' "
+                                      "WHERE PlayerID = ? AND TeamID != ?",
+    "move_claims_up_between": "UPDATE Claims SET ClaimOrderPreference = ClaimOrderPreference - 1 WHERE TeamID = ? "
+                              "AND ClaimOrderPreference BETWEEN ? AND ?",
+    "move_claims_down_between": "UPDATE Claims SET ClaimOrderPreference = ClaimOrderPreference + 1 WHERE TeamID = ? "
+                                "AND ClaimOrderPreference BETWEEN ? AND ?",
+    "move_claims_up_after": "UPDATE Claims SET ClaimOrderPreference = ClaimOrderPreference - 1 WHERE TeamID = ? "
+                            "AND ClaimOrderPreference > ?",
+    "set_claim_preference": "UPDATE Claims SET ClaimOrderPreference = ? WHERE PlayerID = ? AND TeamID = ?",
+    "delete_team_claim": "DELETE FROM Claims WHERE PlayerID = ? AND TeamID = ?",
+    "delete_player_claims": "DELETE FROM Claims WHERE PlayerID = ?",
+    "set_claims_team": "UPDATE Claims SET TeamID = ? WHERE TeamID = ?",
+    "count_team_open_claims": "SELECT COUNT(*) FROM Claims INNER JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                              "WHERE Claims.TeamID = ? AND Players.Status != 'Claimed'",
+    "indexed_claims": "SELECT Claims.PlayerID, Claims.TeamID FROM Claims "
+                      "INNER JOIN Players ON Claims.PlayerID = Players.PlayerID WHERE Players.Status != 'Claimed'",
+    "claim_teams_for_player": "SELECT TeamID FROM Claims WHERE PlayerID = ?",
+    # Every team's claims for uncleared players in one pass, in the same order as team_claims_for_uncleared_players
+    "uncleared_claims_by_team": "SELECT Claims.TeamID, Claims.PlayerID, Claims.ClaimType, Claims.ClaimOrderPreference, "
+                                "Players.PlayerName, Players.Position FROM Claims "
+                                "INNER JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                                "WHERE (Players.Cleared IS NULL OR Players.Cleared = 0) "
+                                "AND (Players.Claimed IS NULL OR Players.Claimed = 0) "
+                                "ORDER BY Claims.TeamID, Claims.ClaimOrderPreference",
+    # Players awarded most recently. Normal claims are awarded when the player clears, the others when lodged.
+    "recent_results": "SELECT Players.PlayerID, Players.PlayerName, Players.Position, Claims.TeamID, Claims.ClaimType, "
+                      "CASE WHEN Claims.ClaimType = 'normal' THEN Players.TimeClearing ELSE Claims.Time END "
+                      "AS ClaimedAt "
+                      "FROM Claims INNER JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                      "WHERE Claims.Successful = 'Y' ORDER BY ClaimedAt DESC LIMIT ?",
+    "claim_digest_hashes": "SELECT TeamID, Hash FROM ClaimDigests",
+    "set_claim_digest_hash": "INSERT INTO ClaimDigests (TeamID, Hash, Sent) VALUES (?, ?, ?) "
+                             "ON CONFLICT (TeamID) DO UPDATE SET Hash = excluded.Hash, Sent = excluded.Sent",
+
+    # Scheduler lease. An instance takes the lease when it already holds it or the holder's lease has expired.
+    "scheduler_lease": "SELECT Holder, Expires, Heartbeat, Acquired FROM SchedulerLease WHERE Name = 'scheduler'",
+    "renew_scheduler_lease": "UPDATE SchedulerLease SET Holder = ?, Expires = ?, Heartbeat = ?, "
+                             "Acquired = CASE WHEN Holder = ? THEN Acquired ELSE ? END "
+                             "WHERE Name = 'scheduler' AND (Holder = ? OR Expires < ?)",
+    # Taken unconditionally while a backup is restored, then handed back by letting it expire
+    "take_scheduler_lease": "UPDATE SchedulerLease SET Holder = ?, Expires = ?, Heartbeat = ?, Acquired = ? "
+                            "WHERE Name = 'scheduler'",
+    "release_scheduler_lease": "UPDATE SchedulerLease SET Expires = 0 WHERE Name = 'scheduler' AND Holder = ?",
+
+    # Paused scheduled tasks, read by every process at the start of each pass
+    "paused_tasks": "SELECT Task FROM TaskState WHERE Paused = 1",
+    "task_paused": "SELECT Paused FROM TaskState WHERE Task = ?",
+    "set_task_paused": "UPDATE TaskState SET Paused = ? WHERE Task = ?",
+
+    # Season report. Time to clear is measured from the announcement to the winning quick or free claim, or to the
+    # clearing time for everything else.
+    "report_team_summary": "SELECT Claims.TeamID, COUNT(*) AS ClaimCount, "
+                           "SUM(Claims.Successful = 'Y') AS SuccessfulClaims, "
+                           "SUM(Claims.ClaimType = 'normal') AS NormalClaims, "
+                           "SUM(Claims.ClaimType = 'quick') AS QuickClaims, "
+                           "SUM(Claims.ClaimType = 'free') AS FreeClaims, "
+                           "AVG(CASE WHEN Claims.Successful = 'Y' THEN (julianday(CASE WHEN Claims.ClaimType = 'normal' "
+                           "THEN Players.TimeClearing ELSE Claims.Time END) - julianday(Players.TimeAnnounced)) * 24 "
+                           "END) AS AverageHoursToClear "
+                           "FROM Claims LEFT JOIN Players ON Claims.PlayerID = Players.PlayerID "
+                           "WHERE Claims.Time >= ? GROUP BY Claims.TeamID ORDER BY Claims.TeamID",
+    "report_players": "SELECT Players.PlayerID, Players.PlayerName, Players.Position, Players.Status, "
+                      "Players.TimeEntered, Players.TimeAnnounced, Players.TimeClearing, Players.SuccessfulTeamID, "
+                      "COUNT(Claims.PlayerID) AS ClaimCount, "
+                      "MAX(CASE WHEN Claims.Successful = 'Y' THEN Claims.ClaimType END) AS WinningClaimType, "
+                      "CASE WHEN Players.Status IN ('Claimed', 'Free Claim') THEN "
+                      "(julianday(COALESCE(MAX(CASE WHEN Claims.Successful = 'Y' AND Claims.ClaimType != 'normal' "
+                      "THEN Claims.Time END), Players.TimeClearing)) - julianday(Players.TimeAnnounced)) * 24 "
+                      "END AS HoursToClear "
+                      "FROM Players LEFT JOIN Claims ON Claims.PlayerID = Players.PlayerID "
+                      "WHERE Players.TimeEntered >= ? GROUP BY Players.PlayerID ORDER BY Players.PlayerID",
+}
+
+# Schema changes on top of the original tables, applied in order the first time the bot opens a database. Each
+# migration is skipped once its table has the given column, or the schema has an index or view of that name.
+MIGRATIONS = [
+    ("Teams", "PrioritySeq", [
+        "ALTER TABLE Teams ADD COLUMN PrioritySeq INTEGER",
+        "UPDATE Teams SET PrioritySeq = Priority",
+        "CREATE INDEX IF NOT EXISTS TeamsPrioritySeq ON Teams (PrioritySeq)",
+        "CREATE TABLE IF NOT EXISTS PriorityHistory (ChangeID INTEGER PRIMARY KEY AUTOINCREMENT, Time TEXT, "
+        "RoleID TEXT, PrioritySeq INTEGER, Reason TEXT)",
+        "CREATE INDEX IF NOT EXISTS PriorityHistoryTime ON PriorityHistory (Time)",
+        "INSERT INTO PriorityHistory (Time, RoleID, PrioritySeq, Reason) "
+        "SELECT datetime('now', 'localtime'), RoleID, PrioritySeq, 'initial' FROM Teams",
+    ]),
+    # Full-text index over the Players table, kept in step with it by triggers. Names are matched without accents,
+    # and one and two character prefixes are indexed so prefix queries stay an index lookup.
+    ("PlayersFTS", "PlayerName", [
+        "CREATE VIRTUAL TABLE PlayersFTS USING fts5(PlayerName, Position, PageURL, content='Players', "
+        "content_rowid='PlayerID', prefix='1 2', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER PlayersFTSInsert AFTER INSERT ON Players BEGIN "
+        "INSERT INTO PlayersFTS (rowid, PlayerName, Position, PageURL) "
+        "VALUES (new.PlayerID, new.PlayerName, new.Position, new.PageURL); END",
+        "CREATE TRIGGER PlayersFTSDelete AFTER DELETE ON Players BEGIN "
+        "INSERT INTO PlayersFTS (PlayersFTS, rowid, PlayerName, Position, PageURL) "
+        "VALUES ('delete', old.PlayerID, old.PlayerName, old.Position, old.PageURL); END",
+        "CREATE TRIGGER PlayersFTSUpdate AFTER UPDATE OF PlayerID, PlayerName, Position, PageURL ON Players BEGIN "
+        "INSERT INTO PlayersFTS (PlayersFTS, rowid, PlayerName, Position, PageURL) "
+        "VALUES ('delete', old.PlayerID, old.PlayerName, old.Position, old.PageURL); "
+        "INSERT INTO PlayersFTS (rowid, PlayerName, Position, PageURL) "
+        "VALUES (new.PlayerID, new.PlayerName, new.Position, new.PageURL); END",
+        "INSERT INTO PlayersFTS (PlayersFTS) VALUES ('rebuild')",
+    ]),
+    # The claim list each team was last sent, so digests only go out when it changes
+    ("ClaimDigests", "Hash", [
+        "CREATE TABLE ClaimDigests (TeamID TEXT PRIMARY KEY, Hash TEXT, Sent TEXT)",
+    ]),
+    # Which instance runs the scheduled tasks, and until when (Unix time)
+    ("SchedulerLease", "Holder", [
+        "CREATE TABLE SchedulerLease (Name TEXT PRIMARY KEY, Holder TEXT, Expires REAL, Heartbeat REAL, Acquired REAL)",
+        "INSERT INTO SchedulerLease (Name, Holder, Expires, Heartbeat, Acquired) VALUES ('scheduler', NULL, 0, 0, 0)",
+    ]),
+    # Whether each scheduled task is paused, shared by the interactive and scheduler processes
+    ("TaskState", "Paused", [
+        "CREATE TABLE TaskState (Task TEXT PRIMARY KEY, Paused INTEGER NOT NULL DEFAULT 0)",
+        "INSERT INTO TaskState (Task, Paused) VALUES ('announcements', 0), ('clearing', 0)",
+    ]),
+    # Claims are looked up by player and by team, teams by role
+    ("Claims", "ClaimsPlayerTeam", [
+        "CREATE INDEX IF NOT EXISTS ClaimsPlayerTeam ON Claims (PlayerID, TeamID)",
+        "CREATE INDEX IF NOT EXISTS ClaimsTeamPreference ON Claims (TeamID, ClaimOrderPreference)",
+        "CREATE INDEX IF NOT EXISTS TeamsRoleID ON Teams (RoleID)",
+    ]),
+    # The stored Priority column stopped being written once the order moved to PrioritySeq, so it is dropped (with the
+    # triggers that briefly renumbered it) and the ranks are computed when read. TeamPriorities shows them for anyone
+    # reading the database directly.
+    ("Teams", "TeamPriorities", [
+        "DROP TRIGGER IF EXISTS TeamsPriorityInsert",
+        "DROP TRIGGER IF EXISTS TeamsPriorityDelete",
+        "DROP TRIGGER IF EXISTS TeamsPriorityUpdate",
+        "ALTER TABLE Teams DROP COLUMN Priority",
+        "CREATE VIEW TeamPriorities AS SELECT Name, RoleID, PrioritySeq, "
+        "RANK() OVER (ORDER BY PrioritySeq) AS Priority FROM Teams",
+    ]),
+]
+
+# Other storage backends, by database path prefix: prefix -> function(path, readonly) returning an sqlite3 connection
+# to a database that isn't a file, e.g. an in-memory copy (see storage.py). Any other path is an SQLite database file.
+BACKENDS = {}
+
+# Per statement timing: name -> [executions, total seconds, slowest seconds]
+statement_timings = {}
+statement_timings_lock = threading.Lock()
+
+# One read-write and one read-only connection per thread and database file, so the statement cache survives between
+# commands
+connection_cache = threading.local()
+
+# Database files already prepared by this process
+prepared_paths = set()
+prepared_paths_lock = threading.Lock()
+
+
+def configure(page_cache_kib, mmap_size):
+    global PAGE_CACHE_KIB, MMAP_SIZE
+    PAGE_CACHE_KIB = page_cache_kib
+    MMAP_SIZE = mmap_size
+
+
+def tune(conn):
+    conn.execute(f"PRAGMA cache_size = -{int(PAGE_CACHE_KIB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(MMAP_SIZE)}")
+
+
+def backend(path):
+    for prefix, open_connection in BACKENDS.items():
+        if path.startswith(prefix):
+            return open_connection
+    return None
+
+
+def connect(path):
+    open_connection = backend(path)
+    if open_connection is not None:
+        return open_connection(path, False)
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    tune(conn)
+    return conn
+
+
+def prepare(path, force=False):
+    # Switch the database to write-ahead logging, so readers work from a snapshot and never wait for the writer, and
+    # apply any pending migrations. Done once per process, or again when the file was replaced (e.g. by a restore).
+    if backend(path) is not None:
+        return
+    with prepared_paths_lock:
+        if path in prepared_paths and not force:
+            return
+        conn = connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            migrate(conn)
+        finally:
+            conn.close()
+        prepared_paths.add(path)
+
+
+def connection(path):
+    connections = connection_cache.__dict__.setdefault("connections", {})
+    if path not in connections:
+        prepare(path)
+        connections[path] = connect(path)
+    return connections[path]
+
+
+def reader(path):
+    # Read-only connection for this thread. It can never take a write lock, so it never blocks the writer either.
+    readers = connection_cache.__dict__.setdefault("readers", {})
+    if path not in readers and backend(path) is not None:
+        readers[path] = backend(path)(path, True)
+    elif path not in readers:
+        prepare(path)
+        readers[path] = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True,
+                                        cached_statements=STATEMENT_CACHE_SIZE)
+        readers[path].row_factory = sqlite3.Row
+        tune(readers[path])
+    return readers[path]
+
+
+@contextlib.contextmanager
+def snapshot(path):
+    # Every query inside the block reads the same committed state of the database
+    conn = reader(path)
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+def migrate(conn):
+    # Every migration runs in one transaction, so a failure leaves the schema as it was
+    schema_names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    for table, column, statements in MIGRATIONS:
+        if column in schema_names or column in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+            continue
+        with conn:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+
+
+def record_timing(name, elapsed):
+    with statement_timings_lock:
+        timing = statement_timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+
+def execute(conn, name, params=()):
+    started = time.perf_counter()
+    try:
+        return conn.execute(STATEMENTS[name], params)
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+
+def executemany(conn, name, param_rows):
+    started = time.perf_counter()
+    try:
+        return conn.executemany(STATEMENTS[name], param_rows)
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+
+def fetchone(conn, name, params=()):
+    started = time.perf_counter()
+    try:
+        return conn.execute(STATEMENTS[name], params).fetchone()
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+
+def fetchall(conn, name, params=()):
+    started = time.perf_counter()
+    try:
+        return conn.execute(STATEMENTS[name], params).fetchall()
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+
+def iterate(conn, name, params=()):
+    # Stream rows straight from the cursor so large result sets never sit in memory at once
+    started = time.perf_counter()
+    try:
+        yield from conn.execute(STATEMENTS[name], params)
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+
+def timing_report():
+    # Statements sorted by the total time spent in them
+    with statement_timings_lock:
+        timings = [(name, count, total, slowest) for name, (count, total, slowest) in statement_timings.items()]
+    return sorted(timings, key=lambda timing: timing[2], reverse=True)
+
+
+def benchmark(conn):
+    # Best of three runs of each benchmark statement, in seconds
+    timings = {}
+    for name in MAINTENANCE_BENCHMARK:
+        runs = []
+        for _ in range(3):
+            started = time.perf_counter()
+            conn.execute(STATEMENTS[name]).fetchall()
+            runs.append(time.perf_counter() - started)
+        timings[name] = min(runs)
+    return timings
+
+
+def maintain(path):
+    # Planner statistics, space reclaimed from deleted rows and a WAL checkpoint. Must run on the thread that owns the
+    # writer connection, between transactions. Returns (step, seconds, detail) for every step, plus the benchmark
+    # timings from before and after.
+    conn = connection(path)
+    steps = []
+    before = benchmark(conn)
+
+    started = time.perf_counter()
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0]:
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("PRAGMA optimize")
+        steps.append(("optimize", time.perf_counter() - started, "re-analyzed tables whose statistics were stale"))
+    else:
+        conn.execute("ANALYZE")
+        steps.append(("analyze", time.perf_counter() - started, "first full ANALYZE"))
+
+    # Free pages are only released on databases already switched to incremental auto-vacuum. The switch needs a full
+    # VACUUM, which rewrites the whole file, so it is left to enable_incremental_vacuum() with the bot stopped.
+    started = time.perf_counter()
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+        steps.append(("incremental_vacuum", time.perf_counter() - started, f"{free_pages} free pages released"))
+    else:
+        steps.append(("incremental_vacuum", 0.0, f"skipped, {free_pages} free pages kept as auto-vacuum is off "
+                                                 f"(python queries.py --incremental-vacuum enables it)"))
+
+    started = time.perf_counter()
+    busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    steps.append(("wal_checkpoint", time.perf_counter() - started,
+                  f"{checkpointed} of {wal_pages} WAL pages checkpointed{', blocked by a reader' if busy else ''}"))
+
+    after = benchmark(conn)
+    return steps, before, after
+
+
+def enable_incremental_vacuum(path):
+    # One-off conversion, to run with the bot stopped: incremental auto-vacuum only takes effect after a full VACUUM,
+    # which rewrites the whole file. Returns the seconds it took.
+    conn = connect(path)
+    try:
+        started = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return time.perf_counter() - started
+    finally:
+        conn.close()
+
+
+def explain_all(conn):
+    # Query plan of every registered statement, with NULL standing in for each parameter
+    plans = {}
+    for name, sql in STATEMENTS.items():
+        params = (None,) * sql.count("?")
+        plans[name] = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    return plans
+
+
+if __name__ == "__main__":
+    # Print the query plan of every statement against a database, e.g. python queries.py waiverbot.db, or switch it to
+    # incremental auto-vacuum with --incremental-vacuum
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    db_path = arguments[0] if arguments else "waiverbot.db"
+    if "--incremental-vacuum" in sys.argv:
+        print(f"Switched {db_path} to incremental auto-vacuum in {enable_incremental_vacuum(db_path):.2f}s")
+        sys.exit(0)
+    db_conn = connect(db_path)
+    migrate(db_conn)
+    for statement_name, plan in explain_all(db_conn).items():
+        print(f"{statement_name}:")
+        for step in plan:
+            print(f"    {step}")
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+# Replays the command traffic recorded in discord_bot.log against a local copy of waiverbot.db.
+# Run it from the bot directory (it imports WaiverBotv3, which reads config.json), e.g.
+#   python replay_trace.py --log discord_bot.log --db waiverbot.db --speed 10
+
+LOG_LINE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(\d{3}):(\w+):discord_bot: (.*)$")
+
+# Each entry maps a log message written at the start of a command or tick to a trace event
+EVENT_PATTERNS = [
+    ("input", re.compile(r"^(?P<author>.+) is starting to add Player (?P<name>.+) \((?P<position>[^)]+)\)$")),
+    ("claim", re.compile(r"^(?P<author>.+) is starting to claim Player with ID (?P<player_id>\d+) "
+                         r"using a (?P<type_of_claim>\w+) claim$")),
+    ("prioritylist", re.compile(r"^(?P<author>.+) is requesting the priority list$")),
+    ("priorityat", re.compile(r"^(?P<author>.+) is requesting the priority list at (?P<when>.+)$")),
+    ("currentteamclaims", re.compile(r"^(?P<author>.+) is requesting the current claims for team (?P<team_code>\w+)$")),
+    ("playerlist", re.compile(r"^(?P<author>.+) is requesting the list of eligible players$")),
+    ("pendingplayers", re.compile(r"^(?P<author>.+) is requesting the list of pending players$")),
+    ("teamclaimhistory", re.compile(r"^(?P<author>.+) is requesting the claims history$")),
+    ("adjustclaims", re.compile(r"^(?P<author>.+) is trying to adjust the claims for Player ID (?P<playerid>\d+)$")),
+    ("tick:find_clearing_players", re.compile(r"^Starting find_clearing_players loop\.\.\.$")),
+    ("tick:announcement_task", re.compile(r"^Starting announcement_task loop\.\.\.$")),
+]
+
+# Log messages that tell us which team an author belongs to, or the outcome of an adjustment
+TEAM_PATTERN = re.compile(r"^(?P<author>.+) \((?P<team>\w+)\) (claimed Player|adjusted the claim) ")
+ADJUST_ACTION_PATTERN = re.compile(r"^(?P<author>.+) \((?P<team>\w+)\) adjusted the claim for Player with ID "
+                                   r"(?P<playerid>\d+) with action (?P<action>\w+)$")
+ROOKIE_MENTOR_PATTERN = re.compile(r"^(?P<author>.+) (is starting to add Player|set team priorities|"
+                                   r"paused all tasks|unpaused all tasks)")
+
+# The start of any command's log message, so commands the trace can't replay are reported rather than dropped
+COMMAND_PATTERN = re.compile(r"^.+? is (?P<command>(requesting|starting to|trying to|searching for) \w+( \w+)?)")
+
+
+def parse_log(log_path, start=None, end=None):
+    events = []
+    author_teams = {}
+    rookie_mentors = set()
+    pending_adjustments = {}
+    unmatched = Counter()
+
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as log_file:
+        for line in log_file:
+            match = LOG_LINE_PATTERN.match(line.rstrip("\n"))
+            if not match:
+                continue
+
+            timestamp = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timestamp() + int(match.group(2)) / 1000
+            if (start and timestamp < start) or (end and timestamp > end):
+                continue
+            message = match.group(4)
+
+            team_match = TEAM_PATTERN.match(message)
+            if team_match:
+                author_teams[team_match.group("author")] = team_match.group("team")
+
+            rookie_mentor_match = ROOKIE_MENTOR_PATTERN.match(message)
+            if rookie_mentor_match:
+                rookie_mentors.add(rookie_mentor_match.group("author"))
+
+            # The adjustclaims action is only logged once the command finishes, so fill it in afterwards
+            action_match = ADJUST_ACTION_PATTERN.match(message)
+            if action_match:
+                event = pending_adjustments.pop((action_match.group("author"), action_match.group("playerid")), None)
+                if event:
+                    event["args"]["action"] = action_match.group("action")
+                continue
+
+            for kind, pattern in EVENT_PATTERNS:
+                event_match = pattern.match(message)
+                if not event_match:
+                    continue
+
+                args = event_match.groupdict()
+                author = args.pop("author", None)
+                event = {"time": timestamp, "kind": kind, "author": author, "args": args}
+                if kind == "input":
+                    # Roster page URLs are not logged
+                    args["pageurl"] = ""
+                elif kind == "adjustclaims":
+                    # The new preference is never logged, so adjustments are replayed as a move to the top
+                    args["action"] = "adjust"
+                    args["new_priority"] = 1
+                    pending_adjustments[(author, args["playerid"])] = event
+                events.append(event)
+                break
+            else:
+                command_match = COMMAND_PATTERN.match(message)
+                if command_match:
+                    unmatched[command_match.group("command")] += 1
+
+    for event in events:
+        for key in ("player_id", "playerid"):
+            if key in event["args"]:
+                event["args"][key] = int(event["args"][key])
+
+    return events, author_teams, rookie_mentors, unmatched
+
+
+def peak_rate(events, window=60):
+    # Largest number of commands that arrived within any window of the trace
+    times = [event["time"] for event in events if not event["kind"].startswith("tick:")]
+    best = 0
+    first = 0
+    for last in range(len(times)):
+        while times[last] - times[first] > window:
+            first += 1
+        best = max(best, last - first + 1)
+    return best
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class StandInRole:
+    def __init__(self, role_id):
+        self.id = int(role_id)
+
+
+class StandInMember:
+    def __init__(self, name, role_ids):
+        self.name = name
+        self.roles = [StandInRole(role_id) for role_id in role_ids]
+
+    def __str__(self):
+        return self.name
+
+
+class StandInChannel:
+    def __init__(self, api_latency):
+        self.api_latency = api_latency
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        self.sent += 1
+
+
+class StandInContext:
+    # Records when the bot first answered the interaction, which is what Discord's 3 second deadline applies to
+    def __init__(self, author, api_latency):
+        self.author = author
+        self.api_latency = api_latency
+        self.started = time.perf_counter()
+        self.first_response = None
+        self.responses = 0
+
+    async def defer(self, *args, **kwargs):
+        await self._answer()
+
+    async def respond(self, *args, **kwargs):
+        await self._answer()
+        self.responses += 1
+
+    async def _answer(self):
+        await asyncio.sleep(self.api_latency)
+        if self.first_response is None:
+            self.first_response = time.perf_counter() - self.started
+
+
+async def replay(events, author_teams, rookie_mentors, speed, api_latency):
+    import WaiverBotv3
+    import clock
+
+    channel = StandInChannel(api_latency)
+    WaiverBotv3.bot.get_channel = lambda channel_id: channel
+
+    commands = {
+        "input": WaiverBotv3.input_player,
+        "claim": WaiverBotv3.claim_player,
+        "prioritylist": WaiverBotv3.priority_list,
+        "priorityat": WaiverBotv3.priority_at,
+        "currentteamclaims": WaiverBotv3.current_team_claims,
+        "playerlist": WaiverBotv3.player_list,
+        "pendingplayers": WaiverBotv3.pending_players,
+        "teamclaimhistory": WaiverBotv3.team_claims_history,
+        "adjustclaims": WaiverBotv3.adjust_claims,
+    }
+    results = {}
+    pending = set()
+
+    def author_for(name):
+        role_ids = []
+        team = author_teams.get(name)
+        if team in WaiverBotv3.TEAMS_DICT:
+            role_ids.append(WaiverBotv3.TEAMS_DICT[team])
+        if name in rookie_mentors:
+            role_ids.append(WaiverBotv3.ROLES_DICT["Rookie Mentor"])
+        return StandInMember(name, role_ids)
+
+    async def run_command(event):
+        ctx = StandInContext(author_for(event["author"]), api_latency)
+        error = None
+        try:
+            await commands[event["kind"]].callback(ctx, **event["args"])
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - ctx.started
+        results.setdefault(event["kind"], []).append((elapsed, ctx.first_response, error))
+
+    async def run_tick(kind):
+        # Every pass is logged, including the follow-up passes after an award, so replay the passes themselves. The
+        # announcement task also sleeps until its window opens.
+        if kind == "tick:find_clearing_players":
+            tick = WaiverBotv3.run_clearing_pass
+        else:
+            tick = WaiverBotv3.run_announcement_pass
+        started = time.perf_counter()
+        error = None
+        try:
+            await tick()
+        except Exception as e:
+            error = e
+        results.setdefault(kind, []).append((time.perf_counter() - started, None, error))
+
+    # The bot runs on a manual clock set to each event's recorded time before the event is dispatched, so clearing
+    # times, announcement windows and priority changes follow the trace rather than the time of the replay
+    trace_start = events[0]["time"]
+    clock.configure("manual", trace_start)
+    wall_start = time.perf_counter()
+    for event in events:
+        if speed > 0:
+            delay = (event["time"] - trace_start) / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await clock.advance_to(event["time"])
+
+        if event["kind"].startswith("tick:"):
+            task = asyncio.create_task(run_tick(event["kind"]))
+        else:
+            task = asyncio.create_task(run_command(event))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    while pending:
+        await asyncio.gather(*list(pending))
+
+    return results, time.perf_counter() - wall_start, channel.sent
+
+
+def format_report(events, results, wall_time, messages_sent, speed):
+    trace_span = events[-1]["time"] - events[0]["time"]
+    lines = [
+        f"Replayed {len(events)} events spanning {trace_span:.0f}s of production time in {wall_time:.1f}s "
+        f"(speed {'max' if speed <= 0 else f'{speed:g}x'}).",
+        f"Peak production load: {peak_rate(events)} commands in a single minute.",
+        f"Messages sent to the announcement channel: {messages_sent}",
+        "",
+        f"{'event':<28}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'1st reply p95':>15}",
+    ]
+    for kind in sorted(results):
+        samples = results[kind]
+        latencies = [sample[0] * 1000 for sample in samples]
+        first_responses = [sample[1] * 1000 for sample in samples if sample[1] is not None]
+        errors = sum(1 for sample in samples if sample[2] is not None)
+        first_response = f"{percentile(first_responses, 0.95):.1f}" if first_responses else "-"
+        lines.append(f"{kind:<28}{len(samples):>7}{errors:>8}{percentile(latencies, 0.5):>10.1f}"
+                     f"{percentile(latencies, 0.95):>10.1f}{percentile(latencies, 0.99):>10.1f}"
+                     f"{max(latencies):>10.1f}{first_response:>15}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay production traffic from discord_bot.log against a copy "
+                                                 "of the database.")
+    parser.add_argument('--log', default='discord_bot.log', help="Production log to build the trace from.")
+    parser.add_argument('--db', default='waiverbot.db', help="Database to copy before replaying.")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed multiplier. 1 replays in real time, 0 replays as fast as possible.")
+    parser.add_argument('--start', help="Only replay events at or after this time (YYYY-MM-DD HH:MM:SS).")
+    parser.add_argument('--end', help="Only replay events at or before this time (YYYY-MM-DD HH:MM:SS).")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0,
+                        help="Simulated round trip for every call to the stand-in Discord API.")
+    parser.add_argument('--backend', choices=['sqlite', 'memory'], default='sqlite',
+                        help="Replay against a copy of the database file, or an in-memory copy of it that never "
+                             "touches the disk (no faster, see storage.py).")
+    parser.add_argument('--keep-db', action='store_true', help="Keep the replayed copy of the database.")
+    parser.add_argument('--json', help="Also write the raw latency samples to this file.")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S').timestamp() if args.start else None
+    end = datetime.strptime(args.end, '%Y-%m-%d %H:%M:%S').timestamp() if args.end else None
+    events, author_teams, rookie_mentors, unmatched = parse_log(args.log, start, end)
+    if unmatched:
+        print(f"Skipped {sum(unmatched.values())} command lines the replay has no pattern for: "
+              + ", ".join(f"'{command}' x{count}" for command, count in unmatched.most_common()))
+    if not events:
+        print("No replayable events found in the log.")
+        return
+
+    # Copy the database with the online backup API so a running bot is not disturbed
+    work_dir = tempfile.mkdtemp(prefix="waiverbot-replay-")
+    replay_db = os.path.join(work_dir, "waiverbot.db")
+    source = sqlite3.connect(args.db)
+    target = sqlite3.connect(replay_db)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    import WaiverBotv3
+    if args.backend == 'memory':
+        import storage
+        WaiverBotv3.DB_PATH = storage.load(replay_db)
+    else:
+        WaiverBotv3.DB_PATH = replay_db
+
+    # Keep the bot's own logging (it is part of the cost) but send it to the work directory. Importing the bot never
+    # opens the production log; only running it does (see setup_logging).
+    replay_handler = logging.FileHandler(os.path.join(work_dir, "replay_bot.log"), encoding='utf-8')
+    replay_handler.setFormatter(WaiverBotv3.log_formatter)
+    WaiverBotv3.logger.addHandler(replay_handler)
+
+    results, wall_time, messages_sent = asyncio.run(
+        replay(events, author_teams, rookie_mentors, args.speed, args.api_latency_ms / 1000))
+    print(format_report(events, results, wall_time, messages_sent, args.speed))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({kind: [{"latency": sample[0], "first_response": sample[1],
+                               "error": str(sample[2]) if sample[2] else None} for sample in samples]
+                       for kind, samples in results.items()}, f, indent=2)
+
+    replay_handler.close()
+    if args.keep_db:
+        print(f"Replayed database kept at {replay_db}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from replay_trace import StandInChannel, StandInContext, StandInMember, percentile
+
+# Runs days of simulated waiver activity against a copy of waiverbot.db on a manually stepped clock, so a full
+# announce -> claim -> clear cycle takes seconds instead of a day. Rookie Mentors enter players, GMs claim and adjust
+# their claims, and the bot's own announcement and clearing loops run on the clock as they would in production.
+# Run it from the bot directory (it imports WaiverBotv3, which reads config.json), e.g.
+#   python simulate.py --db waiverbot.db --days 7
+
+
+def build_events(rng, start, days, players_per_day, claims_per_player, adjusts_per_day):
+    # (time, kind) for every command, in time order. Players are entered during the working day; claims and
+    # adjustments arrive around the clock and pick their player when they run.
+    events = []
+    for day in range(days):
+        midnight = start.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=day)
+        for _ in range(players_per_day):
+            events.append((midnight + timedelta(hours=9, seconds=rng.uniform(0, 8 * 3600)), "input"))
+        for _ in range(round(players_per_day * claims_per_player)):
+            events.append((midnight + timedelta(seconds=rng.uniform(0, 24 * 3600)), "claim"))
+        for _ in range(adjusts_per_day):
+            events.append((midnight + timedelta(seconds=rng.uniform(0, 24 * 3600)), "adjustclaims"))
+    return sorted(event for event in events if event[0] >= start)
+
+
+async def simulate(events, end, rng, quick_share):
+    import WaiverBotv3
+    import clock
+    import queries
+
+    channel = StandInChannel(0)
+    WaiverBotv3.bot.get_channel = lambda channel_id: channel
+    rookie_mentor = StandInMember("sim_rm", [WaiverBotv3.ROLES_DICT["Rookie Mentor"]])
+    results = {}
+    passes = {"announcement": 0, "clearing": 0}
+
+    # Count the scheduled passes the loops make
+    run_announcement_pass = WaiverBotv3.run_announcement_pass
+    run_clearing_pass = WaiverBotv3.run_clearing_pass
+
+    async def counted_announcement_pass():
+        passes["announcement"] += 1
+        await run_announcement_pass()
+
+    async def counted_clearing_pass():
+        passes["clearing"] += 1
+        return await run_clearing_pass()
+
+    WaiverBotv3.run_announcement_pass = counted_announcement_pass
+    WaiverBotv3.run_clearing_pass = counted_clearing_pass
+
+    def team_member():
+        code = rng.choice(list(WaiverBotv3.TEAMS_DICT))
+        return code, StandInMember(f"sim_gm_{code}", [WaiverBotv3.TEAMS_DICT[code]])
+
+    def command_for(kind, number):
+        # The command and its arguments, or None when there is nothing to act on yet
+        conn = WaiverBotv3.get_db_connection()
+        if kind == "input":
+            return (WaiverBotv3.input_player, rookie_mentor,
+                    {"name": f"Sim Player {number}", "position": rng.choice(["QB", "RB", "WR", "TE", "OL", "DL"]),
+                     "pageurl": f"https://example.invalid/player/{number}"})
+        if kind == "claim":
+            eligible = queries.fetchall(conn, "eligible_players")
+            if not eligible:
+                return None
+            player = rng.choice(eligible)
+            _, member = team_member()
+            if player["Status"] == "Free Claim":
+                return WaiverBotv3.claim_player, member, {"player_id": player["PlayerID"], "type_of_claim": "Free"}
+            if rng.random() < quick_share:
+                return WaiverBotv3.claim_player, member, {"player_id": player["PlayerID"], "type_of_claim": "Quick"}
+            return WaiverBotv3.claim_player, member, {"player_id": player["PlayerID"], "type_of_claim": "Normal",
+                                                      "claim_order_pref": rng.randint(1, 5)}
+        code, member = team_member()
+        claims = queries.fetchall(conn, "team_claims_for_uncleared_players", (WaiverBotv3.TEAMS_DICT[code],))
+        if not claims:
+            return None
+        claim = rng.choice(claims)
+        if rng.random() < 0.2:
+            return WaiverBotv3.adjust_claims, member, {"playerid": claim["PlayerID"], "action": "withdraw"}
+        return WaiverBotv3.adjust_claims, member, {"playerid": claim["PlayerID"], "action": "adjust",
+                                                  "new_priority": rng.randint(1, len(claims))}
+
+    WaiverBotv3.run_loops_on_clock()
+    WaiverBotv3.announcement_task.start()
+    WaiverBotv3.find_clearing_players.start()
+
+    skipped = 0
+    wall_start = time.perf_counter()
+    for number, (moment, kind) in enumerate(events, start=1):
+        await clock.advance_to(moment)
+        command = command_for(kind, number)
+        if command is None:
+            skipped += 1
+            continue
+        handler, author, arguments = command
+        ctx = StandInContext(author, 0)
+        error = None
+        try:
+            await handler.callback(ctx, **arguments)
+        except Exception as e:
+            error = e
+        results.setdefault(kind, []).append((time.perf_counter() - ctx.started, ctx.first_response, error))
+    await clock.advance_to(end)
+    wall_time = time.perf_counter() - wall_start
+
+    WaiverBotv3.announcement_task.cancel()
+    WaiverBotv3.find_clearing_players.cancel()
+    return results, passes, skipped, wall_time, channel.sent
+
+
+def format_report(results, passes, skipped, wall_time, messages_sent, start, end):
+    import WaiverBotv3
+    import queries
+
+    conn = WaiverBotv3.get_db_connection()
+    statuses = {}
+    for player in queries.fetchall(conn, "all_players"):
+        statuses[player["Status"]] = statuses.get(player["Status"], 0) + 1
+    claims = len(queries.fetchall(conn, "all_claims"))
+    statements = sum(count for _, count, _, _ in queries.timing_report())
+    commands = sum(len(samples) for samples in results.values())
+    simulated = (end - start).total_seconds()
+
+    lines = [
+        f"Simulated {simulated / 86400:.1f} days ({start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}) in {wall_time:.1f}s, "
+        f"{simulated / max(wall_time, 1e-9):,.0f}x real time.",
+        f"{commands} commands ({commands / max(wall_time, 1e-9):,.0f}/s), {skipped} skipped with nothing to act on, "
+        f"{passes['announcement']} announcement and {passes['clearing']} clearing passes, "
+        f"{statements} statements ({statements / max(wall_time, 1e-9):,.0f}/s), {messages_sent} channel messages.",
+        f"Players by status: {', '.join(f'{status} {count}' for status, count in sorted(statuses.items()))}. "
+        f"Claims: {claims}.",
+        "",
+        f"{'command':<16}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}",
+    ]
+    for kind in sorted(results):
+        latencies = [sample[0] * 1000 for sample in results[kind]]
+        errors = sum(1 for sample in results[kind] if sample[2] is not None)
+        lines.append(f"{kind:<16}{len(latencies):>7}{errors:>8}{percentile(latencies, 0.5):>10.2f}"
+                     f"{percentile(latencies, 0.95):>10.2f}{max(latencies):>10.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate waiver activity against a copy of the database on a "
+                                                 "virtual clock.")
+    parser.add_argument('--db', default='waiverbot.db', help="Database to copy before simulating.")
+    parser.add_argument('--backend', choices=['sqlite', 'memory'], default='sqlite',
+                        help="Run against a copy of the database file, or an in-memory copy of it that never "
+                             "touches the disk (no faster, see storage.py).")
+    parser.add_argument('--start', help="Simulated start time (YYYY-MM-DD HH:MM:SS). Defaults to now.")
+    parser.add_argument('--days', type=int, default=7, help="Days of activity to simulate.")
+    parser.add_argument('--players-per-day', type=int, default=8, help="Players entered each day.")
+    parser.add_argument('--claims-per-player', type=float, default=3.0, help="Claims lodged per player entered.")
+    parser.add_argument('--adjusts-per-day', type=int, default=6, help="Claim adjustments each day.")
+    parser.add_argument('--quick-share', type=float, default=0.1, help="Share of claims that are quick claims.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the simulated activity.")
+    parser.add_argument('--keep-db', action='store_true', help="Keep the simulated copy of the database.")
+    parser.add_argument('--json', help="Also write the raw command latencies to this file.")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S') if args.start else datetime.now().replace(microsecond=0)
+    end = start + timedelta(days=args.days)
+    rng = random.Random(args.seed)
+    events = build_events(rng, start, args.days, args.players_per_day, args.claims_per_player, args.adjusts_per_day)
+
+    # Copy the database with the online backup API so a running bot is not disturbed
+    work_dir = tempfile.mkdtemp(prefix="waiverbot-simulate-")
+    simulated_db = os.path.join(work_dir, "waiverbot.db")
+    source = sqlite3.connect(args.db)
+    target = sqlite3.connect(simulated_db)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    import WaiverBotv3
+    import clock
+    clock.configure("manual", start)
+    if args.backend == 'memory':
+        import storage
+        WaiverBotv3.DB_PATH = storage.load(simulated_db)
+    else:
+        WaiverBotv3.DB_PATH = simulated_db
+
+    # Keep the bot's own logging (it is part of the cost) but send it to the work directory. Importing the bot never
+    # opens the production log; only running it does (see setup_logging).
+    simulation_handler = logging.FileHandler(os.path.join(work_dir, "simulation_bot.log"), encoding='utf-8')
+    simulation_handler.setFormatter(WaiverBotv3.log_formatter)
+    WaiverBotv3.logger.addHandler(simulation_handler)
+
+    results, passes, skipped, wall_time, messages_sent = asyncio.run(simulate(events, end, rng, args.quick_share))
+    print(format_report(results, passes, skipped, wall_time, messages_sent, start, end))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({kind: [{"latency": sample[0], "error": str(sample[2]) if sample[2] else None}
+                              for sample in samples] for kind, samples in results.items()}, f, indent=2)
+
+    simulation_handler.close()
+    if args.keep_db:
+        print(f"Simulated database kept at {simulated_db}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import tempfile
+
+import queries
+
+# In-memory storage backend for simulations and load tests: a copy of a database file loaded into SQLite's in-memory
+# VFS (memdb). It is still SQLite running the statements in queries.STATEMENTS, so it can't drift from the file
+# database, and it is not meaningfully faster: simulate.py and replay_trace.py spend their time in Python rather than
+# waiting on the disk, and take about as long on either backend. What it gives is a run that never writes a database
+# file, so nothing is left behind to be mistaken for the real one.
+#
+# A "memory:<name>" path is one database shared by every connection in the process, for as long as load() keeps its
+# connection open. Readers and the writer share it through memdb's locking, with a rollback journal rather than WAL,
+# so a commit waits for open read snapshots to finish instead of running alongside them.
+
+PREFIX = "memory:"
+
+# Path -> the connection keeping that in-memory database alive
+keepers = {}
+
+
+def uri(path, readonly=False):
+    return f"file:/{path[len(PREFIX):]}?vfs=memdb{'&mode=ro' if readonly else ''}"
+
+
+def connect(path, readonly=False):
+    conn = sqlite3.connect(uri(path, readonly), uri=True, timeout=30, cached_statements=queries.STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def load(path, name="memory:waiverbot"):
+    # Copies the database file into a new in-memory database with the online backup API and returns its path, for
+    # DB_PATH. memdb can't open a database whose header says WAL, so the copy goes through a temporary file that is
+    # switched back to a rollback journal first.
+    if name in keepers:
+        keepers.pop(name).close()
+    keeper = connect(name)
+    source = sqlite3.connect(path)
+    with tempfile.TemporaryDirectory(prefix="waiverbot-memory-") as work_dir:
+        staging = sqlite3.connect(os.path.join(work_dir, "staging.db"))
+        try:
+            source.backup(staging)
+            staging.execute("PRAGMA journal_mode=DELETE")
+            staging.backup(keeper)
+        finally:
+            staging.close()
+            source.close()
+    queries.migrate(keeper)
+    keepers[name] = keeper
+    return name
+
+
+queries.BACKENDS[PREFIX] = connect
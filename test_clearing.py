@@ -0,0 +1,94 @@
+import asyncio
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import clock
+import queries
+from test_queries import BASE_SCHEMA
+
+pytest.importorskip("discord")
+
+CLEARING_TIME = datetime(2026, 10, 6, 21, 0, 0)
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    # WaiverBotv3 reads config.json from the working directory when it is imported
+    (tmp_path / "config.json").write_text(json.dumps({"token": "test"}))
+    monkeypatch.chdir(tmp_path)
+    from replay_trace import StandInChannel
+    import WaiverBotv3
+
+    db_path = str(tmp_path / "waiverbot.db")
+    conn = sqlite3.connect(db_path)
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+    queries.migrate(conn)
+    team_ids = list(WaiverBotv3.TEAMS_DICT.values())[:3]
+    with conn:
+        for team_id in team_ids:
+            queries.execute(conn, "insert_team", (f"Team {team_id}", team_id))
+        # Three players clearing at the same time, each claimed by a different team
+        for player_id, team_id in enumerate(team_ids, start=1):
+            conn.execute("INSERT INTO Players (PlayerID, PlayerName, Position, Status, Announced, TimeAnnounced, "
+                         "TimeClearing) VALUES (?, ?, 'QB', 'Available', 'Y', ?, ?)",
+                         (player_id, f"Player {player_id}", (CLEARING_TIME - timedelta(days=1)).isoformat(' '),
+                          CLEARING_TIME.isoformat(' ')))
+            conn.execute("INSERT INTO Claims (PlayerID, TeamID, PlayerName, Time, ClaimType, ClaimOrderPreference) "
+                         "VALUES (?, ?, ?, ?, 'normal', 1)",
+                         (player_id, team_id, f"Player {player_id}", CLEARING_TIME.isoformat(' ')))
+    conn.close()
+
+    monkeypatch.setattr(WaiverBotv3, "DB_PATH", db_path)
+    # Each test runs its own event loop, so it needs a writer of its own
+    monkeypatch.setattr(WaiverBotv3, "write_queue", asyncio.Queue())
+    monkeypatch.setitem(WaiverBotv3.writer_state, "task", None)
+    monkeypatch.setattr(WaiverBotv3.bot, "get_channel", lambda channel_id: StandInChannel(0))
+    clock.configure("manual", CLEARING_TIME - timedelta(minutes=10))
+    yield WaiverBotv3
+    clock.configure("real")
+
+
+def award_times(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT Time FROM PriorityHistory WHERE Reason = 'claim' ORDER BY ChangeID").fetchall()
+    finally:
+        conn.close()
+    return [datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S') for row in rows]
+
+
+def test_awards_come_at_their_simulated_times(bot):
+    async def run():
+        bot.run_loops_on_clock()
+        task = bot.find_clearing_players.start()
+        await clock.settle([task])
+        await clock.advance_to(CLEARING_TIME + timedelta(hours=1))
+        bot.find_clearing_players.cancel()
+
+    asyncio.run(run())
+
+    # The first player clears on the first pass after the clearing time, each of the others 3 seconds after the
+    # award before it
+    times = award_times(bot.DB_PATH)
+    assert len(times) == 3
+    assert CLEARING_TIME <= times[0] <= CLEARING_TIME + timedelta(seconds=bot.CLEARING_PASS_SECONDS)
+    assert [later - earlier for earlier, later in zip(times, times[1:])] == [timedelta(seconds=3)] * 2
+
+
+def test_paused_clearing_awards_nothing(bot):
+    # The paused flag is read from the database, as it is when the other process set it
+    async def run():
+        await bot.set_paused_tasks({"clearing"})
+        bot.run_loops_on_clock()
+        task = bot.find_clearing_players.start()
+        await clock.settle([task])
+        await clock.advance_to(CLEARING_TIME + timedelta(hours=1))
+        bot.find_clearing_players.cancel()
+
+    asyncio.run(run())
+
+    assert award_times(bot.DB_PATH) == []
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import queries
+
+# The original tables as the bot's database has them; everything else comes from queries.MIGRATIONS
+BASE_SCHEMA = [
+    "CREATE TABLE Players (PlayerID INTEGER PRIMARY KEY, PlayerName TEXT, Position TEXT, PageURL TEXT, "
+    "TimeEntered TEXT, Status TEXT, Announced TEXT, TimeAnnounced TEXT, Claimed TEXT, TimeClearing TEXT, Cleared TEXT, "
+    "SuccessfulTeamID TEXT)",
+    "CREATE TABLE Claims (ClaimID INTEGER PRIMARY KEY AUTOINCREMENT, PlayerID INTEGER, TeamID TEXT, PlayerName TEXT, "
+    "Time TEXT, ClaimType TEXT, ClaimOrderPreference INTEGER, Successful TEXT, Unsuccessful TEXT)",
+    "CREATE TABLE Teams (Name TEXT, RoleID TEXT, Priority INTEGER)",
+]
+
+# Statements that read a whole table by design: lists, reports and the in-memory indexes built from them
+FULL_READS = {
+    "all_players", "players_to_announce", "eligible_players", "pending_players", "count_available_players",
+    "indexed_players", "all_claims", "indexed_claims", "uncleared_claims_by_team", "recent_results",
+    "report_team_summary", "report_players", "teams_by_priority", "priority_at_time",
+    "set_priority_history_role",
+}
+
+INDEXED_TABLES = ["Players", "Claims", "Teams", "PriorityHistory"]
+
+
+@pytest.fixture(scope="module")
+def plans():
+    conn = sqlite3.connect(":memory:")
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+    queries.migrate(conn)
+    yield queries.explain_all(conn)
+    conn.close()
+
+
+def test_every_statement_has_a_plan(plans):
+    assert set(plans) == set(queries.STATEMENTS)
+
+
+def test_full_reads_are_statements():
+    assert FULL_READS <= set(queries.STATEMENTS)
+
+
+@pytest.mark.parametrize("name", sorted(set(queries.STATEMENTS) - FULL_READS))
+def test_indexed_statement_does_not_scan(plans, name):
+    scans = [step for step in plans[name]
+             if any(step == f"SCAN {table}" or step.startswith(f"SCAN {table} ") for table in INDEXED_TABLES)]
+    assert not scans, f"{name} scans: {scans}"